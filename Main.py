@@ -635,6 +635,9 @@ class Command:
         to_level,
         anc=None,
         processMultiLevel=False,
+        workers=1,
+        writeLevels=None,
+        useCache=False,
     ):
 
         self.configFilename = configFP
@@ -705,6 +708,16 @@ class Command:
 
         # No GUI used: error message are display in prompt and not in graphical window
         MainConfig.settings["popQuery"] = -1
+        # Worker processes for batches of files; 0 uses every core
+        MainConfig.settings["batchWorkers"] = workers
+        # Multi-level only: a list of intermediate levels to write (e.g. [] for L2 only)
+        #   runs the levels in memory; None writes every level as before
+        if writeLevels is not None:
+            MainConfig.settings["inMemory"] = 1
+            for lvl in ["L1A", "L1AQC", "L1B", "L1BQC"]:
+                MainConfig.settings[f"write{lvl}"] = int(lvl in writeLevels)
+        # Skip outputs that are up to date with their inputs and settings
+        MainConfig.settings["reprocessCache"] = int(useCache)
         MainConfig.saveConfig(MainConfig.fileName)
         print("MainConfig - Config updated with cmd line arguments")
 
@@ -736,8 +749,10 @@ class Command:
                     self.outputDirectory, iFile, calibrationMap, flag_Trios
                 )
             else:
+                # A list of files is run as one batch across the worker processes
+                inFiles = iFile if isinstance(iFile, list) else [iFile]
                 Controller.processFilesMultiLevel(
-                    self.outputDirectory, [iFile], calibrationMap, flag_Trios
+                    self.outputDirectory, inFiles, calibrationMap, flag_Trios
                 )
         else:
             # processSingleLevel is only prepared for a singleton file at a time
@@ -808,6 +823,14 @@ required.add_argument(
     default=None,
     type=str,
 )
+required.add_argument(
+    "-w",
+    action="store",
+    dest="workers",
+    help="Number of worker processes for batch processing, 0 for all cores: -w 4",
+    default=1,
+    type=int,
+)
 required.add_argument(
     "-u",
     action="store",
@@ -858,6 +881,7 @@ ancFile = args.ancFile
 username = args.username
 password = args.password
 multiLevel = args.multiLevel
+workers = args.workers
 
 if __name__ == "__main__":
     # Close splashscreen
@@ -877,7 +901,7 @@ if __name__ == "__main__":
         if not (args.username is None or args.password is None):
             # Only for L2 processing set credentials
             GetAnc.userCreds(username, password)
-        Command(configFilePath, inputFile, multiLevel, outputDirectory, level, ancFile)
+        Command(configFilePath, inputFile, multiLevel, outputDirectory, level, ancFile, workers=workers)
     else:
         os.environ["HYPERINSPACE_CMD"] = "FALSE"
         app = QtWidgets.QApplication(sys.argv)
@@ -15,6 +15,7 @@ from Source.HDFRoot import HDFRoot
 from Source.Utilities import Utilities
 from Source.FieldPhotos import FieldPhotos
 from Source.CalibrationFileReader import CalibrationFileReader
+from Source.DeglitchSweep import DeglitchSweep
 
 class AnomAnalWindow(QtWidgets.QDialog):
 
@@ -46,6 +47,8 @@ class AnomAnalWindow(QtWidgets.QDialog):
             self.params = Utilities.readAnomAnalFile(fp)
         else:
             self.params = {}
+        # Knockout rates of a DeglitchSweep of the loaded file, if any
+        self.sweep = {}
 
         # Initially, set these to generic values in ConfigFile
         for sensor in ["ES","LI","LT"]:
@@ -442,8 +445,10 @@ class AnomAnalWindow(QtWidgets.QDialog):
             print('No file returned')
             return
 
-        root = HDFRoot.readHDF5(inFilePath[0])
-        if root.attributes["PROCESSING_LEVEL"] != "1a":
+        # Only the processing level is needed here; L1AQC processing rereads the file
+        with HDFRoot.readHDF5(inFilePath[0], lazy=True) as root:
+            processingLevel = root.attributes["PROCESSING_LEVEL"]
+        if processingLevel != "1a":
             msg = "This is not a Level 1A file."
             Utilities.errorWindow("File Error", msg)
             print(msg)
@@ -480,6 +485,13 @@ class AnomAnalWindow(QtWidgets.QDialog):
         self.setWindowTitle(self.fileName)
         self.root = root # Undeglitched L1AQC
 
+        sweepPath = DeglitchSweep.filePath(inFilePath[0])
+        if os.path.exists(sweepPath):
+            print(f'{os.path.basename(sweepPath)} found. Loading swept knockout rates.')
+            self.sweep = DeglitchSweep.read(sweepPath)
+        else:
+            self.sweep = {}
+
         # If a parameterization has been saved in the AnomAnalFile, set the properties in the local object
         # for all sensors
         if self.fileName in self.params.keys():
@@ -770,57 +782,68 @@ class AnomAnalWindow(QtWidgets.QDialog):
             self.realTimePlot(self, radiometry1D, lightDateTime, sensorType, lightDark)
 
         # Now run the deglitcher for all wavebands light and dark to calculate the % loss to the data from this sensor
+        #   unless the parameters were swept (DeglitchSweep)
         # Darks
-        columns = darkData.columns
-        globalBadIndex = []
-        for dark1D in columns.items():
-            band = float(dark1D[0])
-            if band > self.minBand and band < self.maxBand:
-                radiometry1D = dark1D[1]
-                window = int(self.WindowDarkLineEdit.text())
-                sigma = float(self.SigmaDarkLineEdit.text())
-                minDark = None if self.MinDarkLineEdit.text()=='None' else float(self.MinDarkLineEdit.text())
-                maxDark = None if self.MaxDarkLineEdit.text()=='None' else float(self.MaxDarkLineEdit.text())
-                MinMaxDarkBand = getattr(self,f'{self.sensor}MinMaxBandDark')
-                lightDark = 'Dark'
-                badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, window, sigma, lightDark, minDark, maxDark,MinMaxDarkBand)
-                globalBadIndex.append(badIndex)
-                globalBadIndex.append(badIndex2)
-                globalBadIndex.append(badIndex3)
-
-        # Collapse the badIndexes from all wavebands into one timeseries
-        # Must be done seperately for dark and light as they are different length time series
-        # Convert to an array and test along the columns (i.e. each timestamp)
-        gIndex = np.any(np.array(globalBadIndex), 0)
-        percentLoss = 100*(sum(gIndex)/len(gIndex))
-        pLabel = f'Data reduced by {sum(gIndex)} ({percentLoss:.1f}%)'
+        window = int(self.WindowDarkLineEdit.text())
+        sigma = float(self.SigmaDarkLineEdit.text())
+        minDark = None if self.MinDarkLineEdit.text()=='None' else float(self.MinDarkLineEdit.text())
+        maxDark = None if self.MaxDarkLineEdit.text()=='None' else float(self.MaxDarkLineEdit.text())
+        MinMaxDarkBand = getattr(self,f'{self.sensor}MinMaxBandDark')
+        row = DeglitchSweep.lookup(self.sweep, sensorType, 'Dark', window, sigma, minDark, maxDark, MinMaxDarkBand)
+        if row is not None and row['nRecords'] == len(darkData.data):
+            nBad, nRecords = round(row['records']*row['nRecords']), row['nRecords']
+        else:
+            columns = darkData.columns
+            globalBadIndex = []
+            for dark1D in columns.items():
+                band = float(dark1D[0])
+                if band > self.minBand and band < self.maxBand:
+                    radiometry1D = dark1D[1]
+                    lightDark = 'Dark'
+                    badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, window, sigma, lightDark, minDark, maxDark,MinMaxDarkBand)
+                    globalBadIndex.append(badIndex)
+                    globalBadIndex.append(badIndex2)
+                    globalBadIndex.append(badIndex3)
+
+            # Collapse the badIndexes from all wavebands into one timeseries
+            # Must be done seperately for dark and light as they are different length time series
+            # Convert to an array and test along the columns (i.e. each timestamp)
+            gIndex = np.any(np.array(globalBadIndex), 0)
+            nBad, nRecords = sum(gIndex), len(gIndex)
+        percentLoss = 100*(nBad/nRecords)
+        pLabel = f'Data reduced by {nBad} ({percentLoss:.1f}%)'
         print(pLabel)
         # self.plotWidgetLight.TextItem(pLabel,anchor=(0.2,0.2))
         self.pLossDarkLineEdit.setText(f'{percentLoss:.1f}')
 
         # Lights
-        columns = lightData.columns
-        globalBadIndex = []
-        for light1D in columns.items():
-            band = float(light1D[0])
-            if band > self.minBand and band < self.maxBand:
-                radiometry1D = light1D[1]
-                window = int(self.WindowLightLineEdit.text())
-                sigma = float(self.SigmaLightLineEdit.text())
-                minLight = None if self.MinLightLineEdit.text()=='None' else float(self.MinLightLineEdit.text())
-                maxLight = None if self.MaxLightLineEdit.text()=='None' else float(self.MaxLightLineEdit.text())
-                MinMaxLightBand = getattr(self,f'{self.sensor}MinMaxBandLight')
-                lightDark = 'Light'
-                badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, window, sigma, lightDark, minLight, maxLight,MinMaxLightBand)
-                globalBadIndex.append(badIndex)
-                globalBadIndex.append(badIndex2)
-                globalBadIndex.append(badIndex3)
-
-        # Collapse the badIndexes from all wavebands into one timeseries
-        # Convert to an array and test along the columns (i.e. each timestamp)
-        gIndex = np.any(np.array(globalBadIndex), 0)
-        percentLoss = 100*(sum(gIndex)/len(gIndex))
-        pLabel = f'Data reduced by {sum(gIndex)} ({percentLoss:.1f}%)'
+        window = int(self.WindowLightLineEdit.text())
+        sigma = float(self.SigmaLightLineEdit.text())
+        minLight = None if self.MinLightLineEdit.text()=='None' else float(self.MinLightLineEdit.text())
+        maxLight = None if self.MaxLightLineEdit.text()=='None' else float(self.MaxLightLineEdit.text())
+        MinMaxLightBand = getattr(self,f'{self.sensor}MinMaxBandLight')
+        row = DeglitchSweep.lookup(self.sweep, sensorType, 'Light', window, sigma, minLight, maxLight, MinMaxLightBand)
+        if row is not None and row['nRecords'] == len(lightData.data):
+            nBad, nRecords = round(row['records']*row['nRecords']), row['nRecords']
+        else:
+            columns = lightData.columns
+            globalBadIndex = []
+            for light1D in columns.items():
+                band = float(light1D[0])
+                if band > self.minBand and band < self.maxBand:
+                    radiometry1D = light1D[1]
+                    lightDark = 'Light'
+                    badIndex, badIndex2, badIndex3 = Utilities.deglitchBand(band,radiometry1D, window, sigma, lightDark, minLight, maxLight,MinMaxLightBand)
+                    globalBadIndex.append(badIndex)
+                    globalBadIndex.append(badIndex2)
+                    globalBadIndex.append(badIndex3)
+
+            # Collapse the badIndexes from all wavebands into one timeseries
+            # Convert to an array and test along the columns (i.e. each timestamp)
+            gIndex = np.any(np.array(globalBadIndex), 0)
+            nBad, nRecords = sum(gIndex), len(gIndex)
+        percentLoss = 100*(nBad/nRecords)
+        pLabel = f'Data reduced by {nBad} ({percentLoss:.1f}%)'
         print(pLabel)
         self.pLossLightLineEdit.setText(f'{percentLoss:.1f}')
 
@@ -1016,8 +1039,8 @@ class AnomAnalWindow(QtWidgets.QDialog):
 
         # Jumpstart the logger:
         msg = "Process Single Level from Anomaly Analysis"
-        os.environ["LOGFILE"] = (fileBaseName + '_L1A_L1AQC.log')
-        Utilities.writeLogFile(msg,mode='w') # <<---- Logging initiated here
+        Utilities.openLog(fileBaseName + '_L1A_L1AQC.log')
+        Utilities.writeLogFile(msg) # <<---- Logging initiated here
 
         calFolder = os.path.splitext(ConfigFile.filename)[0] + "_Calibration"
         calPath = os.path.join(PATH_TO_CONFIG, calFolder)
@@ -1033,6 +1056,7 @@ class AnomAnalWindow(QtWidgets.QDialog):
 
         if root is None and ConfigFile.settings["bL2WriteReport"] == 1:
             Controller.writeReport(fileBaseName, pathOut, outFilePath, 'L1AQC', inFilePath)
+        Utilities.closeLog()
         print('Process L1AQC complete')
 
     def closeButtonPressed(self):
@@ -5,10 +5,24 @@ import binascii
 import os
 import sys
 
+import numpy as np
+
 from Source.CalibrationData import CalibrationData
 from Source.Utilities import Utilities
 
 
+# Instruments that append DATETAG (3 bytes) and TIMETAG2 (4 bytes) to each frame
+#       apparently SATMSG does not .... comes out jibberish
+#       $GPGGA also does not work and timetags will be added later from NMEA strings
+TIMETAG_INSTRUMENTS = ("SATHED", "SATHLD", "SATHSE", "SATHSL", "SATPYR", "SATNAV",
+                       "$GPRMC", "SATTHS", "UMTWR")
+
+# Binary data types that numpy can decode directly: {dataType: (byte order, kind)}
+# BF/BD are unpacked with native byte order by CalibrationData.convertRaw.
+BINARY_TYPES = {"BU": (">", "u"), "BULE": ("<", "u"), "BS": (">", "i"), "BSLE": ("<", "i"),
+                "BF": ("=", "f"), "BD": ("=", "f")}
+
+
 class CalibrationFile:
     '''CalibrationFile class stores information about an instrument
         obtained from reading a calibration file'''
@@ -24,6 +38,11 @@ class CalibrationFile:
         self.frameType = ""
         self.sensorType = ""
 
+        # Compiled fixed-length frame layout (see compileFrame)
+        self.frameDtype = None
+        self.frameLength = 0
+        self.frameFields = []
+
 
     def printd(self):
         if len(self.id) != 0:
@@ -210,19 +229,8 @@ class CalibrationFile:
 
 
         # Some instruments produce additional bytes for
-        # DATETAG (3 bytes), and TIMETAG2 (4 bytes)        
-        #       apparently SATMSG does not .... comes out jibberish
-        #       $GPGGA also does not work and timetags will be added later from NMEA strings 
-        if instrumentId.startswith("SATHED") or \
-            instrumentId.startswith("SATHLD") or \
-            instrumentId.startswith("SATHSE") or \
-            instrumentId.startswith("SATHSL") or \
-            instrumentId.startswith("SATPYR") or \
-            instrumentId.startswith("SATNAV") or \
-            instrumentId.startswith("$GPRMC") or \
-            instrumentId.startswith("SATTHS") or \
-            instrumentId.startswith("UMTWR"):
-            #    instrumentId.startswith("SATMSG") or \
+        # DATETAG (3 bytes), and TIMETAG2 (4 bytes)
+        if instrumentId.startswith(TIMETAG_INSTRUMENTS):
             #print("not gps")
             # Read DATETAG
             b = msg[nRead:nRead+3]
@@ -250,3 +258,116 @@ class CalibrationFile:
             ds1.appendColumn("NONE", v)
 
         return nRead
+
+
+    # Compiles a frame layout in which every field has a fixed length into a
+    # numpy structured dtype, so that many frames can be decoded with a single
+    # np.frombuffer (see convertRawFrames). Binary numbers are read at their
+    # offsets; ASCII and other fields are still converted one frame at a time by
+    # CalibrationData.convertRaw in convertFrameFields.
+    # Returns False (and leaves frameDtype as None) for variable-length frames.
+    def compileFrame(self):
+        self.frameDtype = None
+        self.frameLength = 0
+        self.frameFields = []
+
+        names = []
+        formats = []
+        offsets = []
+        stored = set()
+        instrumentId = ""
+        nRead = 0
+        for i, cd in enumerate(self.data):
+            if cd.fieldLength == -1:
+                return False
+
+            fitType = cd.fitType.upper()
+            cdtype = cd.type.upper()
+            if cdtype in ("INSTRUMENT", "VLF_INSTRUMENT"):
+                instrumentId = cd.id
+            isStored = fitType not in ("NONE", "DELIMITER") and \
+                cdtype not in ('INSTRUMENT', 'VLF_INSTRUMENT', 'SN', 'VLF_SN')
+            if isStored:
+                # Values of repeated columns are interleaved frame by frame
+                if (cd.type, cd.id) in stored:
+                    return False
+                stored.add((cd.type, cd.id))
+
+            dataType = cd.dataType.upper()
+            if fitType == "DELIMITER" or cd.fieldLength == 0:
+                kind = "zero"
+            elif dataType in BINARY_TYPES and \
+                    cd.fieldLength in ((4, 8) if dataType in ("BF", "BD") else (1, 2, 4, 8)):
+                kind = "binary"
+                (order, code) = BINARY_TYPES[dataType]
+                names.append(f"f{i}")
+                formats.append(f"{order}{code}{cd.fieldLength}")
+                offsets.append(nRead)
+            else:
+                kind = "frame"
+            self.frameFields.append((kind, isStored, nRead))
+            nRead += cd.fieldLength
+
+        if instrumentId.startswith(TIMETAG_INSTRUMENTS):
+            names.extend(["DATETAG", "TIMETAG2"])
+            formats.extend([("u1", (3,)), ">u4"])
+            offsets.extend([nRead, nRead+3])
+            nRead += 7
+
+        if nRead == 0:
+            self.frameFields = []
+            return False
+
+        self.frameDtype = np.dtype({"names": names, "formats": formats,
+                                    "offsets": offsets, "itemsize": nRead})
+        self.frameLength = nRead
+        return True
+
+    # Converts the fields of one fixed-length frame that numpy cannot decode
+    # (ASCII numbers, strings, odd-sized integers). Raises on bad data exactly
+    # as convertRaw would, so the caller can fall back to convertRaw.
+    def convertFrameFields(self, msg):
+        values = []
+        for cd, (kind, _, offset) in zip(self.data, self.frameFields):
+            if kind == "frame":
+                values.append(cd.convertRaw(msg[offset:offset+cd.fieldLength]))
+        return values
+
+    # Decodes a batch of fixed-length frames (raw bytes of frameLength each, with
+    # the values returned by convertFrameFields for each) and appends them to the
+    # hdf group datasets, in the same order convertRaw would for each frame.
+    def convertRawFrames(self, frames, frameValues, gp):
+        raw = np.frombuffer(b"".join(frames), dtype=self.frameDtype)
+        nFrames = raw.shape[0]
+
+        iValue = 0
+        for i, (cd, (kind, isStored, _)) in enumerate(zip(self.data, self.frameFields)):
+            if kind == "frame":
+                column = [values[iValue] for values in frameValues]
+                iValue += 1
+            elif kind == "binary":
+                column = raw[f"f{i}"].tolist()
+            else:
+                column = [0]*nFrames
+
+            cdtype = cd.type.upper()
+            if isStored:
+                ds = gp.getDataset(cd.type)
+                if ds is None:
+                    ds = gp.addDataset(cd.type)
+                ds.extendColumn(cd.id, column)
+            elif cd.fitType.upper() not in ("NONE", "DELIMITER"):
+                gp.attributes[cdtype] = cd.id
+
+            if cd.fitType.upper() == "NONE":
+                if cdtype == "SN" or cdtype == "DATARATE" or cdtype == "RATE":
+                    gp.attributes[cdtype] = cd.id
+
+        if "DATETAG" in raw.dtype.names:
+            dateTag = raw["DATETAG"].astype(np.int64)
+            dateTag = (dateTag[:, 0] << 16) | (dateTag[:, 1] << 8) | dateTag[:, 2]
+            for name, column in (("DATETAG", dateTag), ("TIMETAG2", raw["TIMETAG2"])):
+                ds1 = gp.getDataset(name)
+                if ds1 is None:
+                    ds1 = gp.addDataset(name)
+                ds1.extendColumn("NONE", column.tolist())
@@ -0,0 +1,126 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+from Source import PATH_TO_DATA
+from Source.HDFDataset import ColumnFacade
+from Source.HDFGroup import HDFGroup
+from Source.MainConfig import MainConfig
+
+
+class CharFileCache:
+    ''' Parsed characterization files (Utilities.read_char and read_unc) kept on disk.
+
+    Class-based and FRM characterization files never change once written, but parsing them
+    value by value is repeated for every file processed. Each file is parsed once into an
+    empty HDFGroup, which is stored as .npz (float columns as one array per dataset,
+    attributes and any text columns in a JSON manifest) under MainConfig.settings["charCacheDir"]
+    (Data/CharCache by default), keyed by path, size and modification time. A changed file
+    gets a new key and is parsed again; MainConfig.settings["charFileCache"] = 0 turns the
+    cache off. '''
+
+    # Bump when read_char/read_unc change what they produce
+    VERSION = 1
+
+    @staticmethod
+    def isEnabled():
+        return int(MainConfig.settings.get("charFileCache", 1)) == 1
+
+    @staticmethod
+    def cacheDir():
+        cacheDir = MainConfig.settings.get("charCacheDir") or os.path.join(PATH_TO_DATA, 'CharCache')
+        os.makedirs(cacheDir, exist_ok=True)
+        return cacheDir
+
+    @staticmethod
+    def filePath(filepath, reader):
+        stat = os.stat(filepath)
+        key = [os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns, reader, CharFileCache.VERSION]
+        sha = hashlib.sha256(json.dumps(key).encode())
+        return os.path.join(CharFileCache.cacheDir(), sha.hexdigest() + '.npz')
+
+    @staticmethod
+    def read(filepath, gp, parser):
+        ''' Adds the content of filepath to the HDFGroup gp as parser(filepath, gp) would '''
+        if not CharFileCache.isEnabled():
+            return parser(filepath, gp)
+
+        fp = CharFileCache.filePath(filepath, parser.__name__)
+        group = CharFileCache.load(fp)
+        if group is None:
+            group = HDFGroup()
+            try:
+                parser(filepath, group)
+            except Exception:
+                # Depends on what gp already holds (e.g. the file type of an earlier file)
+                return parser(filepath, gp)
+            try:
+                CharFileCache.save(fp, group)
+            except OSError as err:
+                print(f'CharFileCache: unable to write {fp}: {err}')
+
+        # Dataset names are resolved against the datasets already in gp; parse in place as before
+        if any(name in gp.datasets for name in group.datasets):
+            return parser(filepath, gp)
+
+        for k, v in group.attributes.items():
+            if isinstance(v, list) and isinstance(gp.attributes.get(k), list):
+                gp.attributes[k].extend(v)
+            else:
+                gp.attributes[k] = v
+        for name, ds in group.datasets.items():
+            gp.datasets[name] = ds
+        return None
+
+    @staticmethod
+    def save(fp, group):
+        arrays = {}
+        manifest = {'attributes': group.attributes, 'datasets': []}
+        for i, ds in enumerate(group.datasets.values()):
+            entry = {'id': ds.id, 'attributes': ds.attributes, 'columns': [], 'data': ds.data is not None}
+            floatColumns = []
+            for name, column in ds.columns.items():
+                # Float columns as one array, anything else (header text) as it was read
+                if all(type(x) is float for x in column):
+                    floatColumns.append(column)
+                    entry['columns'].append([name, len(column)])
+                else:
+                    entry['columns'].append([name, column])
+            arrays[f'columns_{i}'] = np.concatenate([np.asarray(c, dtype=np.float64) for c in floatColumns]) \
+                if floatColumns else np.zeros(0)
+            manifest['datasets'].append(entry)
+        arrays['manifest'] = np.array(json.dumps(manifest))
+
+        # Write then rename, so parallel batch workers never read a partial file
+        fd, tmpPath = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(fp))
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmpPath, fp)
+
+    @staticmethod
+    def load(fp):
+        try:
+            with np.load(fp) as f:
+                manifest = json.loads(str(f['manifest']))
+                group = HDFGroup()
+                group.attributes.update(manifest['attributes'])
+                for i, entry in enumerate(manifest['datasets']):
+                    ds = group.addDataset(entry['id'])
+                    ds.attributes.update(entry['attributes'])
+                    ds.columns = ColumnFacade()
+                    values = f[f'columns_{i}']
+                    start = 0
+                    for name, column in entry['columns']:
+                        if isinstance(column, int):
+                            ds.columns[name] = values[start:start + column]
+                            start += column
+                        else:
+                            ds.columns[name] = column
+                    # The parser converts a data block to the dataset once its end is reached
+                    if entry['data']:
+                        ds.columnsToDataset()
+        except (OSError, KeyError, ValueError):
+            return None
+        return group
@@ -104,6 +104,15 @@ class ConfigFile:
         ConfigFile.settings['RadCalDir'] = os.getcwd()
         ConfigFile.settings['FidRadDB'] = 0
 
+        # Py6S (FRM and class-based direct/diffuse irradiance): cache runs at quantized inputs
+        ConfigFile.settings["bL1bPy6SCache"] = 0
+        ConfigFile.settings["fL1bPy6SCacheSZA"] = 0.1 # degrees
+        ConfigFile.settings["fL1bPy6SCacheAzimuth"] = 1.0 # degrees, solar and relative azimuth
+        ConfigFile.settings["fL1bPy6SCacheAOD"] = 0.005
+        # ... or interpolate a precomputed table (see Py6SLUT, Source/WritePy6SLUT.py); empty for Data/Py6S_LUT.hdf
+        ConfigFile.settings["bL1bPy6SLUT"] = 0
+        ConfigFile.settings["Py6SLUTFile"] = ""
+
         ConfigFile.settings["fL1bInterpInterval"] = 3.3 #3.3 is nominal HyperOCR; Brewin 2016 uses 3.5 nm
         ConfigFile.settings["bL1bPlotTimeInterp"] = 0
         ConfigFile.settings["fL1bPlotInterval"] = 20 # nm
@@ -192,6 +201,16 @@ class ConfigFile:
         ConfigFile.products["bL2ProdbbpQaa"] = 0
         ConfigFile.products["bL2ProdcQaa"] = 0
 
+        # Solar geometry from GPS/ancillary positions (L1AQC, L1B)
+        ConfigFile.settings["SolarEphemeris"] = "numpy" # numpy, pysolar
+
+        # HDF5 output files (all levels)
+        ConfigFile.settings["HDFCompression"] = "none" # none, gzip, lzf
+        ConfigFile.settings["fHDFCompressionLevel"] = 4 # gzip only: 0-9
+        ConfigFile.settings["bHDFShuffle"] = 0
+        ConfigFile.settings["fHDFChunkRows"] = 0 # 0: automatic when compressed
+        ConfigFile.settings["bHDFFloat32"] = 0 # Store radiometric bands as float32
+
         ConfigFile.settings["seaBASSHeaderFileName"] = os.path.splitext(fileName)[0] + ".hdr" #
         ConfigFile.settings["bL2SaveSeaBASS"] = 1
         ConfigFile.settings["bL2WriteReport"] = 1
@@ -201,6 +220,19 @@ class ConfigFile:
             ConfigFile.saveConfig(fileName)
 
 
+    # Returns the keyword options for HDFRoot.writeHDF5 from the HDF5 output settings
+    @staticmethod
+    def getHDFWriteOptions():
+        compression = str(ConfigFile.settings.get("HDFCompression", "none")).lower()
+        if compression not in ("gzip", "lzf"):
+            compression = None
+        return {"chunks": int(ConfigFile.settings.get("fHDFChunkRows", 0)),
+                "compression": compression,
+                "compressionLevel": ConfigFile.settings.get("fHDFCompressionLevel", 4),
+                "shuffle": bool(ConfigFile.settings.get("bHDFShuffle", 0)),
+                "float32": bool(ConfigFile.settings.get("bHDFFloat32", 0))}
+
+
     # Saves the cfg file
     @staticmethod
     def saveConfig(filename):
@@ -2,6 +2,8 @@
 import os
 import datetime
 import collections
+import traceback
+import concurrent.futures
 import numpy as np
 
 from Source import PATH_TO_CONFIG
@@ -19,7 +21,10 @@ from Source.TriosL1B import TriosL1B
 from Source.ProcessL1bqc import ProcessL1bqc
 from Source.ProcessL2 import ProcessL2
 from Source.SeaBASSWriter import SeaBASSWriter
+from Source.SeaBASSHeader import SeaBASSHeader
 from Source.PDFreport import PDF
+from Source.PlotRenderer import PlotRenderer
+from Source.ReprocessCache import ReprocessCache
 from Source.Utilities import Utilities
 
 
@@ -31,6 +36,9 @@ class Controller:
     @staticmethod
     def writeReport(fileName, pathOut, outFilePath, level, inFilePath):
         print('Writing PDF Report...')
+        # The report reads the log files and plots, so write out the buffered job log and pending plots first
+        Utilities.flushLog()
+        PlotRenderer.wait()
         numLevelDict = {'L1A':1,'L1AQC':2,'L1B':3,'L1BQC':4,'L2':5}
         numLevel = numLevelDict[level]
 
@@ -41,7 +49,8 @@ class Controller:
         #   from the attributes up to that level, then use the ConfigFile.settings for the current level parameters.
         try:
             # Processing successful at this level
-            root = HDFRoot.readHDF5(outFilePath)
+            # Only attributes are needed for the report, so skip reading the data
+            root = HDFRoot.readHDF5(outFilePath, lazy=True)
             fail = 0
             root.attributes['Fail'] = 0
         except Exception:
@@ -52,7 +61,7 @@ class Controller:
                 try:
                     # Processing successful at the next lower level
                     # Shift from the output to the input directory
-                    root = HDFRoot.readHDF5(inFilePath)
+                    root = HDFRoot.readHDF5(inFilePath, lazy=True)
                 except Exception:
                     msg = "Controller.writeReport: Unable to open HDF file. May be open in another application."
                     # if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
@@ -132,6 +141,8 @@ class Controller:
             if os.path.isfile(inLog):
                 pdf.print_chapter('L2', 'Process L1BQC to L2', inLog, inPlotPath, fileName, root)
 
+        root.close()
+
         try:
             pdf.output(outPDF, 'F')
         except Exception:
@@ -268,7 +279,7 @@ class Controller:
 
     @staticmethod
     # def processL1a(inFilePath, outFilePath, calibrationMap):
-    def processL1a(inFilePath, outFilePath, calibrationMap,flag_Trios):
+    def processL1a(inFilePath, outFilePath, calibrationMap,flag_Trios, writeOutput=True):
         root = None
 
         test = Utilities.checkInputFiles(inFilePath,flag_Trios, level="L1A")
@@ -286,12 +297,12 @@ class Controller:
             root = ProcessL1a.processL1a(inFilePath, calibrationMap)
             outFFPs = None
 
-        # Write output file
+        # Write output file, unless it is only handed on in memory
         # TriOS L1A are written out in TriosL1A.py
         if not flag_Trios:
-            if root is not None:
+            if root is not None and writeOutput:
                 try:
-                    root.writeHDF5(outFilePath)
+                    root.writeHDF5(outFilePath, **ConfigFile.getHDFWriteOptions())
                 except Exception:
                     msg = 'Unable to write L1A file. It may be open in another program.'
                     # if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
@@ -299,7 +310,7 @@ class Controller:
                     print(msg)
                     Utilities.writeLogFile(msg)
                     return None, None
-            else:
+            elif root is None:
                 msg = "L1a processing failed. Nothing to output."
                 if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
                     Utilities.errorWindow("File Error", msg)
@@ -310,16 +321,18 @@ class Controller:
         return root, outFFPs
 
     @staticmethod
-    def processL1aqc(inFilePath, outFilePath, calibrationMap, ancillaryData,flag_Trios):
-        root = None
-        test = Utilities.checkInputFiles(inFilePath,flag_Trios)
-        if test is False:
-            return None
+    def processL1aqc(inFilePath, outFilePath, calibrationMap, ancillaryData,flag_Trios, inRoot=None, writeOutput=True):
+        root = inRoot
+        if root is None:
+            test = Utilities.checkInputFiles(inFilePath,flag_Trios)
+            if test is False:
+                return None
 
         # Process the data
         print("ProcessL1aqc")
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            if root is None:
+                root = HDFRoot.readHDF5(inFilePath)
         except Exception:
             msg = "Unable to open file. May be open in another application."
             Utilities.errorWindow("File Error", msg)
@@ -331,10 +344,10 @@ class Controller:
         #   regardless of who called this method.  This method will promote them to root.attributes.
         root = ProcessL1aqc.processL1aqc(root, calibrationMap, ancillaryData)
 
-        # Write output file
-        if root is not None:
+        # Write output file, unless it is only handed on in memory
+        if root is not None and writeOutput:
             try:
-                root.writeHDF5(outFilePath)
+                root.writeHDF5(outFilePath, **ConfigFile.getHDFWriteOptions())
             except Exception:
                 msg = "Controller.processL1aqc: Unable to open HDF file. May be open in another application."
                 # if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
@@ -342,7 +355,7 @@ class Controller:
                 print(msg)
                 Utilities.writeLogFile(msg)
                 return None
-        else:
+        elif root is None:
             msg = "L1aqc processing failed. Nothing to output."
             if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
                 Utilities.errorWindow("File Error", msg)
@@ -353,9 +366,9 @@ class Controller:
         return root
 
     @staticmethod
-    def processL1b(inFilePath, outFilePath, flag_Trios):
-        root = None
-        if not os.path.isfile(inFilePath):
+    def processL1b(inFilePath, outFilePath, flag_Trios, inRoot=None, writeOutput=True):
+        root = inRoot
+        if root is None and not os.path.isfile(inFilePath):
             print('No such input file: ' + inFilePath)
             return None
 
@@ -364,7 +377,8 @@ class Controller:
         print(msg)
         Utilities.writeLogFile(msg)
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            if root is None:
+                root = HDFRoot.readHDF5(inFilePath)
         except Exception:
             msg = "Controller.processL1b: Unable to open HDF file. May be open in another application."
             Utilities.errorWindow("File Error", msg)
@@ -380,17 +394,17 @@ class Controller:
             print("ERROR: flag_trios not recognized,", flag_Trios)
             exit()
 
-        # Write output file
-        if root is not None:
+        # Write output file, unless it is only handed on in memory
+        if root is not None and writeOutput:
             try:
-                root.writeHDF5(outFilePath)
+                root.writeHDF5(outFilePath, **ConfigFile.getHDFWriteOptions())
             except Exception:
                 msg = "Controller.ProcessL1b: Unable to write file. May be open in another application."
                 Utilities.errorWindow("File Error", msg)
                 print(msg)
                 Utilities.writeLogFile(msg)
                 return None
-        else:
+        elif root is None:
             msg = "L1b processing failed. Nothing to output."
             if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
                 Utilities.errorWindow("File Error", msg)
@@ -401,17 +415,18 @@ class Controller:
         return root
 
     @staticmethod
-    def processL1bqc(inFilePath, outFilePath):
-        root = None
+    def processL1bqc(inFilePath, outFilePath, inRoot=None, writeOutput=True):
+        root = inRoot
 
-        if not os.path.isfile(inFilePath):
+        if root is None and not os.path.isfile(inFilePath):
             print('No such input file: ' + inFilePath)
             return None
 
         # Process the data
         print("ProcessL1bqc")
         try:
-            root = HDFRoot.readHDF5(inFilePath)
+            if root is None:
+                root = HDFRoot.readHDF5(inFilePath)
         except Exception:
             msg = "Unable to open file. May be open in another application."
             Utilities.errorWindow("File Error", msg)
@@ -422,17 +437,17 @@ class Controller:
         root.attributes['In_Filepath'] = inFilePath
         root = ProcessL1bqc.processL1bqc(root)        
 
-        # Write output file
-        if root is not None:
+        # Write output file, unless it is only handed on in memory
+        if root is not None and writeOutput:
             try:
-                root.writeHDF5(outFilePath)
+                root.writeHDF5(outFilePath, **ConfigFile.getHDFWriteOptions())
             except Exception:
                 msg = "Unable to write file. May be open in another application."
                 Utilities.errorWindow("File Error", msg)
                 print(msg)
                 Utilities.writeLogFile(msg)
                 return None,
-        else:
+        elif root is None:
             msg = "L1bqc processing failed. Nothing to output."
             if MainConfig.settings["popQuery"] == 0 and os.getenv('HYPERINSPACE_CMD') != 'TRUE':
                 Utilities.errorWindow("File Error", msg)
@@ -486,7 +501,7 @@ class Controller:
         # Write output file
         if node is not None:
             try:
-                node.writeHDF5(outFilePath)
+                node.writeHDF5(outFilePath, **ConfigFile.getHDFWriteOptions())
                 return node
             except Exception:
                 msg = "Unable to write file. May be open in another application."
@@ -502,10 +517,50 @@ class Controller:
             Utilities.writeLogFile(msg)
             return None
 
-    # Process every file in a list of files 1 level
+    # Process one file (or the TriOS L1A file list) to one level
     @staticmethod
-    # def processSingleLevel(pathOut, inFilePath, calibrationMap, level, ancFile=None):
     def processSingleLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios):
+        return Controller.processLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios)[0]
+
+    # As processSingleLevel, but returns (success, output root) so multi-level runs can hand the
+    #   root to the next level in memory. With inRoot, inFilePath is not read; it only names the output.
+    #   With writeOutput=False, the output HDF file of L1A-L1BQC is not written.
+    #   With MainConfig "reprocessCache", outputs whose inputs and dependencies are unchanged are skipped.
+    #   A level handed its input in memory is always run: the file at inFilePath may be left over from
+    #   an earlier run (e.g. with write<level> off) and says nothing about the input actually used.
+    @staticmethod
+    def processLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios, inRoot=None, writeOutput=True):
+        cacheKey = None
+        if ReprocessCache.isEnabled() and writeOutput and inRoot is None and \
+                ReprocessCache.applies(inFilePath, level, flag_Trios):
+            cacheKey = ReprocessCache.levelKey(inFilePath, level)
+            if ReprocessCache.isCurrent(pathOut, inFilePath, level, cacheKey):
+                msg = f'{level} up to date, skipping: {ReprocessCache.outputPath(pathOut, inFilePath, level)}'
+                print(msg)
+                return True, None
+        try:
+            success, root = Controller.runSingleLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios, inRoot, writeOutput)
+        finally:
+            # The job log is buffered; write out whatever this level logged
+            Utilities.closeLog()
+        if success and cacheKey is not None:
+            ReprocessCache.record(pathOut, inFilePath, level, cacheKey)
+        return success, root
+
+    # Report the outcome of a level whose output may only exist in memory
+    @staticmethod
+    def checkOutput(outFilePath, root, writeOutput):
+        if writeOutput:
+            Utilities.checkOutputFiles(outFilePath)
+        else:
+            status = 'SUCCESSFUL' if root is not None else 'NOT SUCCESSFUL'
+            msg = f'Process Single Level: {outFilePath} (in memory only) - {status}'
+            print(msg)
+            Utilities.writeLogFile(msg)
+
+    @staticmethod
+    # def processSingleLevel(pathOut, inFilePath, calibrationMap, level, ancFile=None):
+    def runSingleLevel(pathOut, inFilePath, calibrationMap, level, flag_Trios, inRoot=None, writeOutput=True):
         # Find the absolute path to the output directory
         pathOut = os.path.abspath(pathOut)
 
@@ -516,7 +571,7 @@ class Controller:
             msg = "Bad output destination. Select new Output Data Directory."
             print(msg)
             Utilities.writeLogFile(msg)
-            return False
+            return False, None
 
         # Add output level directory if necessary
         if os.path.isdir(pathOutLevel) is False:
@@ -535,20 +590,20 @@ class Controller:
         # Grab input name and extension
         fileName,extension = os.path.splitext(inFileName)
 
-        # Initialize the Utility logger, overwriting it if necessary
+        # Initialize the job logger, overwriting the log file if necessary
         if ConfigFile.settings["bL2Stations"] == 1 and level == 'L2':
-            os.environ["LOGFILE"] = f'Stations_{fileName}_{level}.log'
+            Utilities.openLog(f'Stations_{fileName}_{level}.log')
         else:
-            os.environ["LOGFILE"] = fileName + '_' + level + '.log'
+            Utilities.openLog(fileName + '_' + level + '.log')
         msg = "Process Single Level"
         print(msg)
-        Utilities.writeLogFile(msg,mode='w') # <<---- Logging initiated here
+        Utilities.writeLogFile(msg) # <<---- Logging initiated here
 
         if extension.lower() != '.raw' and extension.lower() != '.mlb' and extension.lower() != '.hdf':
             msg = "Unrecognized file type. Aborting."
             print(msg)
             Utilities.writeLogFile(msg)
-            return False#, None
+            return False, None
 
         # If this is an HDF, assume it is not RAW, drop the level from fileName
         if extension=='.hdf':
@@ -561,10 +616,10 @@ class Controller:
         if level == "L1A" or level == "L1AQC" or level == "L1B" or level == "L1BQC":
 
             if level == "L1A":
-                root, outFFPs = Controller.processL1a(inFilePath, outFilePath, calibrationMap, flag_Trios)
+                root, outFFPs = Controller.processL1a(inFilePath, outFilePath, calibrationMap, flag_Trios, writeOutput)
                 if not flag_Trios:
                     # Checked in TriosL1A for TriOS
-                    Utilities.checkOutputFiles(outFilePath)
+                    Controller.checkOutput(outFilePath, root, writeOutput)
                 else:
                     Controller.trios_L1A_files = outFFPs
 
@@ -615,25 +670,25 @@ class Controller:
                     msg = 'No deglitching will be performed.'
                     print(msg)
                     Utilities.writeLogFile(msg)
-                root = Controller.processL1aqc(inFilePath, outFilePath, calibrationMap, ancillaryData,flag_Trios)
-                Utilities.checkOutputFiles(outFilePath)
+                root = Controller.processL1aqc(inFilePath, outFilePath, calibrationMap, ancillaryData,flag_Trios, inRoot, writeOutput)
+                Controller.checkOutput(outFilePath, root, writeOutput)
 
             elif level == "L1B":
-                root = Controller.processL1b(inFilePath, outFilePath, flag_Trios)
-                Utilities.checkOutputFiles(outFilePath)
+                root = Controller.processL1b(inFilePath, outFilePath, flag_Trios, inRoot, writeOutput)
+                Controller.checkOutput(outFilePath, root, writeOutput)
 
             elif level == "L1BQC":
-                root = Controller.processL1bqc(inFilePath, outFilePath)
-                Utilities.checkOutputFiles(outFilePath)
+                root = Controller.processL1bqc(inFilePath, outFilePath, inRoot, writeOutput)
+                Controller.checkOutput(outFilePath, root, writeOutput)
 
         elif level == "L2":
             # Ancillary data from metadata have been read in at L1C,
             # and will be extracted from the ANCILLARY_METADATA group later
 
             root = None
-            if not os.path.isfile(inFilePath):
+            if inRoot is None and not os.path.isfile(inFilePath):
                 print('No such input file: ' + inFilePath)
-                return False#None, outFilePath
+                return False, None
 
             msg = "ProcessL2: " + inFilePath
             print(msg)
@@ -641,7 +696,12 @@ class Controller:
             try:
                 # root variable is replaced by L2 node unless station extraction, in which case
                 #   it is retained and node is returned from ProcessL2
-                root = HDFRoot.readHDF5(inFilePath)
+                # Datasets are read from file on first use
+                if inRoot is None:
+                    root = HDFRoot.readHDF5(inFilePath, lazy=True)
+                else:
+                    root = inRoot
+                l1bqcRoot = root
                 root.attributes['L1BQC_FILE_NAME'] = inFileName
                 del root.attributes["In_Filepath"]
             except Exception:
@@ -649,132 +709,137 @@ class Controller:
                 Utilities.errorWindow("File Error", msg)
                 print(msg)
                 Utilities.writeLogFile(msg)
-                return False#None, outFilePath
-
-            # Check L2 file for low-level uncertainty processing matching the uncertainty processing
-            # called here (i.e., don't let Factory-Only files get processed for FRM-Class or FRM-Full)
-            if ConfigFile.settings["bL1bCal"] == 3 and 'FRM-Full' not in root.attributes['CAL_TYPE']:
-                msg = f"Low-level processing {root.attributes['CAL_TYPE']} does not match "\
-                    f"uncertainty pathway in configuration. (ConfigFile.settings['bL1bCal'] ==) {ConfigFile.settings['bL1bCal']}."
-                Utilities.errorWindow("File Error", msg)
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-            if ConfigFile.settings["bL1bCal"] == 2 and 'FRM-Class' not in root.attributes['CAL_TYPE']:
-                msg = f"Low-level processing {root.attributes['CAL_TYPE']} does not match "\
-                    f"uncertainty pathway in configuration. (ConfigFile.settings['bL1bCal'] ==) {ConfigFile.settings['bL1bCal']}."
-                Utilities.errorWindow("File Error", msg)
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-            if ConfigFile.settings["bL1bCal"] == 1 and 'Factory' not in root.attributes['CAL_TYPE']:
-                msg = f"Low-level processing {root.attributes['CAL_TYPE']} does not match "\
-                    f"uncertainty pathway in configuration. (ConfigFile.settings['bL1bCal'] ==) {ConfigFile.settings['bL1bCal']}."
-                Utilities.errorWindow("File Error", msg)
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-
-
-            ##### Loop over this whole section for each station in the file where appropriate ####
-            if ConfigFile.settings["bL2Stations"]:
-                ancGroup = root.getGroup("ANCILLARY")
-                for ds in ancGroup.datasets:
-                    try:
-                        ancGroup.datasets[ds].datasetToColumns()
-                    except Exception:
-                        print('Error: Something wrong with root ANCILLARY')
-                stations = np.array(root.getGroup("ANCILLARY").getDataset("STATION").columns["STATION"])
-                stations = np.unique(stations[~np.isnan(stations)]).tolist()
-
-                if len(stations) > 0:
-
-                    for station in stations:
-                        stationStr = str( round(station*100)/100 )
-                        stationStr = stationStr.replace('.','_')
-                        # Current SeaBASS convention experiment_cruise_measurement_datetime_Revision#.sb
-                        # For HDF, leave off measurement; add at SeaBASS writer
-                        outPath, filename = os.path.split(outFilePath)
-                        filename,_ = filename.split('.')
-                        filename = f'{filename}_STATION_{stationStr}.hdf'
-                        outFilePathStation = os.path.join(outPath,filename)
-
-                        msg = f'Processing station: {stationStr}: \n'
-                        print(msg)
-                        Utilities.writeLogFile(msg)
-
-                        # Cannot overwrite root here, in case there is more than one station in the file.
-                        Controller.processL2(root, outFilePathStation,station)
-                        Utilities.checkOutputFiles(outFilePathStation)
-
-                        if os.path.isfile(outFilePathStation):
-                            # Ensure that the L2 on file is recent before continuing with
-                            # SeaBASS files or reports
-                            modTime = os.path.getmtime(outFilePathStation)
-                            nowTime = datetime.datetime.now()
-                            if nowTime.timestamp() - modTime < 60:
-                                msg = f'{level} file produced: \n{outFilePathStation}'
-                                print(msg)
-                                Utilities.writeLogFile(msg)
+                return False, None
 
-                                # Write SeaBASS
-                                if int(ConfigFile.settings["bL2SaveSeaBASS"]) == 1:
-                                    msg = f'Output SeaBASS for HDF: \n{outFilePathStation}'
-                                    print(msg)
-                                    Utilities.writeLogFile(msg)                                    
-                                    sbFileName = SeaBASSWriter.outputTXT_Type2(outFilePathStation)
-
-                                    # If this is being output to SeaBASS later, add a root attribute 
-                                    # with the SeaBASS filename base (i.e., not rrs or es)
-                                    baseName = sbFileName[0:sbFileName.find('L2')-1]
-                                    # Need to reopen the station L2 to update the attribute
-                                    stationRoot = HDFRoot.readHDF5(outFilePathStation)
-                                    stationRoot.attributes['SeaBASS_File_Name_Base'] = baseName
-                                    stationRoot.writeHDF5(outFilePathStation)
-                                # return True
-
-                        # Write L2 report for each station, regardless of pass/fail
-                        if ConfigFile.settings["bL2WriteReport"] == 1:
-                            Controller.writeReport(fileName, pathOut, outFilePathStation, level, inFilePath)
-                else:
-                    msg = f'No stations found in: {fileName}'
+            # The lazily read L1BQC file is closed however L2 ends, so long-lived batch workers
+            #   do not collect open file handles
+            try:
+                # Check L2 file for low-level uncertainty processing matching the uncertainty processing
+                # called here (i.e., don't let Factory-Only files get processed for FRM-Class or FRM-Full)
+                if ConfigFile.settings["bL1bCal"] == 3 and 'FRM-Full' not in root.attributes['CAL_TYPE']:
+                    msg = f"Low-level processing {root.attributes['CAL_TYPE']} does not match "\
+                        f"uncertainty pathway in configuration. (ConfigFile.settings['bL1bCal'] ==) {ConfigFile.settings['bL1bCal']}."
+                    Utilities.errorWindow("File Error", msg)
+                    print(msg)
+                    Utilities.writeLogFile(msg)
+                    return False, None
+                if ConfigFile.settings["bL1bCal"] == 2 and 'FRM-Class' not in root.attributes['CAL_TYPE']:
+                    msg = f"Low-level processing {root.attributes['CAL_TYPE']} does not match "\
+                        f"uncertainty pathway in configuration. (ConfigFile.settings['bL1bCal'] ==) {ConfigFile.settings['bL1bCal']}."
+                    Utilities.errorWindow("File Error", msg)
+                    print(msg)
+                    Utilities.writeLogFile(msg)
+                    return False, None
+                if ConfigFile.settings["bL1bCal"] == 1 and 'Factory' not in root.attributes['CAL_TYPE']:
+                    msg = f"Low-level processing {root.attributes['CAL_TYPE']} does not match "\
+                        f"uncertainty pathway in configuration. (ConfigFile.settings['bL1bCal'] ==) {ConfigFile.settings['bL1bCal']}."
+                    Utilities.errorWindow("File Error", msg)
                     print(msg)
                     Utilities.writeLogFile(msg)
+                    return False, None
+
+
+                ##### Loop over this whole section for each station in the file where appropriate ####
+                if ConfigFile.settings["bL2Stations"]:
+                    ancGroup = root.getGroup("ANCILLARY")
+                    for ds in ancGroup.datasets:
+                        try:
+                            ancGroup.datasets[ds].datasetToColumns()
+                        except Exception:
+                            print('Error: Something wrong with root ANCILLARY')
+                    stations = np.array(root.getGroup("ANCILLARY").getDataset("STATION").columns["STATION"])
+                    stations = np.unique(stations[~np.isnan(stations)]).tolist()
+
+                    if len(stations) > 0:
+
+                        for station in stations:
+                            stationStr = str( round(station*100)/100 )
+                            stationStr = stationStr.replace('.','_')
+                            # Current SeaBASS convention experiment_cruise_measurement_datetime_Revision#.sb
+                            # For HDF, leave off measurement; add at SeaBASS writer
+                            outPath, filename = os.path.split(outFilePath)
+                            filename,_ = filename.split('.')
+                            filename = f'{filename}_STATION_{stationStr}.hdf'
+                            outFilePathStation = os.path.join(outPath,filename)
+
+                            msg = f'Processing station: {stationStr}: \n'
+                            print(msg)
+                            Utilities.writeLogFile(msg)
 
-            else:
-                # Even where not extracting stations, processL2 returns PL2 node, not root, but to comply with expectations
-                # below based on the other levels and PDF reporting, overwrite root with node
-                root = Controller.processL2(root,outFilePath)
-                Utilities.checkOutputFiles(outFilePath)
-
-                if os.path.isfile(outFilePath):
-                    # Ensure that the L2 on file is recent before continuing with
-                    # SeaBASS files or reports
-                    modTime = os.path.getmtime(outFilePath)
-                    nowTime = datetime.datetime.now()
-                    if nowTime.timestamp() - modTime < 60:
-                        msg = f'{level} file produced: \n{outFilePath}'
+                            # Cannot overwrite root here, in case there is more than one station in the file.
+                            Controller.processL2(root, outFilePathStation,station)
+                            Utilities.checkOutputFiles(outFilePathStation)
+
+                            if os.path.isfile(outFilePathStation):
+                                # Ensure that the L2 on file is recent before continuing with
+                                # SeaBASS files or reports
+                                modTime = os.path.getmtime(outFilePathStation)
+                                nowTime = datetime.datetime.now()
+                                if nowTime.timestamp() - modTime < 60:
+                                    msg = f'{level} file produced: \n{outFilePathStation}'
+                                    print(msg)
+                                    Utilities.writeLogFile(msg)
+
+                                    # Write SeaBASS
+                                    if int(ConfigFile.settings["bL2SaveSeaBASS"]) == 1:
+                                        msg = f'Output SeaBASS for HDF: \n{outFilePathStation}'
+                                        print(msg)
+                                        Utilities.writeLogFile(msg)                                    
+                                        sbFileName = SeaBASSWriter.outputTXT_Type2(outFilePathStation)
+
+                                        # If this is being output to SeaBASS later, add a root attribute 
+                                        # with the SeaBASS filename base (i.e., not rrs or es)
+                                        baseName = sbFileName[0:sbFileName.find('L2')-1]
+                                        # Need to reopen the station L2 to update the attribute
+                                        stationRoot = HDFRoot.readHDF5(outFilePathStation)
+                                        stationRoot.attributes['SeaBASS_File_Name_Base'] = baseName
+                                        stationRoot.writeHDF5(outFilePathStation, **ConfigFile.getHDFWriteOptions())
+                                    # return True
+
+                            # Write L2 report for each station, regardless of pass/fail
+                            if ConfigFile.settings["bL2WriteReport"] == 1:
+                                Controller.writeReport(fileName, pathOut, outFilePathStation, level, inFilePath)
+                    else:
+                        msg = f'No stations found in: {fileName}'
                         print(msg)
                         Utilities.writeLogFile(msg)
 
-                        # Write SeaBASS
-                        if int(ConfigFile.settings["bL2SaveSeaBASS"]) == 1:
-                            msg = f'Output SeaBASS for HDF: \n{outFilePath}'
+                else:
+                    # Even where not extracting stations, processL2 returns PL2 node, not root, but to comply with expectations
+                    # below based on the other levels and PDF reporting, overwrite root with node
+                    root = Controller.processL2(root,outFilePath)
+                    Utilities.checkOutputFiles(outFilePath)
+
+                    if os.path.isfile(outFilePath):
+                        # Ensure that the L2 on file is recent before continuing with
+                        # SeaBASS files or reports
+                        modTime = os.path.getmtime(outFilePath)
+                        nowTime = datetime.datetime.now()
+                        if nowTime.timestamp() - modTime < 60:
+                            msg = f'{level} file produced: \n{outFilePath}'
                             print(msg)
                             Utilities.writeLogFile(msg)
-                            sbFileName = SeaBASSWriter.outputTXT_Type2(outFilePath)
 
-                            # If this is being output to SeaBASS later, add a root attribute 
-                            # with the SeaBASS filename base (i.e., not rrs or es)
-                            baseName = sbFileName[0:sbFileName.find('L2')-1]
-                            root.attributes['SeaBASS_File_Name_Base'] = baseName
-                            root.writeHDF5(outFilePath)
+                            # Write SeaBASS
+                            if int(ConfigFile.settings["bL2SaveSeaBASS"]) == 1:
+                                msg = f'Output SeaBASS for HDF: \n{outFilePath}'
+                                print(msg)
+                                Utilities.writeLogFile(msg)
+                                sbFileName = SeaBASSWriter.outputTXT_Type2(outFilePath)
+
+                                # If this is being output to SeaBASS later, add a root attribute 
+                                # with the SeaBASS filename base (i.e., not rrs or es)
+                                baseName = sbFileName[0:sbFileName.find('L2')-1]
+                                root.attributes['SeaBASS_File_Name_Base'] = baseName
+                                root.writeHDF5(outFilePath, **ConfigFile.getHDFWriteOptions())
+            finally:
+                l1bqcRoot.close()
 
         # If the process failed at any level, write a report and return
         if root is None and ConfigFile.settings["bL2Stations"] == 0:
             if ConfigFile.settings["bL2WriteReport"] == 1:
                 Controller.writeReport(fileName, pathOut, outFilePath, level, inFilePath)
-            return False
+            return False, None
 
         # If L2 successful and not station extraction, write a report
         if level == "L2" and ConfigFile.settings["bL2Stations"] == 0:
@@ -785,51 +850,161 @@ class Controller:
         # print(msg)
         # Utilities.writeLogFile(msg)
 
-        return True
+        return True, root
 
 
-    # Process every file in a list of files from L0 to L2
+    # Number of worker processes for batch runs; 0 uses every core
     @staticmethod
-    def processFilesMultiLevel(pathOut,inFiles, calibrationMap, flag_Trios):
-        print("processFilesMultiLevel")
+    def getBatchWorkers(nJobs):
+        workers = int(MainConfig.settings.get("batchWorkers", 1))
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        return max(1, min(workers, nJobs))
 
-        flag_L1 = 0
-        if flag_Trios:
-            if Controller.processSingleLevel(pathOut, inFiles, calibrationMap, 'L1A', flag_Trios):
-                flag_L1 = 1
-                inFiles = Controller.trios_L1A_files
+    # Snapshot of the class-level settings a worker process has to rebuild
+    @staticmethod
+    def getBatchState():
+        return {"configFile": (ConfigFile.filename, dict(ConfigFile.settings), dict(ConfigFile.products)),
+                "mainConfig": (MainConfig.fileName, dict(MainConfig.settings)),
+                "seaBASSHeader": (SeaBASSHeader.filename, dict(SeaBASSHeader.settings)),
+                "environ": {key: os.environ[key] for key in ("HYPERINSPACE_CMD",) if key in os.environ}}
 
-        for fp in inFiles:
-            print("Processing: " + fp)
+    # Process pool initializer; spawned workers start from empty settings
+    @staticmethod
+    def initBatchWorker(state):
+        ConfigFile.filename, settings, products = state["configFile"]
+        ConfigFile.settings = collections.OrderedDict(settings)
+        ConfigFile.products = collections.OrderedDict(products)
+        MainConfig.fileName, settings = state["mainConfig"]
+        MainConfig.settings = collections.OrderedDict(settings)
+        SeaBASSHeader.filename, settings = state["seaBASSHeader"]
+        SeaBASSHeader.settings = collections.OrderedDict(settings)
+        os.environ.update(state["environ"])
+
+    # Run one batch job, isolating failures so one bad file does not stop the batch
+    #   A job is (function name, input file, arguments); returns (input file, status, detail)
+    #   ConfigFile.settings are restored afterwards, so per-file settings (e.g. the deglitching
+    #   parameters of the anomaly analysis file) do not carry over to the next job of the worker
+    @staticmethod
+    def runBatchJob(job):
+        funcName, fp, args = job
+        settings = dict(ConfigFile.settings)
+        try:
+            result = getattr(Controller, funcName)(*args)
+        except Exception:
+            return fp, False, traceback.format_exc().strip().splitlines()[-1]
+        finally:
+            # The job is done once its plots are written
+            PlotRenderer.wait()
+            ConfigFile.settings.clear()
+            ConfigFile.settings.update(settings)
+        if funcName == 'processFileChain':
+            # Multi-level chains report the last level completed
+            if result is None:
+                return fp, False, 'failed at the first level'
+            return fp, result == 'L2', '' if result == 'L2' else f'stopped after {result}'
+        return fp, bool(result), ''
+
+    # Run the batch jobs serially or in a process pool and report an ordered summary
+    @staticmethod
+    def runBatch(jobs, title):
+        workers = Controller.getBatchWorkers(len(jobs))
+        msg = f'{title}: {len(jobs)} job(s) on {workers} worker(s)'
+        print(msg)
+
+        if workers == 1:
+            results = [Controller.runBatchJob(job) for job in jobs]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                    initializer=Controller.initBatchWorker,
+                    initargs=(Controller.getBatchState(),)) as executor:
+                futures = [executor.submit(Controller.runBatchJob, job) for job in jobs]
+                # Collect in submission order regardless of completion order
+                results = []
+                for job, future in zip(jobs, futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as err:
+                        # A worker that dies outright (e.g. out of memory) breaks the pool
+                        results.append((job[1], False, f'worker failed: {type(err).__name__}'))
+
+        Controller.writeBatchSummary(results, title)
+        return results
+
+    @staticmethod
+    def writeBatchSummary(results, title):
+        nOK = sum(1 for result in results if result[1])
+        lines = [f'{title} - {nOK} of {len(results)} succeeded']
+        for fp, status, detail in results:
+            line = f'  {"OK  " if status else "FAIL"} {os.path.basename(fp)}'
+            if detail:
+                line += f' ({detail})'
+            lines.append(line)
+        msg = '\n'.join(lines)
+        print(msg)
+        if os.path.isdir('Logs'):
+            timeStamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+            with open(os.path.join('Logs', f'Batch_{timeStamp}.log'), 'w') as logFile:
+                logFile.write(msg + '\n')
 
-            if not flag_Trios:
-                flag_L1 = 0
-                if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1A', flag_Trios):
-                    flag_L1 = 1
 
-            if flag_L1:
+    # Process one file from startLevel to L2, returning the last level completed
+    #   With MainConfig "inMemory", each level's root is handed to the next without re-reading
+    #   it from disk, and intermediate files are only written for levels flagged "write<level>".
+    @staticmethod
+    def processFileChain(pathOut, fp, calibrationMap, flag_Trios, startLevel='L1A'):
+        inMemory = int(MainConfig.settings.get("inMemory", 0))
+        lastLevel = None
+        root = None
+        if startLevel == 'L1A':
+            writeOutput = not inMemory or int(MainConfig.settings.get("writeL1A", 1))
+            success, root = Controller.processLevel(pathOut, fp, calibrationMap, 'L1A', flag_Trios, writeOutput=writeOutput)
+            if not success:
+                return lastLevel
+            lastLevel = 'L1A'
+
+        inFileName = os.path.split(fp)[1]
+        if flag_Trios:
+            # For TriOS, need to parse the L1A names, not L0
+            fileName = os.path.join('L1A',f'{os.path.splitext(inFileName)[0]}'+'.hdf')
+        else:
+            # Going from L0 to L1A, need to account for the underscore
+            fileName = os.path.join('L1A',f'{os.path.splitext(inFileName)[0]}'+'_L1A.hdf')
+        fp = os.path.join(os.path.abspath(pathOut),fileName)
+
+        for inLevel, level in (('L1A', 'L1AQC'), ('L1AQC', 'L1B'), ('L1B', 'L1BQC'), ('L1BQC', 'L2')):
+            if inLevel != 'L1A':
                 inFileName = os.path.split(fp)[1]
-                if flag_Trios:
-                    # For TriOS, need to parse the L1A names, not L0
-                    fileName = os.path.join('L1A',f'{os.path.splitext(inFileName)[0]}'+'.hdf')
-                else:
-                    # Going from L0 to L1A, need to account for the underscore
-                    fileName = os.path.join('L1A',f'{os.path.splitext(inFileName)[0]}'+'_L1A.hdf')
+                fileName = os.path.join(inLevel,f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+f'_{inLevel}.hdf')
                 fp = os.path.join(os.path.abspath(pathOut),fileName)
-                if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1AQC', flag_Trios):
-
-                    inFileName = os.path.split(fp)[1]
-                    fileName = os.path.join('L1AQC',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1AQC.hdf')
-                    fp = os.path.join(os.path.abspath(pathOut),fileName)
-                    if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1B', flag_Trios):
-                        inFileName = os.path.split(fp)[1]
-                        fileName = os.path.join('L1B',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1B.hdf')
-                        fp = os.path.join(os.path.abspath(pathOut),fileName)
-                        if Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L1BQC', flag_Trios):
-                            inFileName = os.path.split(fp)[1]
-                            fileName = os.path.join('L1BQC',f"{os.path.splitext(inFileName)[0].rsplit('_',1)[0]}"+'_L1BQC.hdf')
-                            fp = os.path.join(os.path.abspath(pathOut),fileName)
-                            Controller.processSingleLevel(pathOut, fp, calibrationMap, 'L2', flag_Trios)
+            # Present the next level with exactly what it would have read back from file
+            inRoot = root.copyInMemory() if inMemory and root is not None else None
+            writeOutput = not inMemory or level == 'L2' or int(MainConfig.settings.get(f"write{level}", 1))
+            success, root = Controller.processLevel(pathOut, fp, calibrationMap, level, flag_Trios, inRoot, writeOutput)
+            if not success:
+                break
+            lastLevel = level
+
+        return lastLevel
+
+
+    # Process every file in a list of files from L0 to L2
+    @staticmethod
+    def processFilesMultiLevel(pathOut,inFiles, calibrationMap, flag_Trios):
+        print("processFilesMultiLevel")
+
+        startLevel = 'L1A'
+        if flag_Trios:
+            # TriOS L1A needs the whole set of raw files at once; fan out the L1A outputs afterwards
+            if not Controller.processSingleLevel(pathOut, inFiles, calibrationMap, 'L1A', flag_Trios):
+                Controller.writeBatchSummary([(fp, False, 'L1A') for fp in inFiles], 'processFilesMultiLevel')
+                print("processFilesMultiLevel - DONE")
+                return
+            inFiles = Controller.trios_L1A_files
+            startLevel = 'L1AQC'
+
+        jobs = [('processFileChain', fp, (pathOut, fp, calibrationMap, flag_Trios, startLevel)) for fp in inFiles]
+        Controller.runBatch(jobs, 'processFilesMultiLevel')
         print("processFilesMultiLevel - DONE")
 
 
@@ -849,41 +1024,28 @@ class Controller:
         elif level == 'L2':
             srchStr = ['L1BQC']
 
+        for fp in inFiles:
+            # Check that the input file matches what is expected for this processing level
+            # Not case sensitive
+            fileName = str.lower(os.path.split(fp)[1])
+
+            if np.sum([fileName.find(str.lower(s)) for s in srchStr] ) < 0 :
+                msg = f'{fileName} does not match expected input level for outputing {level}'
+                print(msg)
+                Utilities.writeLogFile(msg)
+                return #-1
+
         # TriOS raw data have 1 file per instrument. Need to find common identifiers to send
         #   the triplet for processing and end up with 1 L1A HDF file
         #   The way TriosL1A.py is written, it needs the whole list of files, not a single file
-
         if flag_Trios and level == "L1A":
-            for fp in inFiles:
-                # Check that the input file matches what is expected for this processing level
-                # Not case sensitive
-                fileName = str.lower(os.path.split(fp)[1])
-
-                if np.sum([fileName.find(str.lower(s)) for s in srchStr] ) < 0 :
-                    msg = f'{fileName} does not match expected input level for outputing {level}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return #-1
-
             #Pass entire list L0 files
-            # print("Processing: " + fp)
-            Controller.processSingleLevel(pathOut, inFiles, calibrationMap, level, flag_Trios)
+            result = Controller.runBatchJob(('processSingleLevel', inFiles[0], (pathOut, inFiles, calibrationMap, level, flag_Trios)))
+            Controller.writeBatchSummary([result], 'processFilesSingleLevel')
             print("processFilesSingleLevel, all files - DONE")
 
         else:
-            for fp in inFiles:
-                # Check that the input file matches what is expected for this processing level
-                # Not case sensitive
-                fileName = str.lower(os.path.split(fp)[1])
-
-                if np.sum([fileName.find(str.lower(s)) for s in srchStr] ) < 0 :
-                    msg = f'{fileName} does not match expected input level for outputing {level}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    return #-1
-
-                print("Processing: " + fp)
-                # Pass singleton file
-                Controller.processSingleLevel(pathOut, fp, calibrationMap, level, flag_Trios)
-
-                print("processFilesSingleLevel, single file - DONE")
+            # Pass singleton files
+            jobs = [('processSingleLevel', fp, (pathOut, fp, calibrationMap, level, flag_Trios)) for fp in inFiles]
+            Controller.runBatch(jobs, 'processFilesSingleLevel')
+            print("processFilesSingleLevel - DONE")
@@ -0,0 +1,286 @@
+''' Headless sweep of the L1AQC deglitching parameters for the AnomalyDetection tool.
+
+    python -m Source.DeglitchSweep -c sample.cfg -i KORUS_L1A.hdf [-a ancillary.sb]
+        [-s ES LI LT] [--windowDark 5 7 9 ...] [--sigmaDark 2 2.5 3 ...]
+        [--windowLight ...] [--sigmaLight ...] [-w workers]
+
+The L1A file is taken to L1AQC without deglitching, as AnomAnalWindow does, and every window and
+sigma combination of the grids is run on each sensor's darks and lights with the configured
+thresholds. The knockout rates are written next to the L1A file (<name>_deglitchSweep.hdf), where
+AnomAnalWindow picks them up for the percent losses of swept parameters. '''
+import os
+import sys
+import argparse
+import datetime
+import concurrent.futures
+import h5py
+import numpy as np
+
+from Source.ConfigFile import ConfigFile
+from Source.Controller import Controller
+from Source.HDFRoot import HDFRoot
+from Source.MainConfig import MainConfig
+from Source.Utilities import Utilities
+
+
+class DeglitchSweep:
+    ''' Deglitching knockout rates over grids of window sizes and sigmas.
+
+    Layout of the HDF5 file, one group per swept sensor and frame type (e.g. ES_Dark):
+        window, sigma: parameter sets (n)
+        wavelength: deglitched bands (b)
+        pass1, pass2, threshold, band: float32 (n x b) fraction of records flagged in each band by
+            the first pass, the second pass, the thresholds and any of them
+        records: (n) fraction of records removed, i.e. flagged in any band (the Data reduced by % of
+            L1AQC and AnomAnalWindow)
+    Group attributes hold the record count and the thresholds (minRad, maxRad, minMaxBand, threshold)
+    the sweep was run with. '''
+
+    SENSORS = ('ES', 'LI', 'LT')
+    WINDOWS = tuple(range(3, 31+1, 2))
+    SIGMAS = tuple(np.round(np.arange(1.5, 6.0+0.01, 0.25), 2))
+    OUTPUTS = ('pass1', 'pass2', 'threshold', 'band')
+
+    # (band x time) radiometry and thresholds by (sensor, lightDark), set in each worker
+    _data = {}
+
+    @staticmethod
+    def filePath(inFilePath):
+        return os.path.splitext(inFilePath)[0] + '_deglitchSweep.hdf'
+
+    @staticmethod
+    def loadL1AQC(inFilePath, calibrationMap, ancillaryData, flag_Trios=0):
+        ''' L1AQC root of an L1A file without deglitching, or None '''
+        with HDFRoot.readHDF5(inFilePath, lazy=True) as root:
+            processingLevel = root.attributes["PROCESSING_LEVEL"]
+        if processingLevel != "1a":
+            msg = f'DeglitchSweep: {os.path.basename(inFilePath)} is not a Level 1A file.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return None
+
+        temp = ConfigFile.settings['bL1aqcDeglitch']
+        ConfigFile.settings['bL1aqcDeglitch'] = 0
+        try:
+            return Controller.processL1aqc(inFilePath, None, calibrationMap, ancillaryData, flag_Trios,
+                                           writeOutput=False)
+        finally:
+            ConfigFile.settings['bL1aqcDeglitch'] = temp
+
+    @staticmethod
+    def thresholds(sensor, lightDark):
+        ''' (minRad, maxRad, minMaxBand) of ConfigFile.settings, as ProcessL1aqc_deglitch reads them '''
+        minRad = ConfigFile.settings[f'fL1aqc{sensor}Min{lightDark}']
+        maxRad = ConfigFile.settings[f'fL1aqc{sensor}Max{lightDark}']
+        return None if minRad == 'None' else minRad, None if maxRad == 'None' else maxRad, \
+            ConfigFile.settings[f'fL1aqc{sensor}MinMaxBand{lightDark}']
+
+    @staticmethod
+    def extractData(root, sensors=SENSORS):
+        ''' {(sensor, lightDark): (bands, band x time radiometry)} of the deglitched wavebands '''
+        data = {}
+        for gp in root.groups:
+            lightDark = {'ShutterDark': 'Dark', 'ShutterLight': 'Light'}.get(gp.attributes.get("FrameType"))
+            if lightDark is None:
+                continue
+            for sensor in sensors:
+                if sensor in gp.datasets:
+                    ds = gp.getDataset(sensor)
+                    ds.datasetToColumns()
+                    keys = [k for k in ds.columns if ConfigFile.minDeglitchBand < float(k) < ConfigFile.maxDeglitchBand]
+                    radiometry = np.array([np.asarray(ds.columns[k], dtype=np.float64) for k in keys])
+                    data[(sensor, lightDark)] = (np.array([float(k) for k in keys]), radiometry)
+        return data
+
+    @staticmethod
+    def initWorker(state, data):
+        if state is not None:
+            Controller.initBatchWorker(state)
+        DeglitchSweep._data = data
+
+    @staticmethod
+    def runJob(job):
+        ''' Knockout rates of one (sensor, lightDark, window) for all of its sigmas '''
+        key, window, sigmas = job
+        bands, data, thresholds = DeglitchSweep._data[key]
+        badIndex3 = Utilities.deglitchThreshold(bands, data, *thresholds)
+        nRecords = data.shape[1]
+        res = {k: np.zeros((len(sigmas), len(bands)), dtype=np.float32) for k in DeglitchSweep.OUTPUTS}
+        res['records'] = np.zeros(len(sigmas), dtype=np.float32)
+        for i, (badIndex, badIndex2) in enumerate(Utilities.deglitchPasses(data, window, sigmas, key[1])):
+            bad = badIndex | badIndex2 | badIndex3
+            for k, v in zip(DeglitchSweep.OUTPUTS, (badIndex, badIndex2, badIndex3, bad)):
+                res[k][i] = np.count_nonzero(v, axis=1)/nRecords
+            res['records'][i] = np.count_nonzero(np.any(bad, axis=0))/nRecords
+        return res
+
+    @staticmethod
+    def sweep(root, grids, workers=None):
+        ''' Knockout rates of an undeglitched L1AQC root (see loadL1AQC).
+            grids: {(sensor, lightDark): (windows, sigmas)}; returns {(sensor, lightDark): table} with
+            the datasets and attributes of the file layout '''
+        data = {}
+        jobs = []
+        extracted = DeglitchSweep.extractData(root, {sensor for sensor, _ in grids})
+        for key, (windows, sigmas) in grids.items():
+            if key not in extracted:
+                msg = f'DeglitchSweep: no {key[1]} data for {key[0]}'
+                print(msg)
+                Utilities.writeLogFile(msg)
+                continue
+            bands, radiometry = extracted[key]
+            nRecords = radiometry.shape[1]
+            # Same limits as AnomAnalWindow and ProcessL1aqc_deglitch
+            usable = [int(w) for w in windows if int(w) % 2 == 1 and int(w) <= nRecords]
+            if len(usable) < len(windows):
+                msg = f'DeglitchSweep: {key[0]} {key[1]} windows must be odd and at most {nRecords} records. ' \
+                      f'Skipping {sorted(set(windows) - set(usable))}'
+                print(msg)
+                Utilities.writeLogFile(msg)
+            if nRecords <= 2 or not usable or len(bands) == 0:
+                continue
+            data[key] = (bands, radiometry, DeglitchSweep.thresholds(*key))
+            jobs.extend((key, window, [float(s) for s in sigmas]) for window in usable)
+
+        if workers is None:
+            workers = Controller.getBatchWorkers(len(jobs))
+        msg = f'DeglitchSweep: {len(jobs)} window(s) x sigmas on {workers} worker(s)'
+        print(msg)
+        Utilities.writeLogFile(msg)
+        if workers <= 1:
+            DeglitchSweep.initWorker(None, data)
+            results = [DeglitchSweep.runJob(job) for job in jobs]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                    initializer=DeglitchSweep.initWorker,
+                    initargs=(Controller.getBatchState(), data)) as executor:
+                results = list(executor.map(DeglitchSweep.runJob, jobs))
+        DeglitchSweep._data = {}
+
+        tables = {}
+        for key, (bands, radiometry, (minRad, maxRad, minMaxBand)) in data.items():
+            keyResults = [(job, res) for job, res in zip(jobs, results) if job[0] == key]
+            tables[key] = {
+                'window': np.concatenate([np.full(len(job[2]), job[1]) for job, _ in keyResults]),
+                'sigma': np.concatenate([job[2] for job, _ in keyResults]),
+                'wavelength': bands,
+                'records': np.concatenate([res['records'] for _, res in keyResults]),
+                'attributes': {'nRecords': radiometry.shape[1],
+                               'minRad': 'None' if minRad is None else minRad,
+                               'maxRad': 'None' if maxRad is None else maxRad,
+                               'minMaxBand': 'None' if minMaxBand is None else minMaxBand,
+                               'threshold': int(ConfigFile.settings['bL1aqcThreshold'])}}
+            for k in DeglitchSweep.OUTPUTS:
+                tables[key][k] = np.concatenate([res[k] for _, res in keyResults])
+        return tables
+
+    @staticmethod
+    def write(fp, tables, attributes=None):
+        with h5py.File(fp, 'w') as f:
+            for k, v in (attributes or {}).items():
+                f.attrs[k] = v
+            for (sensor, lightDark), table in tables.items():
+                gp = f.create_group(f'{sensor}_{lightDark}')
+                for k, v in table['attributes'].items():
+                    gp.attrs[k] = v
+                gp.create_dataset('window', data=np.asarray(table['window'], dtype=np.int32))
+                gp.create_dataset('sigma', data=np.asarray(table['sigma'], dtype=np.float64))
+                gp.create_dataset('wavelength', data=np.asarray(table['wavelength'], dtype=np.float64))
+                gp.create_dataset('records', data=np.asarray(table['records'], dtype=np.float32))
+                for k in DeglitchSweep.OUTPUTS:
+                    gp.create_dataset(k, data=np.asarray(table[k], dtype=np.float32),
+                                      compression='gzip', shuffle=True)
+
+    @staticmethod
+    def read(fp):
+        ''' {(sensor, lightDark): table} of a sweep file '''
+        tables = {}
+        with h5py.File(fp, 'r') as f:
+            for name, gp in f.items():
+                sensor, lightDark = name.split('_')
+                table = {k: gp[k][()] for k in gp}
+                table['attributes'] = {k: v.item() if isinstance(v, np.generic) else v for k, v in gp.attrs.items()}
+                tables[(sensor, lightDark)] = table
+        return tables
+
+    # Thresholds are None, 'None' or numbers in the settings and the anoms file
+    @staticmethod
+    def thresholdValue(value):
+        return None if value is None or value == 'None' else float(value)
+
+    @staticmethod
+    def lookup(tables, sensor, lightDark, window, sigma, minRad=None, maxRad=None, minMaxBand=None):
+        ''' Row of the sweep for these parameters as {output: value}, or None if they were not swept
+            with the same thresholds '''
+        table = tables.get((sensor, lightDark))
+        if table is None:
+            return None
+        attributes = table['attributes']
+        if attributes['threshold'] != int(ConfigFile.settings['bL1aqcThreshold']):
+            return None
+        if attributes['threshold']:
+            swept = [DeglitchSweep.thresholdValue(attributes[k]) for k in ('minRad', 'maxRad', 'minMaxBand')]
+            if swept != [DeglitchSweep.thresholdValue(v) for v in (minRad, maxRad, minMaxBand)]:
+                return None
+        row = np.flatnonzero((table['window'] == int(window)) & np.isclose(table['sigma'], float(sigma)))
+        if len(row) == 0:
+            return None
+        row = row[0]
+        res = {k: table[k][row] for k in DeglitchSweep.OUTPUTS + ('records',)}
+        res['wavelength'] = table['wavelength']
+        res['nRecords'] = attributes['nRecords']
+        return res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep the L1AQC deglitching window sizes and sigmas of an L1A file')
+    parser.add_argument('-c', '--config', required=True, help='Configuration file name in Config/')
+    parser.add_argument('-i', '--input', required=True, help='L1A HDF5 file')
+    parser.add_argument('-a', '--anc', help='Ancillary file, as for Main.py -a')
+    parser.add_argument('-s', '--sensors', nargs='+', default=list(DeglitchSweep.SENSORS), choices=DeglitchSweep.SENSORS)
+    parser.add_argument('--windowDark', nargs='+', type=int, default=list(DeglitchSweep.WINDOWS))
+    parser.add_argument('--sigmaDark', nargs='+', type=float, default=list(DeglitchSweep.SIGMAS))
+    parser.add_argument('--windowLight', nargs='+', type=int, default=list(DeglitchSweep.WINDOWS))
+    parser.add_argument('--sigmaLight', nargs='+', type=float, default=list(DeglitchSweep.SIGMAS))
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Worker processes, 0 for all cores')
+    args = parser.parse_args()
+
+    # No GUI: errors go to the prompt. Default main config, as for Main.py -cmd (not saved)
+    os.environ["HYPERINSPACE_CMD"] = "TRUE"
+    MainConfig.createDefaultConfig("cmdline_main.config", None)
+    MainConfig.fileName = "cmdline_main.config"
+    MainConfig.settings["popQuery"] = -1
+    MainConfig.settings["batchWorkers"] = args.workers
+    if args.anc:
+        MainConfig.settings["metFile"] = args.anc
+    ConfigFile.loadConfig(os.path.basename(args.config))
+
+    # The sweep is one job, logged to Logs/<name>_deglitchSweep.log
+    os.makedirs('Logs', exist_ok=True)
+    fp = DeglitchSweep.filePath(args.input)
+    Utilities.openLog(os.path.splitext(os.path.basename(fp))[0] + '.log')
+    try:
+        if ConfigFile.settings["SensorType"].lower() == "trios":
+            flag_Trios = 1
+            calibrationMap = Controller.processCalibrationConfigTrios(ConfigFile.settings["CalibrationFiles"])
+        else:
+            flag_Trios = 0
+            calibrationMap = Controller.processCalibrationConfig(ConfigFile.filename, ConfigFile.settings["CalibrationFiles"])
+        ancillaryData = Controller.processAncData(MainConfig.settings["metFile"])
+
+        root = DeglitchSweep.loadL1AQC(args.input, calibrationMap, ancillaryData, flag_Trios)
+        if root is None:
+            sys.exit(1)
+        grids = {}
+        for sensor in args.sensors:
+            grids[(sensor, 'Dark')] = (args.windowDark, args.sigmaDark)
+            grids[(sensor, 'Light')] = (args.windowLight, args.sigmaLight)
+        tables = DeglitchSweep.sweep(root, grids)
+
+        DeglitchSweep.write(fp, tables, {'L1A': os.path.basename(args.input), 'config': ConfigFile.filename,
+                                         'created': datetime.datetime.now(datetime.timezone.utc).isoformat()})
+        msg = f'Deglitch sweep written: {fp}'
+        print(msg)
+        Utilities.writeLogFile(msg)
+    finally:
+        Utilities.closeLog()
@@ -1,14 +1,83 @@
 import collections
+import re
 import sys
 
 import numpy as np
 
+# Column names that are wavebands, e.g. "305.3" or "443"
+WAVEBAND_NAME = re.compile(r'^\d+(\.\d+)?$')
+
+
+class ColumnFacade(collections.OrderedDict):
+    ''' Compatibility view of the columnar store as an OrderedDict of Python lists.
+    Columns are held as numpy arrays and only converted to lists the first time
+    they are accessed, so columns that are never touched go back to the dataset
+    in columnsToDataset without a list round-trip. '''
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+            super().__setitem__(key, value)
+        return value
+
+    def raw(self, key):
+        ''' Return the column as stored (numpy array or list) without conversion '''
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *args):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if args:
+            return args[0]
+        raise KeyError(key)
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def copy(self):
+        return ColumnFacade((k, self.raw(k)) for k in self)
+
+
 class HDFDataset:
     def __init__(self):
         self.id = ""
         self.attributes = collections.OrderedDict()
         self.columns = collections.OrderedDict()
+        # h5py dataset that data is read from on first access (see read(lazy=True))
+        self.source = None
         self.data = None
+        # Columnar store (see datasetToArrays)
+        self.arrays = collections.OrderedDict()
+        self.bandNames = []
+        self.bands = None
+
+    @property
+    def data(self):
+        if self.source is not None:
+            if not self.source.id.valid:
+                raise ValueError(f"Dataset {self.id} was not loaded before its HDF5 file was closed")
+            self._data = self.source[:] # Gets converted to numpy.ndarray
+            self.source = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self.source = None
+        self._data = value
+
+    def isLoaded(self):
+        return self.source is None
 
     def copy(self, ds):
         self.copyAttributes(ds)
@@ -29,7 +98,9 @@ class HDFDataset:
     def printd(self):
         print("Dataset:", self.id)
 
-    def read(self, f):
+    def read(self, f, lazy=False):
+        ''' Reads attributes and data from an h5py dataset. With lazy, data are
+        only read from the (still open) file the first time they are accessed '''
         name = f.name[f.name.rfind("/")+1:]
         self.id = name
 
@@ -43,17 +114,43 @@ class HDFDataset:
                 self.attributes[k] = f.attrs[k].decode("utf-8")
 
         # Read dataset
-        self.data = f[:] # Gets converted to numpy.ndarray
+        if lazy:
+            self.source = f
+        else:
+            self.data = f[:] # Gets converted to numpy.ndarray
         # print("Dataset:", name)
         # print("Data:", self.data.dtype)
 
-    def write(self, f):
+    def write(self, f, chunks=0, compression=None, compressionLevel=None, shuffle=False, float32=False):
+        ''' Writes the dataset and its attributes to the h5py group f.
+        chunks: rows per chunk (0: h5py default, automatic if compressed)
+        compression: None, "gzip" or "lzf"; compressionLevel applies to gzip
+        shuffle: apply the HDF5 shuffle filter
+        float32: store float64 waveband columns as float32 '''
         #print("id:", self.id)
         #print("columns:", self.columns)
         #print("data:", self.data)
 
         if self.data is not None:
-            dset = f.create_dataset(self.id, data=self.data, dtype=self.data.dtype)
+            data = self.data
+            if float32 and data.dtype.names is not None:
+                dtype = [(k, np.float32 if WAVEBAND_NAME.match(k) and data.dtype[k] == np.float64
+                          else data.dtype[k]) for k in data.dtype.names]
+                data = data.astype(dtype)
+
+            # Filters and chunking are not available for scalar or empty datasets
+            options = {}
+            if data.ndim > 0 and data.size > 0:
+                if compression:
+                    options["compression"] = compression
+                    if compression == "gzip" and compressionLevel is not None:
+                        options["compression_opts"] = int(compressionLevel)
+                if shuffle:
+                    options["shuffle"] = True
+                if chunks:
+                    options["chunks"] = (min(int(chunks), data.shape[0]),) + data.shape[1:]
+
+            dset = f.create_dataset(self.id, data=data, dtype=data.dtype, **options)
             # f = f.create_group(self.id)
             # Write attributes
             for k in self.attributes:
@@ -72,15 +169,93 @@ class HDFDataset:
         else:
             self.columns[name].append(val)
 
+    def extendColumn(self, name, values):
+        if name not in self.columns:
+            self.columns[name] = list(values)
+        else:
+            self.columns[name].extend(values)
+
+    def datasetToArrays(self):
+        ''' Converts numpy recarray into the columnar store: a 2-D float64 block
+        (time x band) for the waveband columns in self.bands, and a named array for
+        every column in self.arrays. Columns are views of the recarray, not copies.
+        When the waveband fields are adjacent native float64 fields (as read from
+        HDF5), the band block is a strided view of the recarray too; otherwise it is
+        built once. Waveband arrays are views into self.bands, so editing either one
+        edits both. '''
+        if self.data is None:
+            print("Warning - datasetToArrays: data is empty")
+            return False
+
+        names = self.data.dtype.names
+        fields = self.data.dtype.fields
+        self.bandNames = [k for k in names if WAVEBAND_NAME.match(k)
+                          and np.issubdtype(self.data.dtype[k], np.number)]
+        nBands = len(self.bandNames)
+        if nBands > 0 and all(fields[k][0] == np.float64 and
+                              fields[k][1] == fields[self.bandNames[0]][1] + 8*j
+                              for j, k in enumerate(self.bandNames)):
+            self.bands = np.lib.stride_tricks.as_strided(self.data[self.bandNames[0]],
+                shape=(self.data.shape[0], nBands), strides=(self.data.strides[0], 8))
+        else:
+            self.bands = np.empty((self.data.shape[0], nBands), dtype=np.float64)
+            for j, k in enumerate(self.bandNames):
+                self.bands[:, j] = self.data[k]
+        bandIndex = {k: j for j, k in enumerate(self.bandNames)}
+
+        self.arrays = collections.OrderedDict()
+        for k in names:
+            if k in bandIndex:
+                self.arrays[k] = self.bands[:, bandIndex[k]]
+            else:
+                self.arrays[k] = self.data[k]
+        return True
+
+    def arraysToDataset(self):
+        ''' Converts the columnar store back into the numpy recarray '''
+        if not self.arrays:
+            print("Warning - arraysToDataset: columnar store is empty")
+            print("Id:", self.id)
+            return False
+
+        dtype = [(k, v.dtype) for k, v in self.arrays.items()]
+        shape = (len(list(self.arrays.values())[0]), )
+        self.data = np.empty(shape, dtype=dtype)
+        for k, v in self.arrays.items():
+            self.data[k] = v
+        return True
+
+    def getArray(self, name):
+        ''' Return a column of the columnar store, or None '''
+        if name in self.arrays:
+            return self.arrays[name]
+        return None
+
+    def getWavelengths(self):
+        ''' Return the wavelengths of the columns in the band block as floats '''
+        return np.array(self.bandNames, dtype=np.float64)
+
+    def setBands(self, bands, bandNames=None):
+        ''' Replace the band block (time x band) and repoint the band columns at it.
+        Rows must match the non-band columns already in the store. '''
+        if bandNames is not None:
+            for k in self.bandNames:
+                if k not in bandNames:
+                    del self.arrays[k]
+            self.bandNames = list(bandNames)
+        self.bands = np.ascontiguousarray(bands, dtype=np.float64)
+        for j, k in enumerate(self.bandNames):
+            self.arrays[k] = self.bands[:, j]
+
     def datasetToColumns(self):
-        ''' Converts numpy array into columns (stored as a dictionary) '''
+        ''' Converts numpy array into columns (stored as a dictionary).
+        Columns are a ColumnFacade over the columnar store: Python lists are only
+        built for the columns that are actually read. '''
         if self.data is None:
             print("Warning - datasetToColumns: data is empty")
             return
-        self.columns = collections.OrderedDict()
-        for k in self.data.dtype.names:
-            #print("type",type(ltData.data[k]))
-            self.columns[k] = self.data[k].tolist()
+        self.datasetToArrays()
+        self.columns = ColumnFacade(self.arrays)
 
     def columnsToDataset(self):
         ''' Converts columns into numpy array '''
@@ -91,6 +266,11 @@ class HDFDataset:
             print("Id:", self.id) #, ", Columns:", self.columns)
             return False
 
+        if isinstance(self.columns, ColumnFacade):
+            rawColumn = self.columns.raw
+        else:
+            rawColumn = self.columns.__getitem__
+
         dtype = []
         for name in self.columns.keys():
 
@@ -108,7 +288,12 @@ class HDFDataset:
                 dtype.append((name, "|S" + str(maxlength))) # immutable tuple(())
             else:
 
-                item = self.columns[name][0]
+                column = rawColumn(name)
+                if isinstance(column, np.ndarray):
+                    # Same Python type inference as for list columns
+                    item = column[:1].tolist()[0]
+                else:
+                    item = column[0]
                 if isinstance(item, bytes):
                     #dtype.append((name, h5py.special_dtype(vlen=str)))
                     dtype.append((name, "|S" + str(len(item))))
@@ -124,15 +309,16 @@ class HDFDataset:
                 else:
                     dtype.append((name, type(item)))
 
-        shape = (len(list(self.columns.values())[0]), )
+        shape = (len(rawColumn(next(iter(self.columns)))), )
         #print("Id:", self.id)
         #print("Dtype:", dtype)
         #print("Shape:", shape)
         self.data = np.empty(shape, dtype=dtype) # empty means uninitialized, i.e. random values.
-        for k,v in self.columns.items():
+        for k in self.columns.keys():
+            v = rawColumn(k)
             # HDF5 deliberately makes including string vectors difficult
             # These will all be changed to floats or ints in HDFDataset.columnsToDataset
-            if k.endswith('FLAG'):
+            if k.endswith('FLAG') and len(v) > 0 and isinstance(v[0], str):
                 # Interpret as undeclared, field, model, or default: 0, 1, 2, 3
                 if v[0] == 'undetermined':
                     v = 0
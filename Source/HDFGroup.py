@@ -85,7 +85,7 @@ class HDFGroup:
             ds = self.datasets[k]
             ds.printd()
 
-    def read(self, f):
+    def read(self, f, lazy=False):
         name = f.name[f.name.rfind("/")+1:]
         self.id = name
 
@@ -105,9 +105,10 @@ class HDFGroup:
                 #print("Item:", k)
                 ds = HDFDataset()
                 self.datasets[k] = ds
-                ds.read(item)
+                ds.read(item, lazy)
 
-    def write(self, f):
+    def write(self, f, **options):
+        ''' Writes the group and its datasets; options are passed to HDFDataset.write '''
         #print("Group:", self.id)
         try:
             f = f.create_group(self.id)
@@ -117,7 +118,7 @@ class HDFGroup:
             # Write datasets
             for key,ds in self.datasets.items():
                 #f.create_dataset(ds.id, data=np.asarray(ds.data))
-                ds.write(f)
+                ds.write(f, **options)
         except:
             e = sys.exc_info()[0]
             print(e)
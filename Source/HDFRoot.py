@@ -1,5 +1,6 @@
 
 import collections
+import io
 import h5py
 import numpy as np
 
@@ -14,6 +15,21 @@ class HDFRoot:
         self.groups = []
         self.datasets = []
         self.attributes = collections.OrderedDict()
+        # Open h5py file backing lazily read datasets (see readHDF5)
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        ''' Close the HDF5 file behind a lazily read root. Datasets that were not
+        accessed before closing can no longer be read. '''
+        if self.file is not None:
+            self.file.close()
+            self.file = None
 
     def copy(self, node):
         self.copyAttributes(node)
@@ -58,10 +74,18 @@ class HDFRoot:
             gp.printd()
 
     @staticmethod
-    def readHDF5(fp):
+    def readHDF5(fp, lazy=False):
+        ''' Reads an HDF5 file into a new HDFRoot.
+        With lazy=True, attributes are read now but dataset data are only read on
+        first access, and the file stays open until HDFRoot.close() (or the end
+        of a "with" block):
+
+            with HDFRoot.readHDF5(fp, lazy=True) as root:
+                ...
+        '''
         root = HDFRoot()
-        with h5py.File(fp, "r") as f:
-
+        f = h5py.File(fp, "r")
+        try:
             # set name to text after last '/'
             name = f.name[f.name.rfind("/")+1:]
             if len(name) == 0:
@@ -86,17 +110,37 @@ class HDFRoot:
                 if isinstance(item, h5py.Group):
                     gp = HDFGroup()
                     root.groups.append(gp)
-                    gp.read(item)
+                    gp.read(item, lazy)
                 elif isinstance(item, h5py.Dataset):
                     # print("HDFRoot should not contain datasets")
                     ds = HDFDataset()
                     root.datasets.append(ds)
-                    ds.read(item)
+                    ds.read(item, lazy)
+        except Exception:
+            f.close()
+            raise
+
+        if lazy:
+            root.file = f
+        else:
+            f.close()
 
         return root
 
+    def copyInMemory(self):
+        ''' Returns a copy of the root exactly as it would read back from an HDF5
+        file (attributes as strings, datasets as recarrays), round-tripped
+        through an in-memory HDF5 image instead of disk. '''
+        image = io.BytesIO()
+        self.writeHDF5(image)
+        image.seek(0)
+        return HDFRoot.readHDF5(image)
+
     # Writing to HDF5 file
-    def writeHDF5(self, fp):
+    def writeHDF5(self, fp, **options):
+        ''' Writes the root to an HDF5 file.
+        options (chunks, compression, compressionLevel, shuffle, float32) are
+        passed to HDFDataset.write; see ConfigFile.getHDFWriteOptions '''
         with h5py.File(fp, "w") as f:
             #print("Root:", self.id)
             # Write attributes
@@ -107,4 +151,4 @@ class HDFRoot:
                 #f.attrs[k+"__GLOSDS"] = np.string_(self.attributes[k])
             # Write groups
             for gp in self.groups:
-                gp.write(f)
+                gp.write(f, **options)
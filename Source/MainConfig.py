@@ -51,4 +51,21 @@ class MainConfig:
         MainConfig.settings["outDir"] = './Data'
         MainConfig.settings["ancFileDir"] = './Data/Sample_Data'
         MainConfig.settings["metFile"] = ""
-        MainConfig.settings["popQuery"] = 0
\ No newline at end of file
+        MainConfig.settings["popQuery"] = 0
+        MainConfig.settings["batchWorkers"] = 1
+        # Multi-level runs: hand each level to the next in memory, optionally skipping intermediate files
+        MainConfig.settings["inMemory"] = 0
+        MainConfig.settings["writeL1A"] = 1
+        MainConfig.settings["writeL1AQC"] = 1
+        MainConfig.settings["writeL1B"] = 1
+        MainConfig.settings["writeL1BQC"] = 1
+        # Skip levels whose output is up to date with its input, settings and calibration (see ReprocessCache)
+        MainConfig.settings["reprocessCache"] = 0
+        # Py6S result cache (see Py6SCache); empty for Data/Py6SCache
+        MainConfig.settings["py6sCacheDir"] = ""
+        MainConfig.settings["py6sCacheMaxMB"] = 200
+        # Parsed characterization file cache (see CharFileCache); empty for Data/CharCache
+        MainConfig.settings["charFileCache"] = 1
+        MainConfig.settings["charCacheDir"] = ""
+        # Render diagnostic plots in the background (see PlotRenderer)
+        MainConfig.settings["asyncPlots"] = 1
\ No newline at end of file
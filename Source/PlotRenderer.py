@@ -0,0 +1,39 @@
+import concurrent.futures
+
+from Source.MainConfig import MainConfig
+
+
+class PlotRenderer:
+    ''' Renders diagnostic plots on a background thread, so that processing does not wait on matplotlib.
+
+    Plot functions handed to submit must draw on their own matplotlib Figure (not pyplot, which is
+    not thread safe) and must not write to the log. Plots are rendered in submission order by a
+    single worker; wait() blocks until they are all written (Controller.writeReport calls it before
+    the report collects the plots). MainConfig.settings["asyncPlots"] = 0 renders them in line. '''
+
+    _executor = None
+    _pending = []
+
+    @staticmethod
+    def isAsync():
+        return int(MainConfig.settings.get("asyncPlots", 1)) == 1
+
+    @staticmethod
+    def submit(func, *args, **kwargs):
+        if not PlotRenderer.isAsync():
+            func(*args, **kwargs)
+            return
+        if PlotRenderer._executor is None:
+            PlotRenderer._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                           thread_name_prefix='PlotRenderer')
+        PlotRenderer._pending = [future for future in PlotRenderer._pending if not future.done()]
+        PlotRenderer._pending.append(PlotRenderer._executor.submit(func, *args, **kwargs))
+
+    @staticmethod
+    def wait():
+        pending, PlotRenderer._pending = PlotRenderer._pending, []
+        for future in pending:
+            try:
+                future.result()
+            except Exception as err:
+                print(f'PlotRenderer: unable to render plot: {err}')
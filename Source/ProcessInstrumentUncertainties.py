@@ -4,7 +4,6 @@ from abc import ABC, abstractmethod
 import numpy as np
 import scipy as sp
 import pandas as pd
-import calendar
 import collections
 from decimal import Decimal
 from inspect import currentframe, getframeinfo
@@ -18,7 +17,7 @@ import matplotlib.pyplot as plt
 
 # HCP files
 from Source import PATH_TO_CONFIG
-from Source.Utilities import Utilities
+from Source.Utilities import Utilities, TimeInterpolator
 from Source.ConfigFile import ConfigFile
 from Source.HDFRoot import HDFRoot  # for typing
 from Source.HDFGroup import HDFGroup  # for typing
@@ -1322,7 +1321,7 @@ class Instrument(ABC):
         for i in range(newWavebands.shape[0]):
             newColumns[str(round(10*newWavebands[i])/10)] = []  # limit to one decimal place
 
-        new_y = np.interp(newWavebands, x, y)  #InterpolatedUnivariateSpline(x, y, k=3)(newWavebands)
+        new_y = Utilities.resampleSpectra(y, x, newWavebands, 'linear')  # as np.interp(newWavebands, x, y)
 
         for waveIndex in range(newWavebands.shape[0]):
             newColumns[str(round(10*newWavebands[waveIndex])/10)].append(new_y[waveIndex])
@@ -1338,26 +1337,13 @@ class Instrument(ABC):
         set in the Configuration Window.
         '''
 
-        # Copy dataset to dictionary
-        columns = {k: Columns[:, i] for i, k in enumerate(waves)}
-        cols = []
-        for m in range(Columns.shape[0]):  # across all the monte carlo draws
-            newColumns = {}
+        # Interpolate all the monte carlo draws at once (cubic spline, as
+        # sp.interpolate.InterpolatedUnivariateSpline(waves, y, k=3) for each draw)
+        new_y = Utilities.resampleSpectra(Columns, waves, newWavebands)
 
-            for i in range(newWavebands.shape[0]):
-                # limit to one decimal place
-                newColumns[str(round(10*newWavebands[i])/10)] = []
-
-            # for m in range(Columns.shape[0]):
-            # Perform interpolation for each timestamp
-            y = np.asarray([columns[k][m] for k in columns])
-
-            new_y = sp.interpolate.InterpolatedUnivariateSpline(waves, y, k=3)(newWavebands)
-
-            for waveIndex in range(newWavebands.shape[0]):
-                newColumns[str(round(10*newWavebands[waveIndex])/10)].append(new_y[waveIndex])
-
-            cols.append(newColumns)
+        # limit to one decimal place
+        keys = [str(round(10*newWavebands[i])/10) for i in range(newWavebands.shape[0])]
+        cols = [{k: [value] for k, value in zip(keys, row)} for row in new_y]
 
         return np.asarray(cols)
 
@@ -1384,17 +1370,13 @@ class Instrument(ABC):
         :param mDraws: number of monte carlo draws, M
         """
         # calculates difference between n=4 and n=5, then propagates as an error
-        sl_corr = self.Slaper_SL_correction(data, mZ, n_iter)
-        sl_corr_unc = []
-        sl4 = self.Slaper_SL_correction(data, mZ, n_iter=n_iter - 1)
-        for i in range(len(sl_corr)):  # get the difference between n=4 and n=5
-            if sl_corr[i] > sl4[i]:
-                sl_corr_unc.append(sl_corr[i] - sl4[i])
-            else:
-                sl_corr_unc.append(sl4[i] - sl_corr[i])
+        sl_corr, sl4 = self.Slaper_SL_correction_batch(np.vstack([data, data]), mZ, [n_iter, n_iter - 1])
+        sl_corr_unc = np.abs(sl_corr - sl4)  # get the difference between n=4 and n=5
 
-        sample_sl_syst = cm.generate_sample(mDraws, sl_corr, np.array(sl_corr_unc), "syst")
-        sample_sl_rand = MC_prop.run_samples(self.Slaper_SL_correction, [sample_data, sample_mZ, sample_n_iter])
+        sample_sl_syst = cm.generate_sample(mDraws, sl_corr, sl_corr_unc, "syst")
+        # All draws in one pass; draws without any finite value are dropped as punpy's run_samples does
+        sample_sl_rand = self.Slaper_SL_correction_batch(sample_data, sample_mZ, sample_n_iter)
+        sample_sl_rand = sample_sl_rand[np.isfinite(sample_sl_rand).any(axis=1)]
         sample_sl_corr = MC_prop.combine_samples([sample_sl_syst, sample_sl_rand])
 
         return sample_sl_corr
@@ -1402,13 +1384,30 @@ class Instrument(ABC):
     # Measurement Functions
     @staticmethod
     def S12func(k, S1, S2):
+        # k is one value per draw when S1 and S2 are (draws x bands)
+        k = np.reshape(k, np.shape(k) + (1,)*(np.ndim(S1) - np.ndim(k)))
         return ((1 + k)*S1) - (k*S2)
 
     @staticmethod
-    def alphafunc(S1, S12):
-        t1 = [Decimal(S1[i]) - Decimal(S12[i]) for i in range(len(S1))]
-        t2 = [pow(Decimal(S12[i]), 2) for i in range(len(S12))]
-        return np.asarray([float(t1[i]/t2[i]) for i in range(len(t1))])
+    def alphafunc(S1, S12, check=False):
+        """ Non-linearity alpha = (S1-S12)/S12^2 for spectra or (draws x bands) arrays. With check,
+        the largest relative difference from alphafunc_decimal is logged. """
+        alpha = (np.asarray(S1, dtype=np.float64) - S12)/np.square(np.asarray(S12, dtype=np.float64))
+        if check:
+            ref = Instrument.alphafunc_decimal(S1, S12)
+            diff = np.nanmax(np.abs(alpha - ref)/np.maximum(np.abs(ref), np.finfo(np.float64).tiny))
+            msg = f'alphafunc: largest relative difference from decimal arithmetic {diff:.2e}'
+            print(msg)
+            Utilities.writeLogFile(msg)
+        return alpha
+
+    @staticmethod
+    def alphafunc_decimal(S1, S12):
+        """ alphafunc in decimal arithmetic (28 significant digits), the reference of its check """
+        S1, S12 = np.broadcast_arrays(np.asarray(S1, dtype=np.float64), np.asarray(S12, dtype=np.float64))
+        alpha = [float((Decimal(s1) - Decimal(s12))/pow(Decimal(s12), 2)) if s12 != 0 else np.nan
+                 for s1, s12 in zip(S1.ravel(), S12.ravel())]
+        return np.reshape(alpha, S1.shape)
 
     @staticmethod
     def dark_Substitution(light, dark):
@@ -1425,34 +1424,45 @@ class Instrument(ABC):
 
     @staticmethod
     def Slaper_SL_correction(input_data, SL_matrix, n_iter=5):
-        nband = len(input_data)
-        m_norm = np.zeros(nband)
-
-        mC = np.zeros((n_iter + 1, nband))
-        mX = np.zeros((n_iter + 1, nband))
-        mZ = SL_matrix
-        mX[0, :] = input_data
-
-        for i in range(nband):
-            jstart = np.max([0, i - 10])
-            jstop = np.min([nband, i + 10])
-            m_norm[i] = np.sum(mZ[i, jstart:jstop])  # eq 4
-
-        for i in range(nband):
-            if m_norm[i] == 0:
-                mZ[i, :] = np.zeros(nband)
-            else:
-                mZ[i, :] = mZ[i, :]/m_norm[i]  # eq 5
+        return Instrument.Slaper_SL_correction_batch(input_data, SL_matrix, n_iter)[0]
 
-        for k in range(1, n_iter + 1):
-            for i in range(nband):
-                mC[k - 1, i] = mC[k - 1, i] + np.sum(mX[k - 1, :]*mZ[i, :])  # eq 6
-                if mC[k - 1, i] == 0:
-                    mX[k, i] = 0
-                else:
-                    mX[k, i] = (mX[k - 1, i]*mX[0, i])/mC[k - 1, i]  # eq 7
+    @staticmethod
+    def Slaper_SL_normalize(SL_matrix):
+        """ Slaper eq. 4-5: rows of the LSF (or of each LSF of a stack) divided by their sum over
+        the 20 pixels around the diagonal; returns a new array """
+        mZ = np.asarray(SL_matrix, dtype=float)
+        nband = mZ.shape[-1]
+        i, j = np.indices((nband, nband))
+        inBand = (j >= i - 10) & (j < i + 10)
+        m_norm = np.sum(np.where(inBand, mZ, 0), axis=-1, keepdims=True)  # eq 4
+        return np.divide(mZ, m_norm, out=np.zeros_like(mZ), where=(m_norm != 0))  # eq 5
+
+    @staticmethod
+    def Slaper_SL_correction_batch(input_data, SL_matrix, n_iter=5):
+        """
+        Slaper stray light correction of many spectra at once, e.g. all MC draws
+
+        :param input_data: spectra to be corrected, (M x bands) or (bands)
+        :param SL_matrix: LSF, (bands x bands) for all spectra or (M x bands x bands), one per spectrum
+        :param n_iter: number of iterations, scalar or (M); as in the original code the result is
+            that of iteration n_iter - 1
+        :return: corrected spectra (M x bands)
+        """
+        mX0 = np.atleast_2d(np.asarray(input_data, dtype=float))
+        mZ = Instrument.Slaper_SL_normalize(SL_matrix)
+        n_iter = np.broadcast_to(np.asarray(n_iter, dtype=int), (len(mX0),))
+
+        mX = mX0
+        result = np.where((n_iter - 1 == 0)[:, None], mX0, 0.0)
+        for k in range(1, n_iter.max()):
+            if mZ.ndim == 2:
+                mC = mX @ mZ.T  # eq 6
+            else:
+                mC = np.matmul(mZ, mX[:, :, None])[:, :, 0]
+            mX = np.divide(mX*mX0, mC, out=np.zeros_like(mC), where=(mC != 0))  # eq 7
+            result[n_iter - 1 == k] = mX[n_iter - 1 == k]
 
-        return mX[n_iter - 1, :]
+        return result
 
     @staticmethod
     def absolute_calibration(normalized_mesure, updated_radcal_gain):
@@ -1673,45 +1683,30 @@ class HyperOCR(Instrument):
     @staticmethod
     def _interp(lightData, lightTimer, darkData, darkTimer):
         # Interpolate Dark Dataset to match number of elements as Light Dataset
-        newDarkData = np.copy(lightData.data)
-        for k in darkData.data.dtype.fields.keys():  # darkData.data.dtype.fields.keys():  # For each wavelength
-            x = np.copy(darkTimer.data).tolist()  # darktimer
-            y = np.copy(darkData.data[k]).tolist()  # data at that band over time
-            new_x = lightTimer.data  # lighttimer
-
-            if len(x) < 3 or len(y) < 3 or len(new_x) < 3:
-                msg = "**************Cannot do cubic spline interpolation, length of datasets < 3"
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-            if not Utilities.isIncreasing(x):
-                msg = "**************darkTimer does not contain strictly increasing values"
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-            if not Utilities.isIncreasing(new_x):
-                msg = "**************lightTimer does not contain strictly increasing values"
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-
-            if len(x) >= 3:
-                # Because x is now a list of datetime tuples, they'll need to be
-                # converted to Unix timestamp values
-                xTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in x]
-                newXTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in new_x]
-
-                newDarkData[k] = Utilities.interp(xTS,y,newXTS, fill_value=np.nan)
+        x = darkTimer.data  # darktimer
+        new_x = lightTimer.data  # lighttimer
+        if len(x) < 3 or darkData.data.shape[0] < 3 or len(new_x) < 3:
+            msg = "**************Cannot do cubic spline interpolation, length of datasets < 3"
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return False
+        if not Utilities.isIncreasing(x):
+            msg = "**************darkTimer does not contain strictly increasing values"
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return False
+        if not Utilities.isIncreasing(new_x):
+            msg = "**************lightTimer does not contain strictly increasing values"
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return False
 
-                for val in newDarkData[k]:
-                    if np.isnan(val):
-                        frameinfo = getframeinfo(currentframe())
-                        msg = f'found NaN {frameinfo.lineno}'
-            else:
-                msg = '**************Record too small for splining. Exiting.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
+        # All wavelengths are interpolated together
+        darkBands = list(darkData.data.dtype.names)
+        darkInterp = TimeInterpolator(x, new_x).linear(np.column_stack([darkData.data[k] for k in darkBands]))
+        newDarkData = np.copy(lightData.data)
+        for j, k in enumerate(darkBands):
+            newDarkData[k] = darkInterp[:, j]
 
         if Utilities.hasNan(darkData):
             frameinfo = getframeinfo(currentframe())
@@ -1824,6 +1819,8 @@ class HyperOCR(Instrument):
             # set up uncertainty propagation
             mDraws = 100  # number of monte carlo draws
             prop = punpy.MCPropagation(mDraws, parallel_cores=1)
+            # element-wise measurement functions take all draws in one call
+            prop_vec = punpy.MCPropagation(mDraws, parallel_cores=0, MCdimlast=False)
             ind_raw_wvl = (radcal_wvl > 0)  # remove any index for which we do not have radcal wvls available
 
             mZ = mZ[:, ind_raw_wvl]
@@ -1881,7 +1878,7 @@ class HyperOCR(Instrument):
             k = t1/(t2 - t1)
             sample_k = cm.generate_sample(mDraws, k, None, None)
             S12 = self.S12func(k, S1, S2)
-            sample_S12 = prop.run_samples(self.S12func, [sample_k, sample_S1, sample_S2])
+            sample_S12 = prop_vec.run_samples(self.S12func, [sample_k, sample_S1, sample_S2])
 
             if self.sl_method.upper() == 'ZONG':
                 sample_n_IB = self.gen_n_IB_sample(mDraws)
@@ -1896,7 +1893,7 @@ class HyperOCR(Instrument):
 
             # alpha = ((S1-S12)/(S12**2)).tolist()
             alpha = self.alphafunc(S1, S12)
-            sample_alpha = prop.run_samples(self.alphafunc, [sample_S1, sample_S12])
+            sample_alpha = prop_vec.run_samples(self.alphafunc, [sample_S1, sample_S12])
 
             # Updated calibration gain
             if sensortype == "ES":
@@ -2035,7 +2032,7 @@ class HyperOCR(Instrument):
 
             # Non-linearity
             data1 = self.DATA1(data, alpha)  # data*(1 - alpha*data)
-            sample_data1 = prop.run_samples(self.DATA1, [sample_dark_corr_data, sample_alpha])
+            sample_data1 = prop_vec.run_samples(self.DATA1, [sample_dark_corr_data, sample_alpha])
 
             # data1 unc
             # data1_unc = (prop.process_samples(None, sample_data1)/data1)*100
@@ -2328,6 +2325,8 @@ class Trios(Instrument):
             # set up uncertainty propagation
             mDraws = 100  # number of monte carlo draws
             prop = punpy.MCPropagation(mDraws, parallel_cores=1)
+            # element-wise measurement functions take all draws in one call
+            prop_vec = punpy.MCPropagation(mDraws, parallel_cores=0, MCdimlast=False)
 
             # uncertainties from data:
             sample_mZ = cm.generate_sample(mDraws, mZ, mZ_unc, "rand")
@@ -2359,7 +2358,7 @@ class Trios(Instrument):
             sample_S2 = cm.generate_sample(mDraws, np.asarray(S2), S2_unc, "rand")
 
             S12 = self.S12func(k, S1, S2)
-            sample_S12 = prop.run_samples(self.S12func, [sample_k, sample_S1, sample_S2])
+            sample_S12 = prop_vec.run_samples(self.S12func, [sample_k, sample_S1, sample_S2])
 
             if self.sl_method.upper() == 'ZONG':  # for internal coding use only, set by default in HCP
                 sample_n_IB = self.gen_n_IB_sample(mDraws)  # n_IB sample must be integer and in the range 3-6
@@ -2372,7 +2371,7 @@ class Trios(Instrument):
                 )
 
             alpha = self.alphafunc(S1, S12)
-            sample_alpha = prop.run_samples(self.alphafunc, [sample_S1, sample_S12])
+            sample_alpha = prop_vec.run_samples(self.alphafunc, [sample_S1, sample_S12])
 
             # Updated calibration gain
             if sensortype == "ES":
@@ -2507,7 +2506,7 @@ class Trios(Instrument):
 
             # Non-Linearity Correction
             linear_corr_mesure = self.non_linearity_corr(offset_corr_mesure, alpha)
-            sample_linear_corr_mesure = prop.run_samples(self.non_linearity_corr,
+            sample_linear_corr_mesure = prop_vec.run_samples(self.non_linearity_corr,
                                                          [sample_offset_corrected_mesure, sample_alpha])
 
             # Straylight Correction
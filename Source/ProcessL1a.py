@@ -19,6 +19,18 @@ class ProcessL1a:
         '''
         Reads a raw binary file and generates a L1a HDF5 file
         '''
+        root, contextMap = ProcessL1a.startL1a(fp, calibrationMap)
+
+        print('Reading in raw binary data may take a moment.')
+        RawFileReader.readRawFile(fp, calibrationMap, contextMap, root)
+
+        return ProcessL1a.finishL1a(root, contextMap, calibrationMap)
+
+    @staticmethod
+    def startL1a(fp, calibrationMap):
+        '''
+        Creates the L1a root and the per-calibration-file groups that RawFileReader fills
+        '''
         (_, fileName) = os.path.split(fp)
 
         # Generate root attributes
@@ -57,9 +69,13 @@ class ProcessL1a:
 
         # print("contextMap:", list(contextMap.keys()))
         # print("calibrationMap:", list(calibrationMap.keys()))
-        print('Reading in raw binary data may take a moment.')
-        RawFileReader.readRawFile(fp, calibrationMap, contextMap, root)
+        return root, contextMap
 
+    @staticmethod
+    def finishL1a(root, contextMap, calibrationMap):
+        '''
+        Turns the groups read by RawFileReader into the L1a root, or None on failure
+        '''
         # Populate HDF group attributes
         for key in calibrationMap:
             cf = calibrationMap[key]
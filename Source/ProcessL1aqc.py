@@ -3,12 +3,12 @@ import math
 import datetime
 import copy
 import numpy as np
-from pysolar.solar import get_azimuth, get_altitude
 
 from Source.HDFDataset import HDFDataset
 from Source.ProcessL1aqc_deglitch import ProcessL1aqc_deglitch
 from Source.Utilities import Utilities
 from Source.ConfigFile import ConfigFile
+from Source.SolarPosition import SolarPosition
 
 class ProcessL1aqc:
     ''' Process L1A to L1AQC '''
@@ -16,99 +16,32 @@ class ProcessL1aqc:
     @staticmethod
     def filterData(group, badTimes):
         ''' Delete flagged records '''
-
-        msg = f'Remove {group.id} Data'
-        print(msg)
-        Utilities.writeLogFile(msg)
-
-        timeStamp = group.getDataset("DATETIME").data
-
-        startLength = len(timeStamp)
-        msg = f'   Length of dataset prior to removal {startLength} long'
-        print(msg)
-        Utilities.writeLogFile(msg)
-
-        # Delete the records in badTime ranges from each dataset in the group
-        finalCount = 0
-        originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
-
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            # msg = f'Eliminate data between: {dateTime}'
-            # print(msg)
-            # Utilities.writeLogFile(msg)
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        rowsToDelete.append(i)
-                        finalCount += 1
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                msg = 'Data group is empty. Continuing.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-            timeStamp = newTimeStamp.copy()
-
-        msg = f'   Length of records removed from dataset: {finalCount}'
-        print(msg)
-        Utilities.writeLogFile(msg)
-
-        return finalCount/originalLength
+        return ProcessL1aqc.filterDataTimestamp(group, badTimes, "DATETIME")
 
     @staticmethod
     def filterData_ADJUSTED(group, badTimes):
         ''' Delete additional flagged records for Sea-Bird Darks with adjusted 
             timestamps to match Lights '''
+        return ProcessL1aqc.filterDataTimestamp(group, badTimes, "DATETIME_ADJUSTED")
+
+    @staticmethod
+    def filterDataTimestamp(group, badTimes, timeStampName):
+        ''' Delete the records of group whose timeStampName dataset falls within badTimes '''
 
         msg = f'Remove {group.id} Data'
         print(msg)
         Utilities.writeLogFile(msg)
 
-        timeStamp = group.getDataset("DATETIME_ADJUSTED").data
+        timeStamp = group.getDataset(timeStampName).data
 
         startLength = len(timeStamp)
         msg = f'   Length of dataset prior to removal {startLength} long'
         print(msg)
         Utilities.writeLogFile(msg)
 
-        # Delete the records in badTime ranges from each dataset in the group
-        finalCount = 0
+        # Delete the records in badTime ranges from each dataset in the group, all at once
         originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
-
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            # msg = f'Eliminate data between: {dateTime}'
-            # print(msg)
-            # Utilities.writeLogFile(msg)
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        rowsToDelete.append(i)
-                        finalCount += 1
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                msg = 'Data group is empty. Continuing.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-            timeStamp = newTimeStamp.copy()
+        finalCount = Utilities.deleteRecords(group, timeStamp, badTimes)
 
         msg = f'   Length of records removed from dataset: {finalCount}'
         print(msg)
@@ -231,11 +164,8 @@ class ProcessL1aqc:
                 # Solar geometry is preferentially acquired from SolarTracker or pySAS
                 # Otherwise resorts to ancillary data. Otherwise processing fails.
                 # Run Pysolar to obtain solar geometry.
-                sunAzimuthAnc = []
-                sunZenithAnc = []
-                for i, dt_utc in enumerate(gpsDateTime):
-                    sunAzimuthAnc.append(get_azimuth(latAnc[i],lonAnc[i],dt_utc,0)) # latAnc lonAnc from GPS, not ancillary file
-                    sunZenithAnc.append(90 - get_altitude(latAnc[i],lonAnc[i],dt_utc,0))
+                # latAnc lonAnc from GPS, not ancillary file
+                sunAzimuthAnc, sunZenithAnc = SolarPosition.solarPosition(latAnc, lonAnc, gpsDateTime)
 
                 # SATTHS fluxgate compass on SAS
                 if compass is None:
@@ -300,11 +230,7 @@ class ProcessL1aqc:
             # Solar geometry is preferentially acquired from SolarTracker or pySAS
             # Otherwise resorts to ancillary data. Otherwise processing fails.
             # Run Pysolar to obtain solar geometry.
-            sunAzimuthAnc = []
-            sunZenithAnc = []
-            for i, dt_utc in enumerate(timeStamp):
-                sunAzimuthAnc.append(get_azimuth(latAnc[i],lonAnc[i],dt_utc,0))
-                sunZenithAnc.append(90 - get_altitude(latAnc[i],lonAnc[i],dt_utc,0))
+            sunAzimuthAnc, sunZenithAnc = SolarPosition.solarPosition(latAnc, lonAnc, timeStamp)
 
             # relAzAnc either from ancillary relZz, ancillary sensorAz, (or THS compass above ^^)
             relAzAnc = []
@@ -1,7 +1,6 @@
 ''' Process L1AQC to L1B '''
 import os
 import datetime as dt
-import calendar
 from inspect import currentframe, getframeinfo
 import glob
 from datetime import datetime
@@ -13,7 +12,7 @@ from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
 from Source.ConfigFile import ConfigFile
 from Source.CalibrationFileReader import CalibrationFileReader
 from Source.ProcessL1b_Interp import ProcessL1b_Interp
-from Source.Utilities import Utilities
+from Source.Utilities import Utilities, TimeInterpolator
 from Source.GetAnc import GetAnc
 from Source.GetAnc_ecmwf import GetAnc_ecmwf
 from Source.FidradDB_api import FidradDB_api
@@ -408,47 +407,34 @@ class ProcessL1b:
             msg = f'found NaN {frameinfo.lineno}'
 
         # Interpolate Dark Dataset to match number of elements as Light Dataset
-        newDarkData = np.copy(lightData.data)
-        for k in darkData.data.dtype.fields.keys(): # For each wavelength
-            x = np.copy(darkTimer.data).tolist() # darktimer
-            y = np.copy(darkData.data[k]).tolist()  # data at that band over time
-            new_x = lightTimer.data  # lighttimer
-
-            if len(x) < 3 or len(y) < 3 or len(new_x) < 3:
-                msg = "**************Cannot do cubic spline interpolation, length of datasets < 3"
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
+        x = darkTimer.data # darktimer
+        new_x = lightTimer.data  # lighttimer
 
-            if not Utilities.isIncreasing(x):
-                msg = "**************darkTimer does not contain strictly increasing values"
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-            if not Utilities.isIncreasing(new_x):
-                msg = "**************lightTimer does not contain strictly increasing values"
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
-
-            if len(x) >= 3:
-                # Because x is now a list of datetime tuples, they'll need to be
-                # converted to Unix timestamp values
-                xTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in x]
-                newXTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in new_x]
+        if len(x) < 3 or darkData.data.shape[0] < 3 or len(new_x) < 3:
+            msg = "**************Cannot do cubic spline interpolation, length of datasets < 3"
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return False
 
-                newDarkData[k] = Utilities.interp(xTS,y,newXTS, fill_value=np.nan)
+        if not Utilities.isIncreasing(x):
+            msg = "**************darkTimer does not contain strictly increasing values"
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return False
+        if not Utilities.isIncreasing(new_x):
+            msg = "**************lightTimer does not contain strictly increasing values"
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return False
 
-                for val in newDarkData[k]:
-                    if np.isnan(val):
-                        frameinfo = getframeinfo(currentframe())
-                        msg = f'found NaN {frameinfo.lineno}'
-            else:
-                msg = '**************Record too small for splining. Exiting.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-                return False
+        # All wavelengths are interpolated together; the datetimes are converted to Unix
+        # timestamps only once
+        darkBands = list(darkData.data.dtype.names)
+        darkInterp = TimeInterpolator(x, new_x).linear(np.column_stack([darkData.data[k] for k in darkBands]))
 
+        newDarkData = np.copy(lightData.data)
+        for j, k in enumerate(darkBands):
+            newDarkData[k] = darkInterp[:, j]
         darkData.data = newDarkData
 
         if Utilities.hasNan(darkData):
@@ -459,9 +445,11 @@ class ProcessL1b:
             exit()
 
         # Correct light data by subtracting interpolated dark data from light data
-        for k in lightData.data.dtype.fields.keys():
-            for x in range(lightData.data.shape[0]):
-                lightData.data[k][x] -= newDarkData[k][x]
+        lightBands = list(lightData.data.dtype.names)
+        corrected = np.column_stack([lightData.data[k] for k in lightBands]) \
+            - np.column_stack([newDarkData[k] for k in lightBands])
+        for j, k in enumerate(lightBands):
+            lightData.data[k] = corrected[:, j]
 
         if Utilities.hasNan(lightData):
             frameinfo = getframeinfo(currentframe())
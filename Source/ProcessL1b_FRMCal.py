@@ -10,11 +10,38 @@ from scipy import interpolate
 
 # internal files
 from Source.ConfigFile import ConfigFile
+from Source.Py6SCache import Py6SCache
+from Source.Py6SLUT import Py6SLUT
 from Source.Utilities import Utilities
 
 class ProcessL1b_FRMCal:
     ''' L1AQC to L1B for Full-FRM or Class-based '''
 
+    @staticmethod
+    def runPy6S(inputs, wvl):
+        ''' Runs 6S for all wavelengths (nm) for the inputs of Py6SCache.inputs; returns the
+            Py6SCache.OUTPUTS as arrays over the wavelengths '''
+        s = Py6S.SixS()
+        s.atmos_profile = Py6S.AtmosProfile.PredefinedType(Py6S.AtmosProfile.MidlatitudeSummer)
+        s.aero_profile  = Py6S.AeroProfile.PredefinedType(Py6S.AeroProfile.Maritime)
+        # Date on the geometry (Earth-Sun distance); SixS.month/day are not read by Py6S
+        s.geometry.month = inputs['month']
+        s.geometry.day = inputs['day']
+        s.geometry.solar_z = inputs['solar_z']
+        s.geometry.solar_a = inputs['solar_a']
+        s.geometry.view_a = inputs['view_a']
+        s.geometry.view_z = 180
+        s.altitudes = Py6S.Altitudes()
+        s.altitudes.set_target_sea_level()
+        s.altitudes.set_sensor_sea_level()
+        s.aot550 = inputs['aot550']
+        n_cores = None
+        if os.name == 'nt':  # if system is windows do not do parallel processing to avoid potential error
+            n_cores = 1
+        _, res = Py6S.SixSHelpers.Wavelengths.run_wavelengths(s, 1e-3*np.asarray(wvl), n=n_cores)
+
+        return {k: np.array([res[x].values[k] for x in range(len(wvl))]) for k in Py6SCache.OUTPUTS}
+
     @staticmethod
     def get_direct_irradiance_ratio(node: object, sensortype: object, called_L2: bool = False) -> object:
         ''' Used for both SeaBird and TriOS L1b
@@ -93,38 +120,48 @@ class ProcessL1b_FRMCal:
         irr_env = np.zeros((n_bin, nband))
         solar_zenith = np.zeros(n_bin)
 
-        for n in range(n_bin):
-            # find ancillary point that match the 1st mesure of the 3min ensemble
-            ind_anc = np.argmin(np.abs(np.array(anc_datetime)-datetime[n*n_min]))
-            s = Py6S.SixS()
-            s.atmos_profile = Py6S.AtmosProfile.PredefinedType(Py6S.AtmosProfile.MidlatitudeSummer)
-            s.aero_profile  = Py6S.AeroProfile.PredefinedType(Py6S.AeroProfile.Maritime)
-            s.month = datetime[ind_anc].month
-            s.day = datetime[ind_anc].day
-            s.geometry.solar_z = sun_zenith[ind_anc]
-            s.geometry.solar_a = sun_azimuth[ind_anc]
-            s.geometry.view_a = rel_az[ind_anc]
-            s.geometry.view_z = 180
-            s.altitudes = Py6S.Altitudes()
-            s.altitudes.set_target_sea_level()
-            s.altitudes.set_sensor_sea_level()
-            s.aot550 = aod[ind_anc]
-            n_cores = None
-            if os.name == 'nt':  # if system is windows do not do parallel processing to avoid potential error
-                n_cores = 1
-            _, res = Py6S.SixSHelpers.Wavelengths.run_wavelengths(s, 1e-3*wvl, n=n_cores)
-
-            # extract value from Py6s
-            # total_gaseous_transmittance[n,:] = np.array([res[x].values['total_gaseous_transmittance'] for x in range(nband)])
-            # env[n,:]  = np.array([res[x].values['percent_environmental_irradiance'] for x in range(nband)])
-            direct[n,:]  = np.array([res[x].values['percent_direct_solar_irradiance'] for x in range(nband)])
-            diffuse[n,:]  = np.array([res[x].values['percent_diffuse_solar_irradiance'] for x in range(nband)])
-            irr_direct[n,:]  = np.array([res[x].values['direct_solar_irradiance'] for x in range(nband)])
-            irr_diffuse[n,:]  = np.array([res[x].values['diffuse_solar_irradiance'] for x in range(nband)])
-            irr_env[n,:]  = np.array([res[x].values['environmental_irradiance'] for x in range(nband)])
-            solar_zenith[n] = sun_zenith[ind_anc]
-
+        # find ancillary point that match the 1st mesure of each 3min ensemble
+        anc_datetime = np.array(anc_datetime)
+        ind_anc = np.array([np.argmin(np.abs(anc_datetime-datetime[n*n_min])) for n in range(n_bin)])
+        solar_zenith[:] = sun_zenith[ind_anc]
+
+        res = None
+        if Py6SLUT.isEnabled():
+            # All bins at once from the precomputed table
+            res = Py6SLUT.interpolate([datetime[i].month for i in ind_anc], [datetime[i].day for i in ind_anc],
+                                      sun_zenith[ind_anc], sun_azimuth[ind_anc], rel_az[ind_anc], aod[ind_anc], wvl)
+            if res is None:
+                msg = 'ProcessL1b_FRMCal: no Py6S table. Running 6S for each bin instead.'
+                print(msg)
+                Utilities.writeLogFile(msg)
+        if res is not None:
+            direct[:]  = res['percent_direct_solar_irradiance']
+            diffuse[:]  = res['percent_diffuse_solar_irradiance']
+            irr_direct[:]  = res['direct_solar_irradiance']
+            irr_diffuse[:]  = res['diffuse_solar_irradiance']
+            irr_env[:]  = res['environmental_irradiance']
+        else:
+            Py6SCache.resetStats()
+            for n, i in enumerate(ind_anc):
+                inputs = Py6SCache.inputs(datetime[i].month, datetime[i].day, sun_zenith[i],
+                                          sun_azimuth[i], rel_az[i], aod[i])
+                res = Py6SCache.load(inputs, wvl) if Py6SCache.isEnabled() else None
+                if res is None:
+                    res = ProcessL1b_FRMCal.runPy6S(inputs, wvl)
+                    if Py6SCache.isEnabled():
+                        Py6SCache.save(inputs, wvl, res)
+
+                # extract value from Py6s
+                # total_gaseous_transmittance[n,:] = np.array([res[x].values['total_gaseous_transmittance'] for x in range(nband)])
+                # env[n,:]  = np.array([res[x].values['percent_environmental_irradiance'] for x in range(nband)])
+                direct[n,:]  = res['percent_direct_solar_irradiance']
+                diffuse[n,:]  = res['percent_diffuse_solar_irradiance']
+                irr_direct[n,:]  = res['direct_solar_irradiance']
+                irr_diffuse[n,:]  = res['diffuse_solar_irradiance']
+                irr_env[n,:]  = res['environmental_irradiance']
+            Py6SCache.logStats()
 
+        for n in range(n_bin):
             if np.isnan(direct).any():
                 logging.debug("direct contains NaN values at: %s" % wvl[np.isnan(direct)[n]])
 
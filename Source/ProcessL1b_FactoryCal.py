@@ -13,84 +13,81 @@ class ProcessL1b_FactoryCal:
     # Reference: "SAT-DN-00134_Instrument File Format.pdf"
     @staticmethod
     def processDataset(ds, cd, inttime=None, immersed=False):
-        #print("FitType:", cd.fitType)
-        if cd.fitType == "OPTIC2":
-            ProcessL1b_FactoryCal.processOPTIC2(ds, cd, immersed)
-        # elif cd.fitType == "OPTIC1":
-        #     ProcessL1b_FactoryCal.processOPTIC1(ds, cd, immersed)
-        elif cd.fitType == "OPTIC3":
-            ProcessL1b_FactoryCal.processOPTIC3(ds, cd, immersed, inttime)
-        elif cd.fitType == "OPTIC4":
-            ProcessL1b_FactoryCal.processOPTIC4(ds, cd, immersed)
-        # elif cd.fitType == "THERM1":
-        #     ProcessL1b_FactoryCal.processTHERM1(ds, cd)
-        elif cd.fitType == "POW10":
-            ProcessL1b_FactoryCal.processPOW10(ds, cd, immersed)
-        elif cd.fitType == "POLYU":
-            ProcessL1b_FactoryCal.processPOLYU(ds, cd)
-        elif cd.fitType == "POLYF":
-            ProcessL1b_FactoryCal.processPOLYF(ds, cd)
-        # elif cd.fitType == "DDMM":
-        #     ProcessL1b_FactoryCal.processDDMM(ds, cd)
-        # elif cd.fitType == "HHMMSS":
-        #     ProcessL1b_FactoryCal.processHHMMSS(ds, cd)
-        # elif cd.fitType == "DDMMYY":
-        #     ProcessL1b_FactoryCal.processDDMMYY(ds, cd)
-        # elif cd.fitType == "TIME2":
-        #     ProcessL1b_FactoryCal.processTIME2(ds, cd)
-        elif cd.fitType == "COUNT":
-            pass
-        elif cd.fitType == "NONE":
-            pass
-        else:
-            msg = f'ProcessL1b_FactoryCal.processDataset: Unknown Fit Type: {cd.fitType}'
+        ProcessL1b_FactoryCal.processBands(ds, [cd], inttime, immersed)
+
+    # Calibrates at once all the bands of a dataset that share a fit type (and number of
+    #   coefficients). Each kernel takes the (time x band) matrix of raw values and the
+    #   (band x coefficient) matrix, and returns the calibrated matrix.
+    @staticmethod
+    def processBands(ds, cds, inttime=None, immersed=False):
+        fitType = cds[0].fitType
+        #print("FitType:", fitType)
+        if fitType in ("COUNT", "NONE"):
+            return
+        kernels = {
+            "OPTIC2": ProcessL1b_FactoryCal.processOPTIC2,
+            # "OPTIC1": ProcessL1b_FactoryCal.processOPTIC1,
+            "OPTIC3": ProcessL1b_FactoryCal.processOPTIC3,
+            "OPTIC4": ProcessL1b_FactoryCal.processOPTIC4,
+            # "THERM1": ProcessL1b_FactoryCal.processTHERM1,
+            "POW10": ProcessL1b_FactoryCal.processPOW10,
+            "POLYU": ProcessL1b_FactoryCal.processPOLYU,
+            "POLYF": ProcessL1b_FactoryCal.processPOLYF}
+            # DDMM, HHMMSS, DDMMYY, TIME2 not implemented
+        if fitType not in kernels:
+            msg = f'ProcessL1b_FactoryCal.processDataset: Unknown Fit Type: {fitType}'
             print(msg)
             Utilities.writeLogFile(msg)
+            return
+
+        keys = [cd.id for cd in cds]
+        x = np.column_stack([ds.data[k] for k in keys]).astype(np.float64)
+        coeffs = np.array([[float(a) for a in cd.coefficients] for cd in cds], dtype=np.float64)
+        if fitType == "OPTIC3":
+            # Integration time of each sample as a column, to broadcast across the bands
+            aint = np.asarray(inttime.data[cds[0].type], dtype=np.float64)[:, None]
+            x = ProcessL1b_FactoryCal.processOPTIC3(x, coeffs, immersed, aint)
+        elif fitType in ("POLYU", "POLYF"):
+            x = kernels[fitType](x, coeffs)
+        else:
+            x = kernels[fitType](x, coeffs, immersed)
+        for j, k in enumerate(keys):
+            ds.data[k] = x[:, j]
 
     # # Process OPTIC1 - not implemented
     # @staticmethod
-    # def processOPTIC1(ds, cd, immersed):
+    # def processOPTIC1(x, coeffs, immersed):
     #     return
 
     @staticmethod
-    def processOPTIC2(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * a1 * (ds.data[k][x] - a0)
+    def processOPTIC2(x, coeffs, immersed):
+        a0 = coeffs[:, 0]
+        a1 = coeffs[:, 1]
+        im = coeffs[:, 2] if immersed else 1.0
+        return im * a1 * (x - a0)
 
     @staticmethod
-    def processOPTIC3(ds, cd, immersed, inttime):
-        # a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        cint = float(cd.coefficients[3])
-        #print(inttime.data.shape[0], self.data.shape[0])
-        k = cd.id
-        #print(cint, aint)
-        #print(cd.id)
-        for x in range(ds.data.shape[0]):
-            aint = inttime.data[cd.type][x]
-            # ds.data[k][x] = im * a1 * (ds.data[k][x] - a0) * (cint/aint)
-            ##############################################################
-            #   When applying calibration to the dark current corrected
-            #   radiometry, a0 cancels (see ProSoftUserManual7.7 11.1.1.5 Eqns 5-6)
-            #   presuming light and dark factory cals are equivalent (which they are).
-            ##############################################################
-            ds.data[k][x] = im * a1 * (ds.data[k][x]) * (cint/aint)
+    def processOPTIC3(x, coeffs, immersed, aint):
+        # a0 = coeffs[:, 0]
+        a1 = coeffs[:, 1]
+        im = coeffs[:, 2] if immersed else 1.0
+        cint = coeffs[:, 3]
+        # return im * a1 * (x - a0) * (cint/aint)
+        ##############################################################
+        #   When applying calibration to the dark current corrected
+        #   radiometry, a0 cancels (see ProSoftUserManual7.7 11.1.1.5 Eqns 5-6)
+        #   presuming light and dark factory cals are equivalent (which they are).
+        ##############################################################
+        return im * a1 * x * (cint/aint)
 
     @staticmethod
-    def processOPTIC4(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        cint = float(cd.coefficients[3])
-        k = cd.id
+    def processOPTIC4(x, coeffs, immersed):
+        a0 = coeffs[:, 0]
+        a1 = coeffs[:, 1]
+        im = coeffs[:, 2] if immersed else 1.0
+        cint = coeffs[:, 3]
         aint = 1
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * a1 * (ds.data[k][x] - a0) * (cint/aint)
+        return im * a1 * (x - a0) * (cint/aint)
 
     # # Process THERM1 - not implemented
     # #   This is for optical thermal sensors like pyrometers, I believe.
@@ -100,33 +97,26 @@ class ProcessL1b_FactoryCal:
     #     return
 
     @staticmethod
-    def processPOW10(ds, cd, immersed):
-        a0 = float(cd.coefficients[0])
-        a1 = float(cd.coefficients[1])
-        im = float(cd.coefficients[2]) if immersed else 1.0
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            ds.data[k][x] = im * pow(10, ((ds.data[k][x]-a0)/a1))
+    def processPOW10(x, coeffs, immersed):
+        a0 = coeffs[:, 0]
+        a1 = coeffs[:, 1]
+        im = coeffs[:, 2] if immersed else 1.0
+        return im * np.power(10.0, (x-a0)/a1)
 
+    # Sum of a_i * x**i, evaluated with Horner's scheme
     @staticmethod
-    def processPOLYU(ds, cd):
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            num = 0
-            for i, coeff in enumerate(cd.coefficients):
-                a = float(coeff)
-                num += a * pow(ds.data[k][x],i)
-            ds.data[k][x] = num
+    def processPOLYU(x, coeffs):
+        num = np.zeros_like(x)
+        for a in coeffs.T[::-1]:
+            num = num * x + a
+        return num
 
     @staticmethod
-    def processPOLYF(ds, cd):
-        a0 = float(cd.coefficients[0])
-        k = cd.id
-        for x in range(ds.data.shape[0]):
-            num = a0
-            for a in cd.coefficients[1:]:
-                num *= (ds.data[k][x] - float(a))
-            ds.data[k][x] = num
+    def processPOLYF(x, coeffs):
+        num = np.broadcast_to(coeffs[:, 0], x.shape)
+        for a in coeffs.T[1:]:
+            num = num * (x - a)
+        return num
 
     # @staticmethod
     # def processDDMM(ds, cd):
@@ -168,12 +158,22 @@ class ProcessL1b_FactoryCal:
                 ProcessL1b_FactoryCal.processDataset(ds, cd)
                 inttime = ds
 
+        # Gather the bands of each dataset by fit type so each calibration is applied to all of
+        #   them at once. A band listed twice in the cal file goes to a later batch, so it is
+        #   still calibrated twice and in file order.
+        batches = {}
+        seen = {}
         for cd in cf.data:
             # process each dataset in the cal file list of data, except INTTIME
             if gp.getDataset(cd.type) and cd.type != "INTTIME":
-                #print("Dataset:", cd.type)
-                ds = gp.getDataset(cd.type)
-                ProcessL1b_FactoryCal.processDataset(ds, cd, inttime)
+                repeat = seen.get((cd.type, cd.id), 0)
+                seen[(cd.type, cd.id)] = repeat + 1
+                key = (cd.type, cd.fitType, len(cd.coefficients), repeat)
+                batches.setdefault(key, []).append(cd)
+
+        for (dsType, *_), cds in batches.items():
+            #print("Dataset:", dsType)
+            ProcessL1b_FactoryCal.processBands(gp.getDataset(dsType), cds, inttime)
 
     @staticmethod
     def get_cal_file_lines(calibrationMap):
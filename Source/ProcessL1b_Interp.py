@@ -1,16 +1,14 @@
 
 import collections
 import datetime as dt
-import calendar
 from inspect import currentframe, getframeinfo
-from pysolar.solar import get_azimuth, get_altitude
 import numpy as np
 import scipy as sp
-import warnings
 
 from Source.HDFRoot import HDFRoot
-from Source.Utilities import Utilities
+from Source.Utilities import Utilities, TimeInterpolator
 from Source.ConfigFile import ConfigFile
+from Source.SolarPosition import SolarPosition
 
 
 class ProcessL1b_Interp:
@@ -308,39 +306,30 @@ class ProcessL1b_Interp:
         # List of datasets requiring fill instead of interpolation
         fillList = ['STATION']
 
-        for k in xData.data.dtype.names:
-            if k == "Datetag" or k == "Timetag2" or k == "Datetime":
-                continue
-            # print(k)
-            x = list(xTimer)
-            new_x = list(yTimer)
-            y = np.copy(xData.data[k]).tolist()
-
-            # Because x is now a list of datetime tuples, they'll need to be
-            # converted to Unix timestamp values
-            xTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in x]
-            newXTS = [calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in new_x]
+        # All columns share the time axes, so they are interpolated as one block
+        keys = [k for k in xData.data.dtype.names if k not in ("Datetag", "Timetag2", "Datetime")]
+        if keys:
+            interpolator = TimeInterpolator(xTimer, yTimer)
+            y = np.column_stack([xData.data[k] for k in keys])
 
             if dataName in angList:
-
-                newXData.columns[k] = Utilities.interpAngular(xTS, y, newXTS, fill_value=0)
+                newY = interpolator.angular(y)
 
                 # Some angular measurements (like SAS pointing) are + and -, and get converted
                 # to all +. Convert them back to - for 180-359
                 if dataName == "POINTING":
-                    pointingData = newXData.columns[k]
-                    for i, angle in enumerate(pointingData):
-                        if angle > 180:
-                            pointingData[i] = angle - 360
+                    newY = np.where(newY > 180, newY - 360, newY)
 
             elif dataName in fillList:
-                newXData.columns[k] = Utilities.interpFill(xTS,y,newXTS, fillValue=np.nan)
+                newY = interpolator.fill(y)
 
+            elif kind == 'cubic':
+                newY = interpolator.spline(y)
             else:
-                if kind == 'cubic':
-                    newXData.columns[k] = Utilities.interpSpline(xTS, y, newXTS)
-                else:
-                    newXData.columns[k] = Utilities.interp(xTS,y,newXTS, fill_value=np.nan)
+                newY = interpolator.linear(y)
+
+            for j, k in enumerate(keys):
+                newXData.columns[k] = newY[:, j]
 
         if ConfigFile.settings["bL1bPlotTimeInterp"] == 1 and dataName != 'T':
             print('Plotting time interpolations ' +dataName)
@@ -443,22 +432,9 @@ class ProcessL1b_Interp:
 
         # Perform interpolation on full hyperspectral time series
         #   In the case of solar geometries, calculate to new times, don't interpolate
-        if dataName == 'SOLAR_AZ':
-            sunAzimuthAnc = []
-
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", category=UserWarning)
-                for i, dt_utc in enumerate(yDatetime):
-                    sunAzimuthAnc.append(get_azimuth(latData.columns['NONE'][i],lonData.columns['NONE'][i],dt_utc,0))
-            xData.columns['NONE'] = sunAzimuthAnc
-        elif dataName == 'SZA':
-            sunZenithAnc = []
-
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", category=UserWarning)
-                for i, dt_utc in enumerate(yDatetime):
-                    sunZenithAnc.append(90 - get_altitude(latData.columns['NONE'][i],lonData.columns['NONE'][i],dt_utc,0))
-            xData.columns['NONE'] = sunZenithAnc
+        if dataName in ('SOLAR_AZ', 'SZA'):
+            sunAzimuthAnc, sunZenithAnc = SolarPosition.solarPosition(latData.columns['NONE'], lonData.columns['NONE'], yDatetime)
+            xData.columns['NONE'] = sunAzimuthAnc if dataName == 'SOLAR_AZ' else sunZenithAnc
         else:
             ProcessL1b_Interp.interpolateL1b_Interp(xData, xDatetime, yDatetime, xData, dataName, 'linear', fileName)
 
@@ -486,34 +462,21 @@ class ProcessL1b_Interp:
         columns.pop("Datetime")
 
         # Get wavelength values
-        wavelength = []
-        for k in columns:
-            wavelength.append(float(k))
-
-        x = np.asarray(wavelength)
+        x = np.asarray([float(k) for k in columns])
 
         newColumns = collections.OrderedDict()
         newColumns["Datetag"] = saveDatetag
         newColumns["Timetag2"] = saveTimetag2
         # Can leave Datetime off at this point
 
-        for i in range(newWavebands.shape[0]):
-            # limit to one decimal place
-            newColumns[str(round(10*newWavebands[i])/10)] = []
-
-        # Perform interpolation for each timestamp
-        for timeIndex in range(len(saveDatetag)):
-            values = []
-
-            for k in columns:
-                values.append(columns[k][timeIndex])
+        # Perform interpolation for all timestamps at once (cubic spline, as
+        # sp.interpolate.InterpolatedUnivariateSpline(x, y, k=3) for each spectrum)
+        y = np.column_stack([np.asarray(columns[k], dtype=np.float64) for k in columns])
+        new_y = Utilities.resampleSpectra(y, x, newWavebands)
 
-            y = np.asarray(values)
-            #new_y = sp.interpolate.interp1d(x, y)(newWavebands)
-            new_y = sp.interpolate.InterpolatedUnivariateSpline(x, y, k=3)(newWavebands)
-
-            for waveIndex in range(newWavebands.shape[0]):
-                newColumns[str(round(10*newWavebands[waveIndex])/10)].append(new_y[waveIndex])
+        for waveIndex in range(newWavebands.shape[0]):
+            # limit to one decimal place
+            newColumns[str(round(10*newWavebands[waveIndex])/10)] = new_y[:, waveIndex]
 
         newDS.columns = newColumns
         newDS.columnsToDataset()
@@ -11,38 +11,25 @@ class ProcessL1bqc:
     '''Process L1BQC'''
 
     @staticmethod
-    def interpolateColumn(columns, wl):
-        ''' Interpolate wavebands to estimate a single, unsampled waveband. This allows for QC filters
-            designed for nominal bands. '''
-        #print("interpolateColumn")
-        # Values to return
-        return_y = []
+    def interpolateBand(ds, wl):
+        ''' Interpolate the wavebands of a dataset (see HDFDataset.datasetToArrays) to estimate a
+            single, unsampled waveband. This allows for QC filters designed for nominal bands. '''
 
-        # Column to interpolate to
-        new_x = [wl]
+        # Perform interpolation for all rows at once (time x band)
+        return sp.interpolate.interp1d(ds.getWavelengths(), ds.bands, axis=1)([wl])[:,0]
 
-        # Get wavelength values
-        wavelength = []
-        for k in columns:
-            #print(k)
-            wavelength.append(float(k))
-        x = np.asarray(wavelength)
-
-        # get the length of a column
-        num = len(list(columns.values())[0])
-
-        # Perform interpolation for each row
-        for i in range(num):
-            values = []
-            for k in columns:
-                #print("b")
-                values.append(columns[k][i])
-            y = np.asarray(values)
-
-            new_y = sp.interpolate.interp1d(x, y)(new_x)
-            return_y.append(new_y[0])
+    @staticmethod
+    def bandBlock(ds, waveRange):
+        ''' The wavebands of a dataset strictly within waveRange as a (time x band) array '''
+        wavelength = ds.getWavelengths()
+        return ds.bands[:, (wavelength > waveRange[0]) & (wavelength < waveRange[1])]
 
-        return return_y
+    @staticmethod
+    def removeMask(referenceGroup, badTimes):
+        ''' (Es timestamps, records of badTimes in them). After L1B, RADIANCE, ANCILLARY and PY6S_MODEL
+            share these timestamps, so the mask is computed once for all of these groups '''
+        timeStamp = referenceGroup.getDataset("ES").data["Datetime"].copy()
+        return timeStamp, Utilities.badTimesMask(timeStamp, badTimes)
 
 
     @staticmethod
@@ -95,41 +82,24 @@ class ProcessL1bqc:
 
         ltData = sasGroup.getDataset("LT")
         ltData.datasetToColumns()
-        ltColumns = ltData.columns
-        # These get popped off the columns, but restored when filterData runs datasetToColumns
-        ltColumns.pop('Datetag')
-        ltColumns.pop('Timetag2')
-        ltDatetime = ltColumns.pop('Datetime')
-
-        badTimes = []
-        for indx, dateTime in enumerate(ltDatetime):
-            # If the Lt spectrum in the NIR is brighter than in the UVA, something is very wrong
-            UVA = [350,400]
-            NIR = [780,850]
-            ltUVA = []
-            ltNIR = []
-            for wave in ltColumns:
-                if float(wave) > UVA[0] and float(wave) < UVA[1]:
-                    ltUVA.append(ltColumns[wave][indx])
-                elif float(wave) > NIR[0] and float(wave) < NIR[1]:
-                    ltNIR.append(ltColumns[wave][indx])
-
-            if np.nanmean(ltUVA) < np.nanmean(ltNIR):
-                badTimes.append(dateTime)
-
-        badTimes = np.unique(badTimes)
-        # Duplicate each element to a list of two elements in a list
-        # BUG: This is not optimal as it creates one badTimes record for each bad
-        #    timestamp, rather than span of timestamps from badtimes[i][0] to badtimes[i][1]
-        badTimes = np.rot90(np.matlib.repmat(badTimes,2,1), 3)
-        msg = f'{len(np.unique(badTimes))/len(ltDatetime)*100:.1f}% of spectra flagged'
+        ltDatetime = ltData.getArray('Datetime')
+
+        # If the Lt spectrum in the NIR is brighter than in the UVA, something is very wrong
+        UVA = [350,400]
+        NIR = [780,850]
+        ltUVA = ProcessL1bqc.bandBlock(ltData, UVA)
+        ltNIR = ProcessL1bqc.bandBlock(ltData, NIR)
+        with np.errstate(invalid='ignore'):
+            badRecord = np.nanmean(ltUVA, axis=1) < np.nanmean(ltNIR, axis=1)
+
+        # One badTimes range per run of consecutive bad spectra
+        badTimes = Utilities.maskToBadTimes(badRecord, ltDatetime)
+        msg = f'{np.count_nonzero(badRecord)/len(ltDatetime)*100:.1f}% of spectra flagged'
         print(msg)
         Utilities.writeLogFile(msg)
 
         if len(badTimes) == 0:
             badTimes = None
-            # In case filterData does not need to be run:
-            ltData.datasetToColumns()
         return badTimes
 
     @staticmethod
@@ -143,88 +113,81 @@ class ProcessL1bqc:
 
         esData = refGroup.getDataset("ES")
         esData.datasetToColumns()
-        esColumns = esData.columns
-
-        esColumns.pop('Datetag')
-        esColumns.pop('Timetag2')
-        esTime = esColumns.pop('Datetime')
+        esTime = esData.getArray('Datetime')
 
         liData = sasGroup.getDataset("LI")
         liData.datasetToColumns()
-        liColumns = liData.columns
-        liColumns.pop('Datetag')
-        liColumns.pop('Timetag2')
-        liColumns.pop('Datetime')
-
-        ltData = sasGroup.getDataset("LT")
-        ltData.datasetToColumns()
-        ltColumns = ltData.columns
-        ltColumns.pop('Datetag')
-        ltColumns.pop('Timetag2')
-        ltColumns.pop('Datetime')
-
-        li750 = ProcessL1bqc.interpolateColumn(liColumns, 750.0)
-        es370 = ProcessL1bqc.interpolateColumn(esColumns, 370.0)
-        es470 = ProcessL1bqc.interpolateColumn(esColumns, 470.0)
-        es480 = ProcessL1bqc.interpolateColumn(esColumns, 480.0)
-        es680 = ProcessL1bqc.interpolateColumn(esColumns, 680.0)
-        es720 = ProcessL1bqc.interpolateColumn(esColumns, 720.0)
-        es750 = ProcessL1bqc.interpolateColumn(esColumns, 750.0)
-        badTimes = []
 
-        flags1 = ancGroup.datasets['MET_FLAGS'].columns['Flag1']
-        flags2 = ancGroup.datasets['MET_FLAGS'].columns['Flag2']
-        flags3 = ancGroup.datasets['MET_FLAGS'].columns['Flag3']
-        flags4 = ancGroup.datasets['MET_FLAGS'].columns['Flag4']
-        flags5 = ancGroup.datasets['MET_FLAGS'].columns['Flag5']
-
-        for indx, dateTime in enumerate(esTime):
-            # Flag spectra affected by clouds (Compare with 6S Es). Placeholder while under development
-            # Need to propagate 6S even in Default and Class for this to work
-            if py6sGroup is not None:
-                if li750[indx]/es750[indx] >= cloudFLAG:
-                    badTimes.append(dateTime)
-                    flags1[indx] = True
+        li750 = ProcessL1bqc.interpolateBand(liData, 750.0)
+        es370 = ProcessL1bqc.interpolateBand(esData, 370.0)
+        es470 = ProcessL1bqc.interpolateBand(esData, 470.0)
+        es480 = ProcessL1bqc.interpolateBand(esData, 480.0)
+        es680 = ProcessL1bqc.interpolateBand(esData, 680.0)
+        es720 = ProcessL1bqc.interpolateBand(esData, 720.0)
+        es750 = ProcessL1bqc.interpolateBand(esData, 750.0)
 
+        with np.errstate(divide='ignore', invalid='ignore'):
             # Flag spectra affected by clouds (Ruddick 2006, IOCCG Protocols).
-            if li750[indx]/es750[indx] >= cloudFLAG:
-                badTimes.append(dateTime)
-                flags2[indx] = True
-
-            # Flag for significant es
-            # Wernand 2002
-            if es480[indx] < esFlag:
-                badTimes.append(dateTime)
-                flags3[indx] = True
-
-            # Flag spectra affected by dawn/dusk radiation
-            # Wernand 2002
-            #v = esXSlice["470.0"][0] / esXSlice["610.0"][0] # Fix 610 -> 680
-            if es470[indx]/es680[indx] < dawnDuskFlag:
-                badTimes.append(dateTime)
-                flags4[indx] = True
-
-            # Flag spectra affected by rainfall and high humidity
-            # Wernand 2002 (940/370), Garaba et al. 2012 also uses Es(940/370), presumably 720 was developed by Wang...???
-            # NOTE: Follow up on the source of this flag
-            if es720[indx]/es370[indx] < humidityFlag:
-                badTimes.append(dateTime)
-                flags5[indx] = True
-
-        badTimes = np.unique(badTimes)
-        badTimes = np.rot90(np.matlib.repmat(badTimes,2,1), 3) # Duplicates each element to a list of two elements in a list
-        msg = f'{len(np.unique(badTimes))/len(esTime)*100:.1f}% of spectra flagged (not filtered)'
+            cloud = li750/es750 >= cloudFLAG
+            flags = {
+                # Flag spectra affected by clouds (Compare with 6S Es). Placeholder while under development
+                # Need to propagate 6S even in Default and Class for this to work
+                'Flag1': cloud if py6sGroup is not None else np.zeros(len(esTime), dtype=bool),
+                'Flag2': cloud,
+                # Flag for significant es
+                # Wernand 2002
+                'Flag3': es480 < esFlag,
+                # Flag spectra affected by dawn/dusk radiation
+                # Wernand 2002
+                'Flag4': es470/es680 < dawnDuskFlag,
+                # Flag spectra affected by rainfall and high humidity
+                # Wernand 2002 (940/370), Garaba et al. 2012 also uses Es(940/370), presumably 720 was developed by Wang...???
+                # NOTE: Follow up on the source of this flag
+                'Flag5': es720/es370 < humidityFlag,
+                }
+
+        for name, flag in flags.items():
+            metFlags = ancGroup.datasets['MET_FLAGS'].columns[name]
+            for indx in np.flatnonzero(flag):
+                metFlags[indx] = True
+
+        badRecord = np.any(list(flags.values()), axis=0)
+        badTimes = Utilities.maskToBadTimes(badRecord, esTime)
+        msg = f'{np.count_nonzero(badRecord)/len(esTime)*100:.1f}% of spectra flagged (not filtered)'
         print(msg)
         Utilities.writeLogFile(msg)
 
-        # Restore timestamps to columns (since it's not going to filterData, where it otherwise happens)
-        esData.datasetToColumns()
-        liData.datasetToColumns()
-        ltData.datasetToColumns()
         if len(badTimes) == 0:
             badTimes = None
         return badTimes
 
+    @staticmethod
+    def limitBadTimes(badRecord, timeStamp, values, limitName, failMsg, passMsg, printFail=True):
+        ''' badTimes ranges for the runs of records out of limits (badRecord), logged at the start and
+            end of each run '''
+        starts, stops = Utilities.maskRuns(badRecord)
+        badTimes = []
+        for start, stop in zip(starts, stops):
+            msg = f'{failMsg}: {round(values[start])}'
+            if printFail:
+                print(msg)
+            Utilities.writeLogFile(msg)
+            if stop < len(badRecord) - 1:
+                msg = f'{passMsg}: {round(values[stop + 1])}'
+                print(msg)
+                Utilities.writeLogFile(msg)
+                msg = f'   Flag data from TT2: {timeStamp[start]} to {timeStamp[stop]}'
+                Utilities.writeLogFile(msg)
+            badTimes.append([timeStamp[start], timeStamp[stop]])
+        msg = f'Percentage of data out of {limitName} limits: {round(100*np.count_nonzero(badRecord)/len(timeStamp))} %'
+        print(msg)
+        Utilities.writeLogFile(msg)
+
+        if len(stops) > 0 and stops[-1] == len(badRecord) - 1: # Records from a mid-point to the end are bad
+            msg = f'   Flag data from TT2: {timeStamp[starts[-1]]} to {timeStamp[stops[-1]]}'
+            Utilities.writeLogFile(msg)
+        return badTimes
+
     @staticmethod
     def QC(node):
         ''' Add model data. QC for wind, Lt, SZA, spectral outliers, and met filters'''
@@ -414,15 +377,15 @@ class ProcessL1bqc:
             msg = "Applying Lt(NIR)>Lt(UV) quality filtering to eliminate spectra."
             print(msg)
             Utilities.writeLogFile(msg)
-            # This is not well optimized for large files...
             badTimes = ProcessL1bqc.ltQuality(sasGroup)
 
-            # NOTE: There is a problem for individual timestamps in badTimes that will not match Darks from L1AQC data
-            #   Need to convert singleton start-stop records in badTimes to ranges of time to capture Darks in L1AQC data
+            # NOTE: badTimes are ranges spanning each run of consecutive bad spectra, so they also capture
+            #   the Darks in L1AQC data between those spectra. Isolated bad spectra are still single timestamps.
 
             if badTimes is not None:
-                print('Removing records... Can be slow for large files')
-                check = Utilities.filterData(referenceGroup, badTimes)
+                print('Removing records...')
+                removeMask = ProcessL1bqc.removeMask(referenceGroup, badTimes)
+                check = Utilities.filterData(referenceGroup, badTimes, removeMask=removeMask)
                 # check is now fraction removed
                 #   I.e., if >99% of the Es spectra from this entire file were remove, abort this file
                 if check > 0.99:
@@ -430,8 +393,8 @@ class ProcessL1bqc:
                     print(msg)
                     Utilities.writeLogFile(msg)
                     return False
-                Utilities.filterData(sasGroup, badTimes)
-                Utilities.filterData(ancGroup, badTimes)
+                Utilities.filterData(sasGroup, badTimes, removeMask=removeMask)
+                Utilities.filterData(ancGroup, badTimes, removeMask=removeMask)
 
                 # Filter L1AQC data for L1BQC criteria. badTimes start/stop
                 # are used to bracket the same spectral collections, though it
@@ -455,7 +418,7 @@ class ProcessL1bqc:
                     Utilities.filterData(ltGroup,badTimes,'L1AQC')
 
                 if py6sGroup is not None:
-                    Utilities.filterData(py6sGroup,badTimes)
+                    Utilities.filterData(py6sGroup, badTimes, removeMask=removeMask)
 
 
         # Filter low SZAs and high winds after interpolating model/ancillary data
@@ -464,59 +427,23 @@ class ProcessL1bqc:
         wind = ancGroup.getDataset("WINDSPEED").data["WINDSPEED"]
         timeStamp = ancGroup.datasets["WINDSPEED"].columns["Datetime"]
 
-        badTimes = None
-        i=0
-        start = -1
-        stop = []
-        for index, _ in enumerate(wind):
-            if wind[index] > maxWind:
-                i += 1
-                if start == -1:
-                    msg =f'High Wind: {round(wind[index])}'
-                    Utilities.writeLogFile(msg)
-                    start = index
-                stop = index
-                if badTimes is None:
-                    badTimes = []
-            else:
-                if start != -1:
-                    msg = f'Passed. Wind: {round(wind[index])}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    startstop = [timeStamp[start],timeStamp[stop]]
-                    msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                    # print(msg)
-                    Utilities.writeLogFile(msg)
-                    badTimes.append(startstop)
-                    start = -1
-            end_index = index
-        msg = f'Percentage of data out of Wind limits: {round(100*i/len(timeStamp))} %'
-        print(msg)
-        Utilities.writeLogFile(msg)
-
-        if start != -1 and stop == end_index: # Records from a mid-point to the end are bad
-            startstop = [timeStamp[start],timeStamp[stop]]
-            msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-            # print(msg)
-            Utilities.writeLogFile(msg)
-            if badTimes is None: # only one set of records
-                badTimes = [startstop]
-            else:
-                badTimes.append(startstop)
+        badRecord = np.asarray(wind) > maxWind
+        badTimes = ProcessL1bqc.limitBadTimes(badRecord, timeStamp, wind, 'Wind', 'High Wind', 'Passed. Wind', printFail=False)
 
-        if start==0 and stop==end_index: # All records are bad
+        if len(badRecord) > 0 and badRecord.all(): # All records are bad
             return False
 
         if badTimes is not None and len(badTimes) != 0:
             print('Removing records...')
-            check = Utilities.filterData(referenceGroup, badTimes)
+            removeMask = ProcessL1bqc.removeMask(referenceGroup, badTimes)
+            check = Utilities.filterData(referenceGroup, badTimes, removeMask=removeMask)
             if check > 0.99:
                 msg = "Too few spectra remaining. Abort."
                 print(msg)
                 Utilities.writeLogFile(msg)
                 return False
-            Utilities.filterData(sasGroup, badTimes)
-            Utilities.filterData(ancGroup, badTimes)
+            Utilities.filterData(sasGroup, badTimes, removeMask=removeMask)
+            Utilities.filterData(ancGroup, badTimes, removeMask=removeMask)
             # Filter L1AQC data for L1BQC criteria
             if ConfigFile.settings['SensorType'].lower() == 'seabird':
                 check = []
@@ -536,7 +463,7 @@ class ProcessL1bqc:
                 Utilities.filterData(liGroup,badTimes,'L1AQC')
                 Utilities.filterData(ltGroup,badTimes,'L1AQC')
             if py6sGroup is not None:
-                Utilities.filterData(py6sGroup,badTimes)
+                Utilities.filterData(py6sGroup, badTimes, removeMask=removeMask)
 
 
         # Filter SZAs
@@ -548,60 +475,24 @@ class ProcessL1bqc:
         # SZA = ancGroup.datasets["SZA"].columns["NONE"]
         timeStamp = ancGroup.datasets["SZA"].columns["Datetime"]
 
-        badTimes = None
-        i=0
-        start = -1
-        stop = []
-        for index, _ in enumerate(SZA):
-            if SZA[index] < SZAMin or SZA[index] > SZAMax:
-                i += 1
-                if start == -1:
-                    msg =f'Low SZA. SZA: {round(SZA[index])}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    start = index
-                stop = index
-                if badTimes is None:
-                    badTimes = []
-            else:
-                if start != -1:
-                    msg = f'Passed. SZA: {round(SZA[index])}'
-                    print(msg)
-                    Utilities.writeLogFile(msg)
-                    startstop = [timeStamp[start],timeStamp[stop]]
-                    msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-                    # print(msg)
-                    Utilities.writeLogFile(msg)
-                    badTimes.append(startstop)
-                    start = -1
-            end_index = index
-        msg = f'Percentage of data out of SZA limits: {round(100*i/len(timeStamp))} %'
-        print(msg)
-        Utilities.writeLogFile(msg)
-
-        if start != -1 and stop == end_index: # Records from a mid-point to the end are bad
-            startstop = [timeStamp[start],timeStamp[stop]]
-            msg = f'   Flag data from TT2: {startstop[0]} to {startstop[1]}'
-            # print(msg)
-            Utilities.writeLogFile(msg)
-            if badTimes is None: # only one set of records
-                badTimes = [startstop]
-            else:
-                badTimes.append(startstop)
+        SZA = np.asarray(SZA)
+        badRecord = (SZA < SZAMin) | (SZA > SZAMax)
+        badTimes = ProcessL1bqc.limitBadTimes(badRecord, timeStamp, SZA, 'SZA', 'Low SZA. SZA', 'Passed. SZA')
 
-        if start==0 and stop==end_index: # All records are bad
+        if len(badRecord) > 0 and badRecord.all(): # All records are bad
             return False
 
         if badTimes is not None and len(badTimes) != 0:
             print('Removing records...')
-            check = Utilities.filterData(referenceGroup, badTimes)
+            removeMask = ProcessL1bqc.removeMask(referenceGroup, badTimes)
+            check = Utilities.filterData(referenceGroup, badTimes, removeMask=removeMask)
             if check > 0.99:
                 msg = "Too few spectra remaining. Abort."
                 print(msg)
                 Utilities.writeLogFile(msg)
                 return False
-            Utilities.filterData(sasGroup, badTimes)
-            Utilities.filterData(ancGroup, badTimes)
+            Utilities.filterData(sasGroup, badTimes, removeMask=removeMask)
+            Utilities.filterData(ancGroup, badTimes, removeMask=removeMask)
             # Filter L1AQC data for L1BQC criteria
             if ConfigFile.settings['SensorType'].lower() == 'seabird':
                 check = []
@@ -621,7 +512,7 @@ class ProcessL1bqc:
                 Utilities.filterData(liGroup,badTimes,'L1AQC')
                 Utilities.filterData(ltGroup,badTimes,'L1AQC')
             if py6sGroup is not None:
-                    Utilities.filterData(py6sGroup,badTimes)
+                    Utilities.filterData(py6sGroup, badTimes, removeMask=removeMask)
 
        # Spectral Outlier Filter
         enableSpecQualityCheck = ConfigFile.settings['bL1bqcEnableSpecQualityCheck']
@@ -642,19 +533,20 @@ class ProcessL1bqc:
 
             if badTimes is not None:
                 print('Removing records...')
-                check = Utilities.filterData(referenceGroup, badTimes)
+                removeMask = ProcessL1bqc.removeMask(referenceGroup, badTimes)
+                check = Utilities.filterData(referenceGroup, badTimes, removeMask=removeMask)
                 if check > 0.99:
                     msg = "Too few spectra remaining. Abort."
                     print(msg)
                     Utilities.writeLogFile(msg)
                     return False
-                check = Utilities.filterData(sasGroup, badTimes)
+                check = Utilities.filterData(sasGroup, badTimes, removeMask=removeMask)
                 if check > 0.99:
                     msg = "Too few spectra remaining. Abort."
                     print(msg)
                     Utilities.writeLogFile(msg)
                     return False
-                check = Utilities.filterData(ancGroup, badTimes)
+                check = Utilities.filterData(ancGroup, badTimes, removeMask=removeMask)
                 if check > 0.99:
                     msg = "Too few spectra remaining. Abort."
                     print(msg)
@@ -680,7 +572,7 @@ class ProcessL1bqc:
                     Utilities.filterData(liGroup,badTimes,'L1AQC')
                     Utilities.filterData(ltGroup,badTimes,'L1AQC')
                 if py6sGroup is not None:
-                    Utilities.filterData(py6sGroup,badTimes)
+                    Utilities.filterData(py6sGroup, badTimes, removeMask=removeMask)
 
         # Next apply the Meteorological FLAGGING prior to slicing
         esData = referenceGroup.getDataset("ES")        
@@ -0,0 +1,155 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+from Source import PATH_TO_DATA
+from Source.ConfigFile import ConfigFile
+from Source.MainConfig import MainConfig
+from Source.Utilities import Utilities
+
+
+class Py6SCache:
+    ''' Disk cache of Py6S runs for ProcessL1b_FRMCal.
+
+    Neighbouring 3-minute bins and repeated processing of the same cruise run 6S for nearly
+    the same geometry, AOD and date. With ConfigFile.settings["bL1bPy6SCache"] on, the 6S
+    inputs are quantized (fL1bPy6SCacheSZA/Azimuth/AOD steps) and 6S is run at the quantized
+    values, so a cached result is exactly what a new run would give. Results are stored as one
+    .npz file per (month, day, solar_z, solar_a, view_a, aot550, wavelength grid) under
+    MainConfig.settings["py6sCacheDir"] (Data/Py6SCache by default); the least recently used
+    files are evicted beyond py6sCacheMaxMB. '''
+
+    # 6S outputs used in L1B
+    OUTPUTS = ('percent_direct_solar_irradiance', 'percent_diffuse_solar_irradiance',
+               'direct_solar_irradiance', 'diffuse_solar_irradiance', 'environmental_irradiance')
+
+    hits = 0
+    misses = 0
+    # Bytes of results in each cache directory as seen by this process: listed on the first save,
+    #   then counted up on each save, so the directory is only listed again to evict
+    cacheBytes = {}
+
+    @staticmethod
+    def isEnabled():
+        return int(ConfigFile.settings.get("bL1bPy6SCache", 0)) == 1
+
+    @staticmethod
+    def cacheDir():
+        cacheDir = MainConfig.settings.get("py6sCacheDir") or os.path.join(PATH_TO_DATA, 'Py6SCache')
+        os.makedirs(cacheDir, exist_ok=True)
+        return cacheDir
+
+    @staticmethod
+    def quantize(value, step):
+        step = float(step)
+        if step <= 0:
+            return float(value)
+        # round() of the number of steps, then trimmed of binary noise for a stable key
+        return float(np.round(np.round(float(value)/step)*step, 6))
+
+    # 6S inputs for a bin, quantized when the cache is on
+    @staticmethod
+    def inputs(month, day, solar_z, solar_a, view_a, aot550):
+        inputs = {'month': int(month), 'day': int(day), 'solar_z': float(solar_z), 'solar_a': float(solar_a),
+                  'view_a': float(view_a), 'aot550': float(aot550)}
+        if Py6SCache.isEnabled():
+            for k, step in (('solar_z', "fL1bPy6SCacheSZA"), ('solar_a', "fL1bPy6SCacheAzimuth"),
+                            ('view_a', "fL1bPy6SCacheAzimuth"), ('aot550', "fL1bPy6SCacheAOD")):
+                inputs[k] = Py6SCache.quantize(inputs[k], ConfigFile.settings[step])
+        return inputs
+
+    @staticmethod
+    def filePath(inputs, wvl):
+        sha = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode())
+        sha.update(np.ascontiguousarray(wvl, dtype=np.float64).tobytes())
+        # Fixed parts of the 6S configuration in ProcessL1b_FRMCal.runPy6S
+        sha.update(b'MidlatitudeSummer/Maritime/sea level/view_z 180/geometry date')
+        return os.path.join(Py6SCache.cacheDir(), sha.hexdigest() + '.npz')
+
+    @staticmethod
+    def load(inputs, wvl):
+        fp = Py6SCache.filePath(inputs, wvl)
+        try:
+            with np.load(fp) as f:
+                res = {k: f[k] for k in Py6SCache.OUTPUTS}
+        except (OSError, KeyError, ValueError):
+            Py6SCache.misses += 1
+            return None
+        # Mark as recently used for the eviction. The result is already read, so a file
+        #   evicted or made read-only by another worker meanwhile is still a hit, just not refreshed
+        try:
+            os.utime(fp)
+        except OSError:
+            pass
+        Py6SCache.hits += 1
+        return res
+
+    @staticmethod
+    def save(inputs, wvl, res):
+        fp = Py6SCache.filePath(inputs, wvl)
+        try:
+            oldSize = os.path.getsize(fp)
+        except OSError:
+            oldSize = 0
+        # Write then rename, so parallel batch workers never read a partial file
+        fd, tmpPath = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(fp))
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **{k: np.asarray(res[k], dtype=np.float64) for k in Py6SCache.OUTPUTS})
+        size = os.path.getsize(tmpPath)
+        os.replace(tmpPath, fp)
+
+        cacheDir = os.path.dirname(fp)
+        if cacheDir in Py6SCache.cacheBytes:
+            Py6SCache.cacheBytes[cacheDir] += size - oldSize
+        else:
+            Py6SCache.cacheBytes[cacheDir] = sum(e[1] for e in Py6SCache.entries(cacheDir))
+        if Py6SCache.cacheBytes[cacheDir] > Py6SCache.maxBytes():
+            Py6SCache.evict(cacheDir)
+
+    @staticmethod
+    def maxBytes():
+        return float(MainConfig.settings.get("py6sCacheMaxMB", 200)) * 1024**2
+
+    # (mtime, size, name) of the results in cacheDir
+    @staticmethod
+    def entries(cacheDir):
+        entries = []
+        for name in os.listdir(cacheDir):
+            if name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(cacheDir, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    # Deletes the least recently used results down to 90% of the size limit, so that the
+    #   next saves do not list the directory again
+    @staticmethod
+    def evict(cacheDir):
+        entries = Py6SCache.entries(cacheDir)
+        total = sum(e[1] for e in entries)
+        target = 0.9*Py6SCache.maxBytes()
+        for _, size, name in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(cacheDir, name))
+            except OSError:
+                pass
+            total -= size
+        Py6SCache.cacheBytes[cacheDir] = total
+
+    @staticmethod
+    def resetStats():
+        Py6SCache.hits = 0
+        Py6SCache.misses = 0
+
+    @staticmethod
+    def logStats():
+        if Py6SCache.isEnabled():
+            msg = f'Py6S cache: {Py6SCache.hits} hits, {Py6SCache.misses} misses'
+            print(msg)
+            Utilities.writeLogFile(msg)
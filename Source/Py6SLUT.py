@@ -0,0 +1,151 @@
+import os
+import functools
+import h5py
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from Source import PATH_TO_DATA
+from Source.ConfigFile import ConfigFile
+from Source.Py6SCache import Py6SCache
+from Source.Utilities import Utilities
+
+
+class Py6SLUT:
+    ''' Precomputed 6S direct/diffuse irradiance table for ProcessL1b_FRMCal.
+
+    With ConfigFile.settings["bL1bPy6SLUT"] on, the Py6SCache.OUTPUTS of all 3-minute bins are
+    interpolated from the table in ConfigFile.settings["Py6SLUTFile"] (Data/Py6S_LUT.hdf by
+    default) instead of running 6S: multilinear in 1/cos(SZA), relative azimuth and AOD (the
+    direct irradiance in log), then linear in wavelength. The table is built and checked against 6S with Source/WritePy6SLUT.py.
+
+    Layout of the HDF5 file:
+        solar_z, rel_az, aot550, wavelength: grid axes (deg, deg, -, nm)
+        <output>: float32 (solar_z, rel_az, aot550, wavelength) for each of Py6SCache.OUTPUTS
+    Irradiances are stored at 1 AU and scaled to the date with the 6S Earth-Sun distance
+    (VARSOL), the only date dependence of these outputs for the fixed atmosphere. '''
+
+    AXES = ('solar_z', 'rel_az', 'aot550')
+    IRRADIANCES = ('direct_solar_irradiance', 'diffuse_solar_irradiance', 'environmental_irradiance')
+    TINY = 1e-30
+
+    @staticmethod
+    def isEnabled():
+        return int(ConfigFile.settings.get("bL1bPy6SLUT", 0)) == 1
+
+    @staticmethod
+    def filePath():
+        return ConfigFile.settings.get("Py6SLUTFile") or os.path.join(PATH_TO_DATA, 'Py6S_LUT.hdf')
+
+    @staticmethod
+    def earthSunFactor(month, day):
+        ''' 6S VARSOL: solar irradiance factor (1/d^2, d in AU) for month and day arrays '''
+        month = np.asarray(month, dtype=np.int64)
+        day = np.asarray(day, dtype=np.int64)
+        # Day of year as 6S counts it (integer division of the Fortran code)
+        j = np.where(month <= 2, 31*(month - 1) + day,
+                     np.where(month > 8, 31*(month - 1) - (month - 2)//2 - 2 + day,
+                              31*(month - 1) - (month - 1)//2 - 2 + day))
+        om = np.deg2rad(0.9856*(j - 4))
+        return 1.0/(1.0 - 0.01673*np.cos(om))**2
+
+    @staticmethod
+    def relativeAzimuth(solar_a, view_a):
+        ''' 6S relative azimuth folded to 0-180 deg '''
+        phi = np.abs(np.asarray(solar_a, dtype=np.float64) - np.asarray(view_a, dtype=np.float64)) % 360
+        return np.where(phi > 180, 360 - phi, phi)
+
+    # Interpolation coordinate of an axis: SZA as 1/cos(SZA) (air mass), in which the log of the
+    #   direct irradiance is linear (Beer-Lambert)
+    @staticmethod
+    def coordinate(name, values):
+        if name == 'solar_z':
+            return 1.0/np.cos(np.deg2rad(values))
+        return values
+
+    @staticmethod
+    def write(fp, axes, wavelength, results, attributes=None):
+        ''' Writes a table; results: {output: array (solar_z, rel_az, aot550, wavelength)} with
+            irradiances at 1 AU '''
+        with h5py.File(fp, 'w') as f:
+            for name in Py6SLUT.AXES:
+                f.create_dataset(name, data=np.asarray(axes[name], dtype=np.float64))
+            f.create_dataset('wavelength', data=np.asarray(wavelength, dtype=np.float64))
+            for k in Py6SCache.OUTPUTS:
+                f.create_dataset(k, data=np.asarray(results[k], dtype=np.float32),
+                                 compression='gzip', shuffle=True)
+            for k, v in (attributes or {}).items():
+                f.attrs[k] = v
+
+    @staticmethod
+    def read(fp):
+        ''' Returns (axes, wavelength, results) of a table '''
+        with h5py.File(fp, 'r') as f:
+            axes = {name: f[name][()] for name in Py6SLUT.AXES}
+            wavelength = f['wavelength'][()]
+            results = {k: f[k][()].astype(np.float64) for k in Py6SCache.OUTPUTS}
+        return axes, wavelength, results
+
+    # Loaded once per file and modification time
+    @staticmethod
+    @functools.lru_cache(maxsize=2)
+    def load(fp, mtime):
+        axes, wavelength, results = Py6SLUT.read(fp)
+        # Axes with a single node (e.g. one relative azimuth) are constant in that input
+        keep = [name for name in Py6SLUT.AXES if len(axes[name]) > 1]
+        drop = tuple(i for i, name in enumerate(Py6SLUT.AXES) if len(axes[name]) == 1)
+        # Direct irradiance is interpolated in log: exact for its exponential attenuation in AOD
+        values = np.stack([np.log(np.maximum(results[k], Py6SLUT.TINY)) if k == 'direct_solar_irradiance' else results[k]
+                           for k in Py6SCache.OUTPUTS], axis=-1).squeeze(axis=drop)
+        grid = tuple(Py6SLUT.coordinate(name, axes[name]) for name in keep)
+        interpolator = RegularGridInterpolator(grid, values) if keep else None
+        return keep, axes, wavelength, values, interpolator
+
+    @staticmethod
+    def interpolate(month, day, solar_z, solar_a, view_a, aot550, wvl, fp=None):
+        ''' Py6SCache.OUTPUTS as (bins x wvl) arrays for arrays of 6S inputs (see Py6SCache.inputs);
+            inputs beyond the table are clamped to its edges. None if the table file is missing. '''
+        if fp is None:
+            fp = Py6SLUT.filePath()
+        if not os.path.isfile(fp):
+            msg = f'Py6SLUT: table not found: {fp}. Check the Py6SLUTFile setting or build the table with Source/WritePy6SLUT.py.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return None
+        keep, axes, wavelength, values, interpolator = Py6SLUT.load(fp, os.path.getmtime(fp))
+
+        inputs = {'solar_z': np.asarray(solar_z, dtype=np.float64),
+                  'rel_az': Py6SLUT.relativeAzimuth(solar_a, view_a),
+                  'aot550': np.asarray(aot550, dtype=np.float64)}
+        points = []
+        for name in keep:
+            clipped = np.clip(inputs[name], axes[name][0], axes[name][-1])
+            nClipped = np.count_nonzero(clipped != inputs[name])
+            if nClipped:
+                msg = f'Py6SLUT: {nClipped} {name} values beyond the table ({axes[name][0]}-{axes[name][-1]}). Clamped.'
+                print(msg)
+                Utilities.writeLogFile(msg)
+            points.append(Py6SLUT.coordinate(name, clipped))
+        wvl = np.asarray(wvl, dtype=np.float64)
+        if wvl.min() < wavelength[0] or wvl.max() > wavelength[-1]:
+            msg = f'Py6SLUT: bands beyond the table ({wavelength[0]}-{wavelength[-1]} nm) take the edge values.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+
+        # (bins, table wavelengths, outputs)
+        if interpolator is not None:
+            values = interpolator(np.column_stack(points))
+        else:
+            values = np.broadcast_to(values, (len(inputs['solar_z']),) + values.shape)
+        # One resampling of all bins and outputs: (bins, outputs, bands)
+        nBins = values.shape[0]
+        values = np.ascontiguousarray(np.moveaxis(values, -1, 1)).reshape(-1, len(wavelength))
+        values = Utilities.resampleSpectra(values, wavelength, wvl, 'linear').reshape(nBins, -1, len(wvl))
+        factor = Py6SLUT.earthSunFactor(month, day)[:, None]
+        res = {}
+        for i, k in enumerate(Py6SCache.OUTPUTS):
+            res[k] = values[:, i, :]
+            if k == 'direct_solar_irradiance':
+                res[k] = np.exp(res[k])
+            if k in Py6SLUT.IRRADIANCES:
+                res[k] = res[k]*factor
+        return res
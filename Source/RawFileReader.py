@@ -1,4 +1,9 @@
 """Read raw Sea-Bird file"""
+import bisect
+import collections
+import mmap
+import os
+import re
 import sys
 
 from Source.Utilities import Utilities
@@ -9,6 +14,7 @@ class RawFileReader:
     MAX_BLOCK_READ = 1024
     SATHDR_READ = 128
     RESET_TAG_READ = MAX_TAG_READ-16
+    SCAN_CHUNK = 16*1024*1024
 
     # Function for reading SATHDR (Header) messages
     # Messages are in format: SATHDR <Value> (<Name>)\r\n
@@ -37,92 +43,219 @@ class RawFileReader:
             str1 = "Missing"
         return (str2, str1)
 
+    # Builds one compiled pattern that finds every offset where a frame tag
+    # (SATHDR or any calibration file id) starts. Tags are upper case and the
+    # pattern is run on upper-cased data, matching the case-insensitive test in
+    # the reader. When one tag can start inside another, a lookahead is used so
+    # that overlapping candidates are not lost.
+    @staticmethod
+    def compileFrameTags(calibrationMap):
+        tags = [b"SATHDR"] + [cf.id.upper().encode("utf-8") for cf in calibrationMap.values()]
+        tags = [tag for tag in tags if len(tag) > 0]
+
+        overlap = False
+        for a in tags:
+            for k in range(1, len(a)):
+                if any(b.startswith(a[k:]) or a[k:].startswith(b) for b in tags):
+                    overlap = True
+
+        pattern = b"|".join(re.escape(tag) for tag in tags)
+        if overlap:
+            pattern = b"(?=" + pattern + b")"
+        return re.compile(pattern), max(len(tag) for tag in tags)
+
+    # Returns the sorted offsets of all frame tag candidates in buf[start:stop] in
+    # one pass (tags may run past stop). The buffer is upper-cased in chunks to
+    # bound memory on day-long files.
+    @staticmethod
+    def scanFrameTags(buf, calibrationMap, start=0, stop=None):
+        pattern, maxTagLen = RawFileReader.compileFrameTags(calibrationMap)
+        if stop is None:
+            stop = len(buf)
+        candidates = []
+        for chunkStart in range(start, stop, RawFileReader.SCAN_CHUNK):
+            chunkStop = min(chunkStart+RawFileReader.SCAN_CHUNK, stop)
+            chunk = buf[chunkStart:chunkStop+maxTagLen-1].upper()
+            candidates.extend(chunkStart + m.start() for m in pattern.finditer(chunk)
+                              if chunkStart + m.start() < chunkStop)
+        return candidates
+
     # Reads a raw file
+    # The whole file is memory-mapped and frame tags are located in a single
+    # regex pass. The cursor then walks the candidate offsets with exactly the
+    # same window/advance rules as the original 32-byte tag reader, so the
+    # frames dispatched (and the L1A output) are unchanged, but bytes that cannot
+    # start a frame are never examined in Python. Fixed-length frames are decoded
+    # in batches by CalibrationFile.convertRawFrames, the rest by convertRaw.
     @staticmethod
     def readRawFile(filepath, calibrationMap, contextMap, root):
+        if os.path.getsize(filepath) == 0:
+            return
 
-        posframe = 1
+        state = RawReadState(calibrationMap)
+        with open(filepath, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            RawFileReader.readFrames(buf, state, calibrationMap, contextMap, root, final=True)
 
-        # Note: Prosoft adds posframe=1 to the GPS for some reason
-        # print(contextMap.keys())
-        #gpsGroup = contextMap["$GPRMC"]
-        #ds = gpsGroup.getDataset("POSFRAME")
-        #ds.appendColumn(u"COUNT", posframe)
-        posframe += 1
-
-        with open(filepath, 'rb') as f:
-            while 1:
-                # Reads binary file to find message frame tag
-                pos = f.tell()
-                b = f.read(RawFileReader.MAX_TAG_READ)
-                f.seek(pos)
-
-                if "SATHSE" in str(b):
-                    pass
-                if not b:
+    # Decodes the frames of buf from state.pos on and updates state, so a file
+    # that is still growing can be read in several calls (see RawFileStream).
+    # Unless final, decoding stops where a frame could still be incomplete, and
+    # every decision only uses bytes that are already in buf, so reading an
+    # append-only file in steps gives the same result as reading it at once.
+    @staticmethod
+    def readFrames(buf, state, calibrationMap, contextMap, root, final=False):
+        size = len(buf)
+        if final:
+            limit = size
+            scanStop = size
+        else:
+            limit = size - RawFileReader.MAX_BLOCK_READ - RawFileReader.SATHDR_READ
+            scanStop = size - state.maxTagLen + 1
+        if scanStop > state.scanned:
+            state.candidates.extend(RawFileReader.scanFrameTags(buf, calibrationMap, state.scanned, scanStop))
+            state.scanned = scanStop
+        candidates = state.candidates
+        nCandidates = len(candidates)
+        batches = state.batches
+        posframe = state.posframe
+
+        pos = state.pos
+        while pos < limit:
+            # Window of MAX_TAG_READ bytes starting at the file position
+            start = pos
+            b = buf[start:start+RawFileReader.MAX_TAG_READ]
+
+            # Skip windows that contain no candidate: the byte-wise reader
+            # advances RESET_TAG_READ bytes at a time until one does.
+            c = bisect.bisect_left(candidates, start)
+            lastTest = start + RawFileReader.MAX_TAG_READ - 2
+            if c == nCandidates:
+                if final:
                     break
+                # Skip only the windows known to be empty so far
+                known = state.scanned - lastTest
+                if known > 0:
+                    pos = start + -(-known // RawFileReader.RESET_TAG_READ)*RawFileReader.RESET_TAG_READ
+                break
+            if candidates[c] > lastTest:
+                skip = -(-(candidates[c] - lastTest) // RawFileReader.RESET_TAG_READ)
+                pos = min(start + skip*RawFileReader.RESET_TAG_READ, size)
+                continue
 
-                #print b
-                for i in range(0, RawFileReader.MAX_TAG_READ):
-                    testString = b[i:].upper()
-                    #print("test: ", testString[:6])
+            frameFound = False
+            while c < nCandidates and candidates[c] <= lastTest:
+                i = candidates[c] - start
+                c += 1
+                testString = b[i:].upper()
 
-                    # Reset file position on max read
-                    if i == RawFileReader.MAX_TAG_READ-1:
-                        #f.read(RawFileReader.MAX_TAG_READ)
-                        f.read(RawFileReader.RESET_TAG_READ)
-                        break
+                # Detects message type from frame tag
+                if testString.startswith(b"SATHDR"):
+                    pos = min(pos + i, size)
+                    hdr = buf[pos:pos+RawFileReader.SATHDR_READ]
+                    pos = min(pos + RawFileReader.SATHDR_READ, size)
+                    (k,v) = RawFileReader.readSATHDR(hdr)
+                    root.attributes[k] = v
+                    frameFound = True
+                    break
 
-                    # Detects message type from frame tag
-                    if testString.startswith(b"SATHDR"):
-                        #print("SATHDR")
-                        if i > 0:
-                            f.read(i)
-                        hdr = f.read(RawFileReader.SATHDR_READ)
-                        (k,v) = RawFileReader.readSATHDR(hdr)
-                        root.attributes[k] = v
+                num = 0
+                for tag, key in state.tagKeys:
+                    if testString.startswith(tag):
+                        cf = calibrationMap[key]
+                        pos = min(pos + i, size)
+                        msg = buf[pos:pos+RawFileReader.MAX_BLOCK_READ]
 
-                        break
-                    else:
-                        num = 0
-                        for key in calibrationMap:
-                            cf = calibrationMap[key]
-                            if testString.startswith(cf.id.upper().encode("utf-8")):
-                                if i > 0:
-                                    f.read(i)
-
-                                pos = f.tell()
-                                msg = f.read(RawFileReader.MAX_BLOCK_READ)
-                                f.seek(pos)
-
-                                gp = contextMap[cf.id]
-                                # Only the first time through
-                                if len(gp.attributes) == 0:
-                                    #gp.id += "_" + cf.id
-                                    gp.id = key
-                                    gp.attributes["CalFileName"] = key
-                                    gp.attributes["FrameTag"] = cf.id
-
-                                # if key.startswith('SATPYR'):
-                                #     print('curious...')
-
-                                try:
-                                    num = cf.convertRaw(msg, gp)
-                                except Exception:
-                                    pmsg = f'Unable to convert the following raw message: {msg}'
-                                    print(pmsg)
-                                    Utilities.writeLogFile(pmsg)
-
-                                if num >= 0:
-                                    # Generate POSFRAME
-                                    ds = gp.getDataset("POSFRAME")
-                                    if ds is None:
-                                        ds = gp.addDataset("POSFRAME")
-                                    ds.appendColumn("COUNT", posframe)
-                                    posframe += 1
-                                    f.read(num)
+                        gp = contextMap[cf.id]
+                        # Only the first time through
+                        if len(gp.attributes) == 0:
+                            gp.id = key
+                            gp.attributes["CalFileName"] = key
+                            gp.attributes["FrameTag"] = cf.id
 
+                        # Fixed-length frames: convert the ASCII fields now and
+                        # queue the bytes for one vectorized decode per frame type
+                        if cf.frameDtype is not None and len(msg) >= cf.frameLength:
+                            try:
+                                values = cf.convertFrameFields(msg)
+                            except Exception:
+                                values = None
+                            if values is not None:
+                                batch = batches.setdefault(key, ([], [], []))
+                                batch[0].append(msg[:cf.frameLength])
+                                batch[1].append(values)
+                                batch[2].append(posframe)
+                                posframe += 1
+                                num = cf.frameLength
+                                pos = min(pos + num, size)
                                 break
-                        if num > 0:
-                            break
-                        
\ No newline at end of file
+
+                        # Anything else goes through convertRaw, after the queued
+                        # frames so that rows stay in file order
+                        if key in batches:
+                            RawFileReader.flushFrames(cf, gp, batches.pop(key))
+
+                        try:
+                            num = cf.convertRaw(msg, gp)
+                        except Exception:
+                            pmsg = f'Unable to convert the following raw message: {msg}'
+                            print(pmsg)
+                            Utilities.writeLogFile(pmsg)
+
+                        if num >= 0:
+                            # Generate POSFRAME
+                            ds = gp.getDataset("POSFRAME")
+                            if ds is None:
+                                ds = gp.addDataset("POSFRAME")
+                            ds.appendColumn("COUNT", posframe)
+                            posframe += 1
+                            pos = min(pos + num, size)
+
+                        break
+                if num > 0:
+                    frameFound = True
+                    break
+
+            # Reset file position on max read
+            if not frameFound:
+                pos = min(pos + RawFileReader.RESET_TAG_READ, size)
+
+        for key, batch in batches.items():
+            cf = calibrationMap[key]
+            RawFileReader.flushFrames(cf, contextMap[cf.id], batch)
+        batches.clear()
+
+        # Candidates behind the cursor are no longer needed
+        del candidates[:bisect.bisect_left(candidates, pos)]
+        state.pos = pos
+        state.posframe = posframe
+
+    # Decodes queued fixed-length frames of one calibration file and adds
+    # their POSFRAME counts
+    @staticmethod
+    def flushFrames(cf, gp, batch):
+        (frames, frameValues, posframes) = batch
+        cf.convertRawFrames(frames, frameValues, gp)
+        ds = gp.getDataset("POSFRAME")
+        if ds is None:
+            ds = gp.addDataset("POSFRAME")
+        ds.extendColumn("COUNT", posframes)
+
+
+class RawReadState:
+    """Position and pending frames of a raw file read in several steps"""
+
+    def __init__(self, calibrationMap):
+        # Note: Prosoft adds posframe=1 to the GPS for some reason
+        # print(contextMap.keys())
+        #gpsGroup = contextMap["$GPRMC"]
+        #ds = gpsGroup.getDataset("POSFRAME")
+        #ds.appendColumn(u"COUNT", posframe)
+        self.posframe = 2
+        self.pos = 0
+        self.candidates = []
+        self.scanned = 0
+        self.batches = collections.OrderedDict()
+        self.tagKeys = [(cf.id.upper().encode("utf-8"), key) for key, cf in calibrationMap.items()]
+        self.maxTagLen = RawFileReader.compileFrameTags(calibrationMap)[1]
+        for cf in calibrationMap.values():
+            cf.compileFrame()
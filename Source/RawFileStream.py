@@ -0,0 +1,104 @@
+"""Read a raw Sea-Bird file while it is still being written"""
+import copy
+import mmap
+import os
+import time
+
+from Source.ConfigFile import ConfigFile
+from Source.ProcessL1a import ProcessL1a
+from Source.ProcessL1aqc import ProcessL1aqc
+from Source.RawFileReader import RawFileReader, RawReadState
+from Source.Utilities import Utilities
+
+
+class RawFileStream:
+    """Follows a growing raw file (e.g. SolarTracker/pySAS logging on ship), decoding only the
+    newly appended frames on each poll into the same structures ProcessL1a builds from a
+    complete file, so the final L1A is identical to processing the closed file."""
+
+    def __init__(self, fp, calibrationMap):
+        self.fp = fp
+        self.calibrationMap = calibrationMap
+        self.root, self.contextMap = ProcessL1a.startL1a(fp, calibrationMap)
+        self.state = RawReadState(calibrationMap)
+        self.size = 0
+
+    # Decodes the frames appended since the last poll; returns the number of new bytes.
+    #   Frames near the end of the file wait for the next poll unless final.
+    def poll(self, final=False):
+        size = os.path.getsize(self.fp)
+        if size == 0 or (size == self.size and not final):
+            return 0
+        with open(self.fp, 'rb') as f, \
+                mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as buf:
+            RawFileReader.readFrames(buf, self.state, self.calibrationMap, self.contextMap, self.root, final)
+        grown = size - self.size
+        self.size = size
+        return grown
+
+    # L1A root of everything decoded so far (None if it cannot be built yet); the stream is not modified
+    def snapshot(self):
+        root = copy.deepcopy(self.root)
+        contextMap = copy.deepcopy(self.contextMap)
+        return ProcessL1a.finishL1a(root, contextMap, self.calibrationMap)
+
+    # Decodes the rest of the file and returns the final L1A root
+    def finish(self):
+        self.poll(final=True)
+        return ProcessL1a.finishL1a(self.root, self.contextMap, self.calibrationMap)
+
+    @staticmethod
+    def follow(fp, calibrationMap, pathOut, pollInterval=5, quickLookInterval=300, idleTimeout=600,
+               ancillaryData=None):
+        ''' Follows fp until it has not grown for idleTimeout seconds. Every quickLookInterval
+        seconds the L1A decoded so far (and its L1AQC, when ancillaryData are given) is written to
+        pathOut/L1A and pathOut/L1AQC under the usual file names; the complete L1A is written and
+        returned at the end. '''
+        fileName = os.path.splitext(os.path.split(fp)[1])[0]
+        outL1A = os.path.join(pathOut, 'L1A', f'{fileName}_L1A.hdf')
+        outL1AQC = os.path.join(pathOut, 'L1AQC', f'{fileName}_L1AQC.hdf')
+        for level in ('L1A', 'L1AQC'):
+            os.makedirs(os.path.join(pathOut, level), exist_ok=True)
+
+        Utilities.openLog(f'{fileName}_L1A.log')
+        try:
+            stream = RawFileStream(fp, calibrationMap)
+            lastGrowth = lastQuickLook = time.time()
+            while time.time() - lastGrowth < idleTimeout:
+                if stream.poll():
+                    lastGrowth = time.time()
+                if time.time() - lastQuickLook >= quickLookInterval:
+                    lastQuickLook = time.time()
+                    RawFileStream.writeQuickLook(stream.snapshot(), calibrationMap, outL1A, outL1AQC, ancillaryData)
+                time.sleep(pollInterval)
+
+            msg = f'RawFileStream: {fp} idle for {idleTimeout} s. Finishing L1A.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+            root = stream.finish()
+            if root is not None:
+                root.writeHDF5(outL1A, **ConfigFile.getHDFWriteOptions())
+            return root
+        finally:
+            Utilities.closeLog()
+
+    @staticmethod
+    def writeQuickLook(root, calibrationMap, outL1A, outL1AQC, ancillaryData=None):
+        if root is None:
+            msg = 'RawFileStream: not enough data for an L1A quick-look yet.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+            return
+        root.writeHDF5(outL1A, **ConfigFile.getHDFWriteOptions())
+        msg = f'RawFileStream: L1A quick-look written: {outL1A}'
+        print(msg)
+        Utilities.writeLogFile(msg)
+
+        if ancillaryData is not None:
+            # L1AQC gets the L1A exactly as it would read it back from file; it trims the ancillary data
+            l1aqcRoot = ProcessL1aqc.processL1aqc(root.copyInMemory(), calibrationMap, copy.deepcopy(ancillaryData))
+            if l1aqcRoot is not None:
+                l1aqcRoot.writeHDF5(outL1AQC, **ConfigFile.getHDFWriteOptions())
+                msg = f'RawFileStream: L1AQC quick-look written: {outL1AQC}'
+                print(msg)
+                Utilities.writeLogFile(msg)
@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import hashlib
+
+from Source import PATH_TO_CONFIG
+from Source.ConfigFile import ConfigFile
+from Source.MainConfig import MainConfig
+from Source.Py6SLUT import Py6SLUT
+
+
+class ReprocessCache:
+    ''' Content-addressed record of processed outputs, so unchanged files are not reprocessed.
+
+    For each output HDF file a small JSON record is kept in <pathOut>/Cache/<level>/ with the
+    hash of the input file, of the ConfigFile.settings keys the level depends on, of the
+    calibration/ancillary/SeaBASS header files and the HyperCP version. A level is skipped when all of these
+    and the output file itself are unchanged. Since an output that is rewritten changes the
+    input hash of the next level, reprocessing restarts from the earliest level whose
+    dependencies changed. One record per output keeps parallel batch workers independent. '''
+
+    # ConfigFile.settings keys each level depends on (besides COMMON_KEYS)
+    LEVEL_KEYS = {
+        'L1A': re.compile(r'^[bf]L1a(?!qc)'),
+        'L1AQC': re.compile(r'^[bf]L1aqc'),
+        'L1B': re.compile(r'^([bf]L1b(?!qc)|FullCalDir$|RadCalDir$|FidRadDB$|Py6SLUTFile$)'),
+        'L1BQC': re.compile(r'^[bf]L1bqc'),
+        'L2': re.compile(r'^([bf]L2|seaBASSHeaderFileName$)')}
+    # Sensor, solar ephemeris and output format settings affect every level
+    COMMON_KEYS = re.compile(r'^(SensorType|CalibrationFiles|SolarEphemeris$|HDFCompression|[bf]HDF)')
+
+    # (path, size, mtime) -> sha256 of files already hashed by this process
+    hashes = {}
+
+    @staticmethod
+    def isEnabled():
+        return int(MainConfig.settings.get("reprocessCache", 0)) == 1
+
+    # TriOS L1A (many outputs per call) and L2 station extraction (one output per station) are not cached
+    @staticmethod
+    def applies(inFilePath, level, flag_Trios):
+        if flag_Trios and level == 'L1A':
+            return False
+        if level == 'L2' and ConfigFile.settings["bL2Stations"] == 1:
+            return False
+        return isinstance(inFilePath, str) and os.path.isfile(inFilePath)
+
+    @staticmethod
+    def fileHash(fp):
+        stat = os.stat(fp)
+        key = (os.path.abspath(fp), stat.st_size, stat.st_mtime_ns)
+        if key not in ReprocessCache.hashes:
+            sha = hashlib.sha256()
+            with open(fp, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+            ReprocessCache.hashes[key] = sha.hexdigest()
+        return ReprocessCache.hashes[key]
+
+    # Hash of the files directly inside a directory (not recursive)
+    @staticmethod
+    def directoryHash(dirPath):
+        sha = hashlib.sha256()
+        if os.path.isdir(dirPath):
+            for name in sorted(os.listdir(dirPath)):
+                fp = os.path.join(dirPath, name)
+                if os.path.isfile(fp):
+                    sha.update(name.encode())
+                    sha.update(ReprocessCache.fileHash(fp).encode())
+        return sha.hexdigest()
+
+    # Output path written by Controller.processSingleLevel for this input and level
+    @staticmethod
+    def outputPath(pathOut, inFilePath, level):
+        fileName, extension = os.path.splitext(os.path.split(inFilePath)[1])
+        if extension == '.hdf':
+            fileName = fileName.rsplit('_',1)[0]
+        return os.path.join(os.path.abspath(pathOut), level, f'{fileName}_{level}.hdf')
+
+    @staticmethod
+    def recordPath(pathOut, outFilePath, level):
+        fileName = os.path.splitext(os.path.split(outFilePath)[1])[0]
+        return os.path.join(os.path.abspath(pathOut), 'Cache', level, f'{fileName}.json')
+
+    # Everything the output of this level depends on; computed before the level is run
+    @staticmethod
+    def levelKey(inFilePath, level):
+        settings = {k: v for k, v in ConfigFile.settings.items()
+                    if ReprocessCache.COMMON_KEYS.match(k) or ReprocessCache.LEVEL_KEYS[level].match(k)}
+        if level == 'L2':
+            settings.update(ConfigFile.products)
+        settingsHash = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+        files = {}
+        if level in ('L1A', 'L1AQC', 'L1B'):
+            calFolder = os.path.splitext(ConfigFile.filename)[0] + "_Calibration"
+            files['calibration'] = ReprocessCache.directoryHash(os.path.join(PATH_TO_CONFIG, calFolder))
+        if level == 'L1AQC':
+            metFile = MainConfig.settings.get("metFile")
+            if metFile and os.path.isfile(metFile):
+                files['ancillary'] = ReprocessCache.fileHash(metFile)
+            anomFile = os.path.join(PATH_TO_CONFIG, os.path.splitext(ConfigFile.filename)[0] + '_anoms.csv')
+            if ConfigFile.settings["bL1aqcDeglitch"] and os.path.isfile(anomFile):
+                files['deglitching'] = ReprocessCache.fileHash(anomFile)
+        if level == 'L1B' and ConfigFile.settings["bL1bCal"] >= 2:
+            files['characterization'] = ReprocessCache.directoryHash(ConfigFile.settings['FullCalDir'])
+            files['radcal'] = ReprocessCache.directoryHash(ConfigFile.settings['RadCalDir'])
+            if Py6SLUT.isEnabled() and os.path.isfile(Py6SLUT.filePath()):
+                files['py6sLUT'] = ReprocessCache.fileHash(Py6SLUT.filePath())
+        if level == 'L2':
+            # The header written to SeaBASS files, not just its name
+            headerFile = os.path.join(PATH_TO_CONFIG, ConfigFile.settings.get('seaBASSHeaderFileName') or '')
+            if os.path.isfile(headerFile):
+                files['seaBASSHeader'] = ReprocessCache.fileHash(headerFile)
+
+        return {"version": MainConfig.settings.get("version"),
+                "input": ReprocessCache.fileHash(inFilePath),
+                "settings": settingsHash,
+                "files": files}
+
+    @staticmethod
+    def isCurrent(pathOut, inFilePath, level, key):
+        outFilePath = ReprocessCache.outputPath(pathOut, inFilePath, level)
+        recordPath = ReprocessCache.recordPath(pathOut, outFilePath, level)
+        if not os.path.isfile(outFilePath) or not os.path.isfile(recordPath):
+            return False
+        try:
+            with open(recordPath, 'r') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return record.get("key") == key and record.get("output") == ReprocessCache.fileHash(outFilePath)
+
+    @staticmethod
+    def record(pathOut, inFilePath, level, key):
+        outFilePath = ReprocessCache.outputPath(pathOut, inFilePath, level)
+        if not os.path.isfile(outFilePath):
+            return
+        recordPath = ReprocessCache.recordPath(pathOut, outFilePath, level)
+        os.makedirs(os.path.dirname(recordPath), exist_ok=True)
+        with open(recordPath, 'w') as f:
+            json.dump({"inFile": os.path.abspath(inFilePath), "outFile": outFilePath,
+                       "key": key, "output": ReprocessCache.fileHash(outFilePath)}, f, indent=4)
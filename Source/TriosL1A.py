@@ -9,6 +9,7 @@ import re
 import tables
 
 from Source.MainConfig import MainConfig
+from Source.ConfigFile import ConfigFile
 from Source.HDFRoot import HDFRoot
 from Source.HDFGroup import HDFGroup
 from Source.Utilities import Utilities
@@ -387,7 +388,7 @@ class TriosL1A:
 
                 try:
                     # root.writeHDF5(new_name)
-                    root.writeHDF5(outFFP[-1])
+                    root.writeHDF5(outFFP[-1], **ConfigFile.getHDFWriteOptions())
 
 
                 except:
@@ -82,47 +82,39 @@ class TriosL1B:
 
         # Data conversion
         mesure = raw_data/65535.0
-        FRM_mesure = np.zeros((nmes, nband))
-        back_mesure = np.zeros((nmes, nband))
-        for n in range(nmes):
-            # Background correction : B0 and B1 read from full charaterisation
-            back_mesure[n,:] = B0 + B1*(int_time[n]/int_time_t0)
-            back_corrected_mesure = mesure[n] - back_mesure[n,:]
-
-            # Offset substraction : dark index read from attribute
-            offset = np.mean(back_corrected_mesure[DarkPixelStart:DarkPixelStop])
-            offset_corrected_mesure = back_corrected_mesure - offset
-
-            # Non-linearity correction
-            linear_corr_mesure = offset_corrected_mesure*(1-alpha*offset_corrected_mesure)
-
-            # Straylight correction over measurement
-            # straylight_corr_mesure = ProcessL1b_FRMCal.Slaper_SL_correction(linear_corr_mesure, mZ, n_iter)
-            straylight_corr_mesure = np.matmul(C_zong, linear_corr_mesure)
-
-            # Normalization for integration time
-            normalized_mesure = straylight_corr_mesure * int_time_t0/int_time[n]
-
-            # Absolute calibration
-            # calibrated_mesure_origin = (offset_corrected_mesure*int_time_t0/int_time[n])/radcal_cal
-            calibrated_mesure = normalized_mesure/updated_radcal_gain
-
-            # Thermal correction
-            thermal_corr_mesure = Ct*calibrated_mesure
-
-            # Cosine correction : commented for the moment
-            if sensortype == "ES":
-                # retrive py6s variables for given wvl
-                solar_zenith = res_py6s['solar_zenith'][n]
-                direct_ratio = res_py6s['direct_ratio'][n]
-                diffuse_ratio = res_py6s['diffuse_ratio'][n]
-                ind_closest_zen = np.argmin(np.abs(zenith_ang-solar_zenith))
-                cos_corr = 1-avg_coserror[:,ind_closest_zen]/100
-                Fhcorr = 1-full_hemi_coserror/100
-                cos_corr_mesure = (direct_ratio*thermal_corr_mesure*cos_corr) + ((1-direct_ratio)*thermal_corr_mesure*Fhcorr)
-                FRM_mesure[n,:] = cos_corr_mesure
-            else:
-                FRM_mesure[n,:] = thermal_corr_mesure
+        # Background correction (B0 and B1 read from full charaterisation) and offset substraction
+        # for all measurements (rows) at once
+        back_mesure, offset_corrected_mesure = TriosL1B.darkCorrectionKernel(
+            mesure, B0, B1, int_time, int_time_t0, DarkPixelStart, DarkPixelStop)
+
+        # Non-linearity correction
+        linear_corr_mesure = offset_corrected_mesure*(1-np.asarray(alpha)*offset_corrected_mesure)
+
+        # Straylight correction over measurement
+        # straylight_corr_mesure = ProcessL1b_FRMCal.Slaper_SL_correction(linear_corr_mesure, mZ, n_iter)
+        straylight_corr_mesure = np.matmul(linear_corr_mesure, C_zong.T)
+
+        # Normalization for integration time
+        normalized_mesure = straylight_corr_mesure * int_time_t0/int_time.reshape(nmes, 1)
+
+        # Absolute calibration
+        # calibrated_mesure_origin = (offset_corrected_mesure*int_time_t0/int_time)/radcal_cal
+        calibrated_mesure = normalized_mesure/updated_radcal_gain
+
+        # Thermal correction
+        thermal_corr_mesure = np.asarray(Ct)*calibrated_mesure
+
+        # Cosine correction : commented for the moment
+        if sensortype == "ES":
+            # retrive py6s variables for given wvl, and the cosine error at the closest zenith angle
+            solar_zenith = np.asarray(res_py6s['solar_zenith'])
+            direct_ratio = res_py6s['direct_ratio']
+            ind_closest_zen = np.argmin(np.abs(zenith_ang[None,:]-solar_zenith[:,None]), axis=1)
+            cos_corr = 1-avg_coserror[:,ind_closest_zen].T/100
+            Fhcorr = 1-full_hemi_coserror/100
+            FRM_mesure = (direct_ratio*thermal_corr_mesure*cos_corr) + ((1-direct_ratio)*thermal_corr_mesure*Fhcorr)
+        else:
+            FRM_mesure = thermal_corr_mesure
 
         # Remove wvl without calibration from the dataset
         # unit conversion from mW/m2 to uW/cm2 : divide per 10
@@ -186,6 +178,18 @@ class TriosL1B:
 
         return True
 
+    @staticmethod
+    def darkCorrectionKernel(mesure, B0, B1, int_time, int_time_t0, DarkPixelStart, DarkPixelStop):
+        ''' Background (B0 + B1*t/t0) and dark pixel offset correction of a (measurement x band)
+            matrix of normalized counts. Returns the background and the corrected matrix. '''
+        int_time = np.asarray(int_time, dtype=np.float64).reshape(len(mesure), 1)
+        back_mesure = B0 + B1*(int_time/int_time_t0)
+        back_corrected_mesure = mesure - back_mesure
+
+        # Offset substraction : dark index read from attribute
+        offset = np.mean(back_corrected_mesure[:, DarkPixelStart:DarkPixelStop], axis=1, keepdims=True)
+        return back_mesure, back_corrected_mesure - offset
+
     @staticmethod
     def processDarkCorrection(node, sensortype, stats: dict):
         # Dark correction performed for each trios radiometers
@@ -221,25 +225,18 @@ class TriosL1B:
 
         # Data conversion
         mesure = raw_data/65535.0
-        calibrated_mesure = np.zeros((nmes, nband))
-        back_mesure = np.zeros((nmes, nband))
-        for n in range(nmes):
-            # Background correction : B0 and B1 read from "back data"
-            back_mesure[n,:] = raw_back[:,0] +  raw_back[:,1]*(int_time[n]/int_time_t0)
-            back_corrected_mesure = mesure[n] - back_mesure[n,:]
-
-            # Offset substraction : dark index read from attribute
-            offset = np.mean(back_corrected_mesure[DarkPixelStart:DarkPixelStop])
-            offset_corrected_mesure = back_corrected_mesure - offset
+        # Background and offset corrections for all measurements (rows) at once
+        back_mesure, offset_corrected_mesure = TriosL1B.darkCorrectionKernel(
+            mesure, raw_back[:,0], raw_back[:,1], int_time, int_time_t0, DarkPixelStart, DarkPixelStop)
 
-            # Normalization for integration time
-            normalized_mesure = offset_corrected_mesure * int_time_t0/int_time[n]
+        # Normalization for integration time
+        normalized_mesure = offset_corrected_mesure * int_time_t0/int_time.reshape(nmes, 1)
 
-            # Sensitivity calibration
-            calibrated_mesure[n,:] = normalized_mesure/raw_cal
+        # Sensitivity calibration
+        calibrated_mesure = normalized_mesure/raw_cal
 
-            # # When no calibration available, set data to 0.
-            # calibrated_mesure[n, ind_nocal==True] = 0.  # not used at the moment
+        # # When no calibration available, set data to 0.
+        # calibrated_mesure[:, ind_nocal==True] = 0.  # not used at the moment
 
         # Remove wvl without calibration from the dataset
         # unit conversion from mW/m2 to uW/cm2 : divide per 10
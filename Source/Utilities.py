@@ -1,14 +1,17 @@
 
 import os
+import calendar
 import datetime
 import collections
+import contextvars
+import functools
 
 import pytz
 from collections import Counter
 import csv
 import re
 
-from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtWidgets import QApplication, QMessageBox
 
 import matplotlib.pyplot as plt
 from matplotlib.pyplot import cm
@@ -23,14 +26,149 @@ from tqdm import tqdm
 
 from Source.SB_support import readSB
 from Source.HDFRoot import HDFRoot
+from Source.CharFileCache import CharFileCache
 from Source.ConfigFile import ConfigFile
 from Source.MainConfig import MainConfig
+from Source.PlotRenderer import PlotRenderer
 # from Source.Uncertainty_Visualiser import Show_Uncertainties  # class for uncertainty visualisation plots
 
-# This gets reset later in Controller.processSingleLevel to reflect the file being processed.
+# Fallback log for messages written outside of a processing job (see Utilities.openLog).
 if "LOGFILE" not in os.environ:
     os.environ["LOGFILE"] = "temp.log"
 
+
+class JobLog:
+    """Buffered log of one processing job, written to Logs/<fileName> on flush."""
+
+    # Flush automatically beyond this many buffered lines to bound memory
+    MAX_LINES = 5000
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.lines = []
+        self.truncate = True
+
+    def write(self, logText, mode='a'):
+        if mode == 'w':
+            self.lines = []
+            self.truncate = True
+        self.lines.append(logText)
+        if len(self.lines) >= JobLog.MAX_LINES:
+            self.flush()
+
+    def flush(self):
+        if not self.lines and not self.truncate:
+            return
+        with open(os.path.join('Logs', self.fileName), 'w' if self.truncate else 'a') as logFile:
+            logFile.write('\n'.join(self.lines + ['']))
+        self.lines = []
+        self.truncate = False
+
+
+# The log of the job running in this thread/task; each thread starts with no log
+currentLog = contextvars.ContextVar('currentLog', default=None)
+
+class TimeInterpolator:
+    """Interpolates blocks of columns (time x column) sampled at the same times onto new times.
+    The time axes and the bracketing indices are computed once and shared by every column.
+    New times before/after the record take its first/last values, as in Utilities.interp."""
+
+    def __init__(self, xTimer, newXTimer):
+        # Datetimes are converted to Unix seconds
+        self.x = TimeInterpolator.toSeconds(xTimer)
+        self.newX = TimeInterpolator.toSeconds(newXTimer)
+        # Like interp1d, accept a record that is not in time order
+        self.order = None
+        if np.any(np.diff(self.x) < 0):
+            self.order = np.argsort(self.x, kind='stable')
+            self.x = self.x[self.order]
+
+        # x[lo] <= newX < x[hi] for new times inside the record
+        n = len(self.x)
+        self.lo = np.clip(np.searchsorted(self.x, self.newX, side='right') - 1, 0, max(n-2, 0))
+        self.hi = np.minimum(self.lo + 1, n-1)
+        self.before = self.newX < self.x[0]
+        self.after = self.newX >= self.x[-1]
+        # As numpy.interp, a new time on a record time takes its value (even next to a NaN)
+        self.exact = self.newX == self.x[self.lo]
+
+    @staticmethod
+    def toSeconds(timer):
+        timer = list(timer)
+        if timer and isinstance(timer[0], datetime.datetime):
+            return Utilities.datetimeToEpoch(timer)
+        return np.asarray(timer, dtype=np.float64)
+
+    def block(self, y):
+        y = np.asarray(y, dtype=np.float64)
+        if y.ndim == 1:
+            y = y[:, None]
+        if self.order is not None:
+            y = y[self.order]
+        return y
+
+    def linear(self, y):
+        ''' Linear interpolation of every column, identical to numpy.interp (and so Utilities.interp)
+            column by column '''
+        squeeze = np.ndim(y) == 1
+        newY = self.interpolateBlock(self.block(y))
+        return newY[:, 0] if squeeze else newY
+
+    def interpolateBlock(self, y):
+        ''' linear for a (time x column) block already in time order '''
+        yLo, yHi = y[self.lo], y[self.hi]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (yHi - yLo) / (self.x[self.hi] - self.x[self.lo])[:, None]
+            newY = slope*(self.newX - self.x[self.lo])[:, None] + yLo
+            # As numpy.interp: if NaN from the left, try from the right
+            bad = np.isnan(newY)
+            if bad.any():
+                newY[bad] = (slope*(self.newX - self.x[self.hi])[:, None] + yHi)[bad]
+                bad = np.isnan(newY) & (yLo == yHi)
+                newY[bad] = yLo[bad]
+        newY[self.exact] = yLo[self.exact]
+        newY[self.before] = y[0]
+        newY[self.after] = y[-1]
+        return newY
+
+    def angular(self, y):
+        ''' Interpolation of angles in degrees through 0/360 (the record is unwrapped first);
+            returns 0-360. NaNs are dropped column by column. '''
+        squeeze = np.ndim(y) == 1
+        y = self.block(y)
+        valid = ~np.isnan(y)
+        newY = np.full((len(self.newX), y.shape[1]), np.nan)
+        if valid.all():
+            newY = self.interpolateBlock(np.unwrap(np.deg2rad(y), axis=0))
+        else:
+            for j in range(y.shape[1]):
+                if valid[:, j].any():
+                    subset = TimeInterpolator(self.x[valid[:, j]], self.newX)
+                    newY[:, j] = subset.interpolateBlock(np.unwrap(np.deg2rad(y[valid[:, j], j]))[:, None])[:, 0]
+        newY = np.rad2deg(newY % (2*np.pi))
+        return newY[:, 0] if squeeze else newY
+
+    def fill(self, y, fillValue=np.nan):
+        ''' Each value fills the new times between its first and last occurrence (e.g. STATION),
+            as in Utilities.interpFill '''
+        squeeze = np.ndim(y) == 1
+        y = self.block(y)
+        newY = np.full((len(self.newX), y.shape[1]), fillValue, dtype=np.float64)
+        for j in range(y.shape[1]):
+            valid = ~np.isnan(y[:, j])
+            x, col = self.x[valid], y[valid, j]
+            for value in np.unique(col):
+                inValue = x[col == value]
+                newY[(self.newX >= inValue.min()) & (self.newX <= inValue.max()), j] = value
+        return newY[:, 0] if squeeze else newY
+
+    def spline(self, y):
+        squeeze = np.ndim(y) == 1
+        y = self.block(y)
+        newY = np.column_stack([Utilities.interpSpline(self.x, y[:, j], self.newX) for j in range(y.shape[1])])
+        return newY[:, 0] if squeeze else newY
+
+
 class Utilities:
 
     @staticmethod
@@ -217,6 +355,10 @@ class Utilities:
 
     @staticmethod
     def errorWindow(winText,errorText):
+        # No GUI in command line runs or batch worker processes
+        if QApplication.instance() is None:
+            print(f'{winText}: {errorText}')
+            return
         msgBox = QMessageBox()
         # msgBox.setIcon(QMessageBox.Information)
         msgBox.setIcon(QMessageBox.Critical)
@@ -246,8 +388,34 @@ class Utilities:
         returnValue = msgBox.exec_()
         return returnValue
 
+    # Start a buffered log for the current job, replacing (and flushing) any open one
+    @staticmethod
+    def openLog(fileName):
+        Utilities.closeLog()
+        log = JobLog(fileName)
+        currentLog.set(log)
+        return log
+
+    # Write buffered messages of the current job to disk, e.g. before a report reads them
+    @staticmethod
+    def flushLog():
+        log = currentLog.get()
+        if log is not None:
+            log.flush()
+
+    @staticmethod
+    def closeLog():
+        log = currentLog.get()
+        if log is not None:
+            log.flush()
+            currentLog.set(None)
+
     @staticmethod
     def writeLogFile(logText, mode='a'):
+        log = currentLog.get()
+        if log is not None:
+            log.write(logText, mode)
+            return
         with open('Logs/' + os.environ["LOGFILE"], mode) as logFile:
             logFile.write(logText + "\n")
 
@@ -657,10 +825,9 @@ class Utilities:
             length = np.asarray(list(ds.values())).shape[1]
 
         for k in keys:
-            for x in range(length):
-                if k != 'Datetime':
-                    if np.isnan(data[k][x]):
-                        return True
+            if k != 'Datetime':
+                if np.isnan(np.asarray(data[k][:length])).any():
+                    return True
                 # else:
                 #     if np.isnan(ds.data[k][x]):
                 #         return True
@@ -826,6 +993,53 @@ class Utilities:
 
         return new_y
 
+    @staticmethod
+    def resampleSpectra(y, waves, newWaves, method='spline'):
+        ''' Resamples spectra (rows of y, one column per band in waves) onto newWaves as one
+            matrix product. method: 'spline' (InterpolatedUnivariateSpline, k=3) or 'linear'
+            (numpy.interp). A single spectrum (1-D y) is returned as 1-D. '''
+        operator = Utilities.resamplingMatrix(waves, newWaves, method)
+        y = np.asarray(y, dtype=np.float64)
+        nan = np.isnan(y)
+        if not nan.any():
+            return y @ operator.T
+        # A NaN band only spoils the new bands it has weight in (its neighbours for 'linear'),
+        #   not the whole spectrum
+        newY = np.where(nan, 0.0, y) @ operator.T
+        newY[(nan @ (operator != 0).T.astype(np.float64)) > 0] = np.nan
+        return newY
+
+    @staticmethod
+    def resamplingMatrix(waves, newWaves, method='spline'):
+        ''' (newWaves x waves) matrix of the resampling, which is linear in the spectrum for
+            fixed bands. Instrument bands are fixed for a deployment, so it is cached. '''
+        waves = np.ascontiguousarray(waves, dtype=np.float64)
+        newWaves = np.ascontiguousarray(newWaves, dtype=np.float64)
+        return Utilities.cachedResamplingMatrix(waves.tobytes(), newWaves.tobytes(), method)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def cachedResamplingMatrix(wavesBytes, newWavesBytes, method):
+        waves = np.frombuffer(wavesBytes, dtype=np.float64)
+        newWaves = np.frombuffer(newWavesBytes, dtype=np.float64)
+        # Column j is the resampling of the unit spectrum of band j
+        identity = np.eye(len(waves))
+        if method == 'spline':
+            operator = np.column_stack([scipy.interpolate.InterpolatedUnivariateSpline(waves, identity[j], k=3)(newWaves)
+                                        for j in range(len(waves))])
+        elif method == 'linear':
+            operator = np.column_stack([np.interp(newWaves, waves, identity[j]) for j in range(len(waves))])
+        else:
+            raise ValueError(f'Unknown resampling method: {method}')
+        operator.setflags(write=False)
+        return operator
+
+    @staticmethod
+    def datetimeToEpoch(datetimes):
+        ''' Unix timestamps (float seconds) of a list of datetimes, as used for interpolation '''
+        return np.array([calendar.timegm(xDT.utctimetuple()) + xDT.microsecond / 1E6 for xDT in datetimes],
+                        dtype=np.float64)
+
     @staticmethod
     def interpAngular(x, y, new_x, fill_value="extrapolate"):
         ''' Wrapper for scipy interp1d that works even if
@@ -962,10 +1176,89 @@ class Utilities:
 
 
     @staticmethod
-    def filterData(group, badTimes, level = None):
+    def mergeBadTimes(badTimes):
+        ''' Sorted, non-overlapping [start, stop] ranges covering the same records as badTimes '''
+        merged = []
+        for start, stop in sorted((dateTime[0], dateTime[1]) for dateTime in badTimes):
+            if stop < start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        return merged
+
+    @staticmethod
+    def badTimesMask(timeStamp, badTimes):
+        ''' Boolean mask of the records of timeStamp within any [start, stop] range (inclusive)
+            of badTimes '''
+        timeStamp = np.asarray(timeStamp)
+        merged = Utilities.mergeBadTimes(badTimes)
+        if len(timeStamp) == 0 or len(merged) == 0:
+            return np.zeros(len(timeStamp), dtype=bool)
+
+        # Records are normally in time order; search a sorted copy if not
+        order = None
+        if not np.all(timeStamp[1:] >= timeStamp[:-1]):
+            order = np.argsort(timeStamp, kind='stable')
+            timeStamp = timeStamp[order]
+
+        # Each range covers the sorted records lo to hi-1
+        lo = np.searchsorted(timeStamp, [dateTime[0] for dateTime in merged], side='left')
+        hi = np.searchsorted(timeStamp, [dateTime[1] for dateTime in merged], side='right')
+        edges = np.zeros(len(timeStamp) + 1, dtype=int)
+        np.add.at(edges, lo, 1)
+        np.add.at(edges, hi, -1)
+        mask = np.cumsum(edges[:-1]) > 0
+
+        if order is not None:
+            unsorted = np.empty_like(mask)
+            unsorted[order] = mask
+            mask = unsorted
+        return mask
+
+    @staticmethod
+    def maskRuns(mask):
+        ''' First and last indices of each run of True in a boolean mask '''
+        edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+    @staticmethod
+    def maskToBadTimes(mask, timeStamp):
+        ''' badTimes [start, stop] ranges of the runs of consecutive flagged records (mask) '''
+        starts, stops = Utilities.maskRuns(mask)
+        return [[timeStamp[start], timeStamp[stop]] for start, stop in zip(starts, stops)]
+
+    @staticmethod
+    def deleteRecords(group, timeStamp, badTimes, removeMask=None):
+        ''' Deletes the records of group within badTimes from all of its datasets in one pass;
+            returns the number of records deleted. removeMask is (timestamps, mask) and is only
+            used if timeStamp equals its timestamps '''
+        if len(timeStamp) == 0:
+            if len(badTimes) > 0:
+                msg = 'Data group is empty. Continuing.'
+                print(msg)
+                Utilities.writeLogFile(msg)
+            return 0
+
+        if removeMask is not None and len(removeMask[0]) == len(timeStamp) and \
+                np.array_equal(removeMask[0], timeStamp):
+            removeMask = removeMask[1]
+        else:
+            removeMask = Utilities.badTimesMask(timeStamp, badTimes)
+        rowsToDelete = np.flatnonzero(removeMask)
+        if len(rowsToDelete) > 0:
+            group.datasetDeleteRow(rowsToDelete)
+        return len(rowsToDelete)
+
+    @staticmethod
+    def filterData(group, badTimes, level = None, removeMask = None):
         ''' Delete flagged records. Level is only specified to point to the timestamp.
             All data in the group (including satellite sensors) will be deleted.
             Called by both ProcessL1bqc and ProcessL2. 
+
+            removeMask, (timestamps, badTimesMask of them), may be given instead of recomputing
+            the mask from badTimes for groups sharing the timestamps of an already filtered group.
             
             filterData for L1AQC is contained within ProcessL1aqc.py'''
 
@@ -1004,39 +1297,9 @@ class Utilities:
         print(msg)
         Utilities.writeLogFile(msg)
 
-        # Delete the records in badTime ranges from each dataset in the group
-        finalCount = 0
+        # Delete the records in badTime ranges from each dataset in the group, all at once
         originalLength = len(timeStamp)
-        for dateTime in badTimes:
-            # Need to reinitialize for each loop
-            startLength = len(timeStamp)
-            newTimeStamp = []
-
-            # msg = f'Eliminate data between: {dateTime}'
-            # print(msg)
-            # Utilities.writeLogFile(msg)
-
-            start = dateTime[0]
-            stop = dateTime[1]
-
-            if startLength > 0:
-                rowsToDelete = []
-                for i in range(startLength):
-                    if start <= timeStamp[i] and stop >= timeStamp[i]:
-                        try:
-                            rowsToDelete.append(i)
-                            finalCount += 1
-                        except:
-                            print('error')
-                    else:
-                        newTimeStamp.append(timeStamp[i])
-                group.datasetDeleteRow(rowsToDelete)
-            else:
-                msg = 'Data group is empty. Continuing.'
-                print(msg)
-                Utilities.writeLogFile(msg)
-                break
-            timeStamp = newTimeStamp.copy()
+        finalCount = Utilities.deleteRecords(group, timeStamp, badTimes, removeMask)
 
         if ConfigFile.settings['SensorType'].lower() == 'trios':
             # TRIOS: reset CAL and BACK as before filtering
@@ -1666,29 +1929,8 @@ class Utilities:
     @staticmethod
     def specFilter(inFilePath, Dataset, timeStamp, station=None, filterRange=[400, 700],\
                 filterFactor=3, rType='None'):
-
-        if ConfigFile.settings['bL1bqcEnableSpecQualityCheckPlot']:
-            import logging
-            logging.getLogger('matplotlib.font_manager').disabled = True
-
-            dirPath = os.getcwd()
-            outDir = MainConfig.settings["outDir"]
-            # If default output path (HyperInSPACE/Data) is used, choose the root HyperInSPACE path,
-            # and build on that (HyperInSPACE/Plots/etc...)
-            if os.path.abspath(outDir) == os.path.join(dirPath,'Data'):
-                outDir = dirPath
-
-            # Otherwise, put Plots in the chosen output directory from Main
-            plotDir = os.path.join(outDir,'Plots','L1BQC_Spectral_Filter')
-
-            if not os.path.exists(plotDir):
-                os.makedirs(plotDir)
-
-            font = {'family': 'serif',
-                    'color':  'darkred',
-                    'weight': 'normal',
-                    'size': 16,
-                    }
+        ''' Flag spectra departing from the median normalized spectrum by more than filterFactor
+            standard deviations (or negative) in any band of filterRange. Returns the badTimes. '''
 
         # Collect each column name ignoring Datetag and Timetag2 (i.e. each wavelength) in the desired range
         x = []
@@ -1699,87 +1941,95 @@ class Utilities:
                     x.append(k)
                     wave.append(float(k))
 
-        # Read in each spectrum
-        total = Dataset.data.shape[0]
-        specArray = []
-        normSpec = []
-
-        if ConfigFile.settings['bL1bqcEnableSpecQualityCheckPlot']:
-            # cmap = cm.get_cmap("jet")
-            # color=iter(cmap(np.linspace(0,1,total)))
-            print('Creating plots...')
-            plt.figure(1, figsize=(10,8))
-
-        for timei in range(total):
-            y = []
-            for waveband in x:
-                y.append(Dataset.data[waveband][timei])
-
-            specArray.append(y)
-            peakIndx = y.index(max(y))
-            normSpec.append(y / y[peakIndx])
-            # plt.plot(wave, y / y[peakIndx], color='grey')
-
-        normSpec = np.array(normSpec)
+        # Spectra (time x band), each normalized to its peak
+        specArray = np.column_stack([Dataset.data[waveband] for waveband in x])
+        peakIndx = np.argmax(specArray, axis=1)
+        normSpec = specArray / specArray[np.arange(len(specArray)), peakIndx][:, None]
 
         aveSpec = np.median(normSpec, axis = 0)
         stdSpec = np.std(normSpec, axis = 0)
 
-        badTimes  = []
-        badIndx = []
-        # For each spectral band...
-        for i in range(0, len(normSpec[0])-1):
-            # For each timeseries radiometric measurement...
-            for j, rad in enumerate(normSpec[:,i]):
-                # Identify outliers and negative values for elimination
-                if rad > (aveSpec[i] + filterFactor*stdSpec[i]) or \
-                    rad < (aveSpec[i] - filterFactor*stdSpec[i]) or \
-                    rad < 0:
-                    badIndx.append(j)
-                    badTimes.append(timeStamp[j])
-
-        badIndx = np.unique(badIndx)
-        badTimes = np.unique(badTimes)
+        # Identify outliers and negative values for elimination (the last band is not tested)
+        rad = normSpec[:, :-1]
+        badSpec = (rad > (aveSpec[:-1] + filterFactor*stdSpec[:-1])) | \
+            (rad < (aveSpec[:-1] - filterFactor*stdSpec[:-1])) | \
+            (rad < 0)
+        badIndx = np.flatnonzero(np.any(badSpec, axis=1))
+
+        badTimes = np.unique(np.asarray(timeStamp)[badIndx])
         # Duplicates each element to a list of two elements in a list:
-        badTimes = np.rot90(np.matlib.repmat(badTimes,2,1), 3)
+        badTimes = np.column_stack((badTimes, badTimes))
 
         if ConfigFile.settings['bL1bqcEnableSpecQualityCheckPlot']:
-            # t0 = time.time()
-            for timei in range(total):
-            # for i in badIndx:
-                if timei in badIndx:
-                    # plt.plot( wave, normSpec[i,:], color='red', linewidth=0.5, linestyle=(0, (1, 10)) ) # long-dot
-                    plt.plot( wave, normSpec[timei,:], color='red', linewidth=0.5, linestyle=(0, (5, 5)) ) # dashed
-                else:
-                    plt.plot(wave, normSpec[timei,:], color='grey')
+            import logging
+            logging.getLogger('matplotlib.font_manager').disabled = True
 
-            # t1 = time.time()
-            # print(f'Time elapsed: {str(round((t1-t0)))} Seconds')
+            dirPath = os.getcwd()
+            outDir = MainConfig.settings["outDir"]
+            # If default output path (HyperInSPACE/Data) is used, choose the root HyperInSPACE path,
+            # and build on that (HyperInSPACE/Plots/etc...)
+            if os.path.abspath(outDir) == os.path.join(dirPath,'Data'):
+                outDir = dirPath
 
-            plt.plot(wave, aveSpec, color='black', linewidth=0.5)
-            plt.plot(wave, aveSpec + filterFactor*stdSpec, color='black', linewidth=2, linestyle='dashed')
-            plt.plot(wave, aveSpec - filterFactor*stdSpec, color='black', linewidth=2, linestyle='dashed')
+            # Otherwise, put Plots in the chosen output directory from Main
+            plotDir = os.path.join(outDir,'Plots','L1BQC_Spectral_Filter')
 
-            plt.title(f'Sigma = {filterFactor}', fontdict=font)
-            plt.xlabel('Wavelength [nm]', fontdict=font)
-            plt.ylabel(f'{rType} [Normalized to peak value]', fontdict=font)
-            plt.subplots_adjust(left=0.15)
-            plt.subplots_adjust(bottom=0.15)
-            axes = plt.gca()
-            axes.grid()
+            if not os.path.exists(plotDir):
+                os.makedirs(plotDir)
 
-            # Save the plot
             _,filename = os.path.split(inFilePath)
             filebasename,_ = filename.rsplit('_',1)
             if station:
                 fp = os.path.join(plotDir, f'STATION_{station}_{filebasename}_{rType}.png')
             else:
                 fp = os.path.join(plotDir, f'{filebasename}_{rType}.png')
-            plt.savefig(fp)
-            plt.close()
+
+            # Rendered in the background; QC does not wait on the plot
+            badRecord = np.zeros(len(normSpec), dtype=bool)
+            badRecord[badIndx] = True
+            PlotRenderer.submit(Utilities.plotSpecFilter, fp, np.array(wave), normSpec, badRecord,
+                                aveSpec, stdSpec, filterFactor, rType)
 
         return badTimes
 
+    @staticmethod
+    def plotSpecFilter(fp, wave, normSpec, badRecord, aveSpec, stdSpec, filterFactor, rType):
+        ''' Normalized spectra of specFilter (flagged ones dashed red) with the median and
+            filterFactor standard deviation envelope. Thread safe (see PlotRenderer). '''
+        from matplotlib.figure import Figure
+        from matplotlib.collections import LineCollection
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        font = {'family': 'serif',
+                'color':  'darkred',
+                'weight': 'normal',
+                'size': 16,
+                }
+
+        fig = Figure(figsize=(10,8))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+
+        # One collection per style in place of a plot call per spectrum
+        segments = np.stack(np.broadcast_arrays(wave[None, :], normSpec), axis=-1)
+        ax.add_collection(LineCollection(segments[~badRecord], colors='grey', linewidths=1.5))
+        ax.add_collection(LineCollection(segments[badRecord], colors='red', linewidths=0.5, linestyles=(0, (5, 5)))) # dashed
+        ax.autoscale_view()
+
+        ax.plot(wave, aveSpec, color='black', linewidth=0.5)
+        ax.plot(wave, aveSpec + filterFactor*stdSpec, color='black', linewidth=2, linestyle='dashed')
+        ax.plot(wave, aveSpec - filterFactor*stdSpec, color='black', linewidth=2, linestyle='dashed')
+
+        ax.set_title(f'Sigma = {filterFactor}', fontdict=font)
+        ax.set_xlabel('Wavelength [nm]', fontdict=font)
+        ax.set_ylabel(f'{rType} [Normalized to peak value]', fontdict=font)
+        fig.subplots_adjust(left=0.15)
+        fig.subplots_adjust(bottom=0.15)
+        ax.grid()
+
+        # Save the plot
+        fig.savefig(fp)
+
     @staticmethod
     def plotIOPs(root, filename, algorithm, iopType, plotDelta = False):
 
@@ -2049,75 +2299,115 @@ class Utilities:
                 This may benefit in the future from eliminating the thresholded values from the moving
                 average filter analysis.
         '''
-        if lightDark == 'Dark':
-            # For Darks, calculate the moving average and residual vectors
-            #   and the OVERALL standard deviation of the residual over the entire file
-
-            # First pass
-            avg = Utilities.movingAverage(radiometry1D, windowSize).tolist()
-            residual = np.array(radiometry1D) - np.array(avg)
-            stdData = np.std(residual)
-
-            badIndex = Utilities.darkConvolution(radiometry1D,avg,stdData,sigma)
-
-            # Second pass
-            radiometry1D2 = np.array(radiometry1D[:])
-            radiometry1D2[badIndex] = np.nan
-            radiometry1D2 = radiometry1D2.tolist()
-            avg2 = Utilities.movingAverage(radiometry1D2, windowSize).tolist()
-            residual = np.array(radiometry1D2) - np.array(avg2)
-            stdData = np.nanstd(residual)
-
-            badIndex2 = Utilities.darkConvolution(radiometry1D2,avg2,stdData,sigma)
-
-            # Threshold pass
-            # Tolerates "None" for min or max Rad. ConfigFile.setting updated directly from checkbox
-            badIndex3 = Utilities.deglitchThresholds(band,radiometry1D,minRad,maxRad, minMaxBand)
+        radiometry2D = np.asarray(radiometry1D, dtype=np.float64)[:, None]
+        badIndex, badIndex2, badIndex3 = Utilities.deglitchBands(
+            [band], radiometry2D, windowSize, sigma, lightDark, minRad, maxRad, minMaxBand)
+        return badIndex[:, 0].tolist(), badIndex2[:, 0].tolist(), badIndex3[:, 0].tolist()
 
-        else:
-            # For Lights, calculate the moving average and residual vectors
-            #   and the ROLLING standard deviation of the residual
+    @staticmethod
+    def deglitchBands(bands, radiometry2D, windowSize, sigma, lightDark, minRad, maxRad, minMaxBand):
+        ''' deglitchBand for all bands at once. radiometry2D is (time x band), one column per entry
+                of bands; returns the first pass, second pass and threshold badIndexes as boolean
+                (time x band) arrays.
 
-            # First pass
-            avg = Utilities.movingAverage(radiometry1D, windowSize).tolist()
-            residual = np.array(radiometry1D) - np.array(avg)
+                For Darks, the OVERALL standard deviation of the residual over the entire file is used,
+                for Lights the ROLLING standard deviation of the residual.
+        '''
+        # Band-major, so that per band reductions run over contiguous rows as they do on one band
+        data = np.ascontiguousarray(np.asarray(radiometry2D, dtype=np.float64).T)
 
-            # Calculate the variation in the distribution of the residual
-            residualDf = pd.DataFrame(residual)
-            testing_std_as_df = residualDf.rolling(windowSize).std()
-            rolling_std = testing_std_as_df.replace(np.nan,
-                testing_std_as_df.iloc[windowSize - 1]).round(3).iloc[:,0].tolist()
+        badIndex, badIndex2 = next(Utilities.deglitchPasses(data, windowSize, [sigma], lightDark))
+        badIndex3 = Utilities.deglitchThreshold(bands, data, minRad, maxRad, minMaxBand)
 
-            # This rolling std on the residual has a tendancy to blow up for extreme outliers,
-            # replace it with the median residual std when that happens
-            y = np.array(rolling_std)
-            y[y > np.median(y)+3*np.std(y)] = np.median(y)
-            rolling_std = y.tolist()
+        return badIndex.T, badIndex2.T, badIndex3.T
 
-            badIndex = Utilities.lightConvolution(radiometry1D,avg,rolling_std,sigma)
+    @staticmethod
+    def deglitchPasses(data, windowSize, sigmas, lightDark):
+        ''' Yields the first and second pass badIndexes of the (band x time) data for each of sigmas
+            in turn. The first pass moving average and std do not depend on sigma and are computed once. '''
+        # First pass
+        avg = Utilities.movingAverageBands(data, windowSize)
+        std = Utilities.deglitchStd(data - avg, windowSize, lightDark, firstPass=True)
+        for sigma in sigmas:
+            badIndex = Utilities.deglitchConvolution(data, avg, std, sigma)
 
             # Second pass
-            radiometry1D2 = np.array(radiometry1D[:])
-            radiometry1D2[badIndex] = np.nan
-            radiometry1D2 = radiometry1D2.tolist()
-            avg2 = Utilities.movingAverage(radiometry1D2, windowSize).tolist()
-            residual2 = np.array(radiometry1D2) - np.array(avg2)
-            residualDf2 = pd.DataFrame(residual2)
-            testing_std_as_df2 = residualDf2.rolling(windowSize).std()
-            rolling_std2 = testing_std_as_df2.replace(np.nan,
-                testing_std_as_df2.iloc[windowSize - 1]).round(3).iloc[:,0].tolist()
-            y = np.array(rolling_std2)
-            y[np.isnan(y)] = np.nanmedian(y)
-            y[y > np.nanmedian(y)+3*np.nanstd(y)] = np.nanmedian(y)
-            rolling_std2 = y.tolist()
+            data2 = np.where(badIndex, np.nan, data)
+            avg2 = Utilities.movingAverageBands(data2, windowSize)
+            std2 = Utilities.deglitchStd(data2 - avg2, windowSize, lightDark, firstPass=False)
+            badIndex2 = Utilities.deglitchConvolution(data2, avg2, std2, sigma)
+            yield badIndex, badIndex2
+
+    @staticmethod
+    def deglitchThreshold(bands, data, minRad, maxRad, minMaxBand):
+        ''' Threshold pass badIndex of the (band x time) data '''
+        # Tolerates "None" for min or max Rad. ConfigFile.setting updated directly from checkbox
+        badIndex3 = np.zeros(data.shape, dtype=bool)
+        if ConfigFile.settings["bL1aqcThreshold"]:
+            # Only run on the pre-selected waveband
+            for i, band in enumerate(bands):
+                if band == minMaxBand:
+                    if minRad or minRad==0: # beware falsy zeros...
+                        badIndex3[i] |= data[i] < minRad
+                    if maxRad or maxRad==0:
+                        badIndex3[i] |= data[i] > maxRad
+        return badIndex3
 
-            badIndex2 = Utilities.lightConvolution(radiometry1D2,avg2,rolling_std2,sigma)
+    @staticmethod
+    def movingAverageBands(data, window_size):
+        ''' movingAverage along each row of a (band x time) array. The NaN-masked convolution with a
+            window of ones is taken as differences of cumulative sums (identical for the integer
+            counts of the raw data). '''
+        mask = np.isnan(data)
+        n = data.shape[-1]
+        # Full convolution: element k sums the samples k-window_size+1 to k
+        k = np.arange(n + window_size - 1)
+        hi = np.minimum(k, n - 1) + 1
+        lo = np.maximum(k - window_size + 1, 0)
+        zeros = np.zeros(data.shape[:-1] + (1,))
+        sums = np.concatenate([zeros, np.cumsum(np.where(mask, 0, data), axis=-1)], axis=-1)
+        counts = np.concatenate([zeros.astype(int), np.cumsum(~mask, axis=-1)], axis=-1)
+        denom = counts[..., hi] - counts[..., lo]
+        denom = np.where(denom != 0, denom, 1) # replace the 0s with 1s to block div0 error; the numerator will be zero anyway
 
-            # Threshold pass
-            # Tolerates "None" for min or max Rad
-            badIndex3 = Utilities.deglitchThresholds(band, radiometry1D,minRad,maxRad, minMaxBand)
+        out = (sums[..., hi] - sums[..., lo])/denom
 
-        return badIndex, badIndex2, badIndex3
+        # Slice out one half window on either side; this requires an odd-sized window
+        return out[..., int(np.floor(window_size/2)):-int(np.floor(window_size/2))]
+
+    @staticmethod
+    def deglitchStd(residual, windowSize, lightDark, firstPass):
+        ''' Standard deviation of the (band x time) residual for deglitchConvolution: per band
+            (band x 1) for Darks, rolling (band x time) for Lights '''
+        if lightDark == 'Dark':
+            if firstPass:
+                return np.std(residual, axis=-1, keepdims=True)
+            return np.nanstd(residual, axis=-1, keepdims=True)
+
+        # Calculate the variation in the distribution of the residual, all bands in one DataFrame
+        testing_std = pd.DataFrame(residual.T).rolling(windowSize).std().to_numpy().T
+        testing_std = np.where(np.isnan(testing_std), testing_std[:, windowSize - 1:windowSize], testing_std)
+        y = np.ascontiguousarray(np.round(testing_std, 3))
+
+        # This rolling std on the residual has a tendancy to blow up for extreme outliers,
+        # replace it with the median residual std when that happens
+        if firstPass:
+            median = np.median(y, axis=-1, keepdims=True)
+            return np.where(y > median + 3*np.std(y, axis=-1, keepdims=True), median, y)
+        y = np.where(np.isnan(y), np.nanmedian(y, axis=-1, keepdims=True), y)
+        median = np.nanmedian(y, axis=-1, keepdims=True)
+        return np.where(y > median + 3*np.nanstd(y, axis=-1, keepdims=True), median, y)
+
+    @staticmethod
+    def deglitchConvolution(data, avg, std, sigma):
+        ''' darkConvolution and lightConvolution on (band x time) arrays '''
+        with np.errstate(invalid='ignore'):
+            badIndex = (data > avg + (sigma*std)) | (data < avg - (sigma*std))
+        badIndex[np.isnan(data)] = False
+        # First and last avg values from convolution are not to be trusted
+        badIndex[:, 0] = True
+        badIndex[:, -1] = True
+        return badIndex
 
 
     @staticmethod
@@ -2798,6 +3088,11 @@ class Utilities:
         :gp: HDFGroup object - Input data is stored as HDFDatasets and appended to this group.
         return type: None - may be changed to bool for better error handling
         """
+        return CharFileCache.read(filepath, gp, Utilities.parse_unc)
+
+    @staticmethod
+    def parse_unc(filepath: str, gp) -> None:
+        """ read_unc without the parsed file cache (see CharFileCache) """
         begin_data = False  # set up data flag
         attrs = {}
         end_flag = 0
@@ -2881,6 +3176,12 @@ class Utilities:
 
     @staticmethod
     def read_char(filepath: str, gp) -> None:
+        """ Reads a class-based or FRM characterization file into HDFDatasets of the HDFGroup gp """
+        return CharFileCache.read(filepath, gp, Utilities.parse_char)
+
+    @staticmethod
+    def parse_char(filepath: str, gp) -> None:
+        """ read_char without the parsed file cache (see CharFileCache) """
         begin_data = False  # set up data flag
         attrs = {}
         end_count = 0
@@ -0,0 +1,118 @@
+''' Builds the Py6S direct/diffuse irradiance table of Py6SLUT and checks it against 6S.
+
+    python -m Source.WritePy6SLUT build [--out Data/Py6S_LUT.hdf] [--aot 0 0.1 0.2 ...] ...
+    python -m Source.WritePy6SLUT validate [--lut Data/Py6S_LUT.hdf] [--samples 50]
+
+The default grid (35 SZA x 1 relative azimuth x 12 AOD x 261 wavelengths) takes about
+110,000 single-wavelength 6S runs, spread over all cores by Py6S; it is built once per 6S
+configuration. The 6S ground irradiances do not depend on the viewing geometry, hence the
+single relative azimuth node; validate samples random azimuths to confirm it. '''
+import argparse
+import datetime
+import time
+import numpy as np
+
+from Source.Py6SCache import Py6SCache
+from Source.Py6SLUT import Py6SLUT
+from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+
+# Denser where the air mass changes fast
+SZA = np.concatenate([np.arange(0, 60, 5), np.arange(60, 87.5+0.1, 1.25)])
+REL_AZ = np.array([0.0])
+AOT550 = np.array([0.0, 0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.6, 0.8, 1.0, 1.5])
+# 6S spectral resolution
+WAVELENGTH = np.arange(350, 1000+0.1, 2.5)
+# Date of the runs; irradiances are stored at 1 AU
+MONTH, DAY = 1, 4
+
+
+def buildLUT(fp, sza=SZA, relAz=REL_AZ, aot550=AOT550, wavelength=WAVELENGTH, run=ProcessL1b_FRMCal.runPy6S):
+    shape = (len(sza), len(relAz), len(aot550), len(wavelength))
+    results = {k: np.zeros(shape) for k in Py6SCache.OUTPUTS}
+    factor = Py6SLUT.earthSunFactor(MONTH, DAY)
+    t0 = time.time()
+    for i, solar_z in enumerate(sza):
+        for j, phi in enumerate(relAz):
+            for k, aot in enumerate(aot550):
+                inputs = {'month': MONTH, 'day': DAY, 'solar_z': float(solar_z), 'solar_a': float(phi),
+                          'view_a': 0.0, 'aot550': float(aot)}
+                res = run(inputs, wavelength)
+                for key in Py6SCache.OUTPUTS:
+                    results[key][i, j, k, :] = res[key]/factor if key in Py6SLUT.IRRADIANCES else res[key]
+        print(f'SZA {solar_z} done ({i+1}/{len(sza)}, {time.time()-t0:.0f} s)')
+
+    axes = {'solar_z': sza, 'rel_az': relAz, 'aot550': aot550}
+    Py6SLUT.write(fp, axes, wavelength, results,
+                  {'atmos_profile': 'MidlatitudeSummer', 'aero_profile': 'Maritime', 'altitudes': 'sea level',
+                   'view_z': 180, 'created': datetime.datetime.now(datetime.timezone.utc).isoformat()})
+    print(f'Py6S LUT written: {fp}')
+
+
+def validateLUT(fp, nSamples=50, seed=0, wavelength=None, run=ProcessL1b_FRMCal.runPy6S):
+    ''' Compares the table with 6S at random inputs within it; returns the largest differences:
+        percentage points for the percent outputs, relative for the irradiances '''
+    axes, _, _ = Py6SLUT.read(fp)
+    if wavelength is None:
+        # HyperOCR-like bands, off the table nodes
+        wavelength = np.arange(351.1, 900, 3.3)
+    rng = np.random.default_rng(seed)
+    dates = [datetime.date(2021, 1, 1) + datetime.timedelta(days=int(d)) for d in rng.integers(0, 365, nSamples)]
+    month = np.array([d.month for d in dates])
+    day = np.array([d.day for d in dates])
+    sza = rng.uniform(axes['solar_z'][0], min(axes['solar_z'][-1], 80), nSamples)
+    solar_a = rng.uniform(0, 360, nSamples)
+    view_a = rng.uniform(0, 360, nSamples)
+    aot = rng.uniform(axes['aot550'][0], min(axes['aot550'][-1], 0.6), nSamples)
+
+    lut = Py6SLUT.interpolate(month, day, sza, solar_a, view_a, aot, wavelength, fp)
+    diff = {k: np.zeros((nSamples, len(wavelength))) for k in Py6SCache.OUTPUTS}
+    for n in range(nSamples):
+        inputs = {'month': int(month[n]), 'day': int(day[n]), 'solar_z': float(sza[n]),
+                  'solar_a': float(solar_a[n]), 'view_a': float(view_a[n]), 'aot550': float(aot[n])}
+        res = run(inputs, wavelength)
+        for k in Py6SCache.OUTPUTS:
+            if k in Py6SLUT.IRRADIANCES:
+                diff[k][n] = lut[k][n]/res[k] - 1
+            else:
+                diff[k][n] = lut[k][n] - res[k]
+
+    worst = {}
+    print(f'Py6S LUT vs 6S, {nSamples} random inputs, {len(wavelength)} bands')
+    for k in Py6SCache.OUTPUTS:
+        d = np.abs(diff[k][np.isfinite(diff[k])])
+        worst[k] = d.max()
+        unit = '%' if k in Py6SLUT.IRRADIANCES else ' pp'
+        scale = 100 if k in Py6SLUT.IRRADIANCES else 1
+        print(f'  {k}: median {scale*np.median(d):.3g}{unit}, 99th percentile {scale*np.percentile(d, 99):.3g}{unit}, '
+              f'max {scale*d.max():.3g}{unit}')
+    return worst
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or validate the Py6S irradiance table')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build')
+    build.add_argument('--out', default=Py6SLUT.filePath())
+    build.add_argument('--sza', nargs='+', type=float)
+    build.add_argument('--relaz', nargs='+', type=float)
+    build.add_argument('--aot', nargs='+', type=float)
+    build.add_argument('--wavelength', nargs=3, type=float, metavar=('START', 'STOP', 'STEP'))
+    validate = sub.add_parser('validate')
+    validate.add_argument('--lut', default=Py6SLUT.filePath())
+    validate.add_argument('--samples', type=int, default=50)
+    validate.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        grid = {}
+        if args.sza:
+            grid['sza'] = np.array(args.sza)
+        if args.relaz:
+            grid['relAz'] = np.array(args.relaz)
+        if args.aot:
+            grid['aot550'] = np.array(args.aot)
+        if args.wavelength:
+            grid['wavelength'] = np.arange(args.wavelength[0], args.wavelength[1] + args.wavelength[2]/2, args.wavelength[2])
+        buildLUT(args.out, **grid)
+    else:
+        validateLUT(args.lut, args.samples, args.seed)
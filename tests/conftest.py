@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# Run from anywhere: the Source package is imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def workDir(tmp_path, monkeypatch):
+    ''' Each test runs in its own directory, where Utilities.writeLogFile writes to Logs/ '''
+    (tmp_path / 'Logs').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
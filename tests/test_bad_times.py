@@ -0,0 +1,83 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from Source.ConfigFile import ConfigFile
+from Source.HDFGroup import HDFGroup
+from Source.ProcessL1bqc import ProcessL1bqc
+from Source.Utilities import Utilities
+
+T0 = datetime.datetime(2016, 3, 20, 6, tzinfo=datetime.timezone.utc)
+
+
+def bruteForce(timeStamp, badTimes):
+    return [any(start <= t <= stop for start, stop in badTimes) for t in timeStamp]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_bad_times_mask(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(0, 60))
+    # Repeated timestamps, and out of order for some seeds
+    seconds = np.sort(rng.integers(0, 200, n))
+    if seed % 3 == 0:
+        rng.shuffle(seconds)
+    timeStamp = [T0 + datetime.timedelta(seconds=int(s)) for s in seconds]
+    badTimes = []
+    for _ in range(rng.integers(0, 8)):
+        # Overlapping, single-record, reversed and out of record ranges
+        start, length = rng.integers(-20, 220), rng.integers(-5, 40)
+        badTimes.append([T0 + datetime.timedelta(seconds=int(start)),
+                         T0 + datetime.timedelta(seconds=int(start + length))])
+    mask = Utilities.badTimesMask(timeStamp, badTimes)
+    assert mask.dtype == bool
+    assert mask.tolist() == bruteForce(timeStamp, badTimes)
+
+
+def test_mask_to_bad_times_round_trip():
+    rng = np.random.default_rng(1)
+    timeStamp = [T0 + datetime.timedelta(seconds=3.3*i) for i in range(300)]
+    mask = rng.random(300) < 0.2
+    assert np.array_equal(Utilities.badTimesMask(timeStamp, Utilities.maskToBadTimes(mask, timeStamp)), mask)
+
+
+def l1bGroups(timeStamp, rng):
+    groups = {}
+    for gid, names in (('IRRADIANCE', ['ES']), ('RADIANCE', ['LI', 'LT']), ('ANCILLARY', ['LATITUDE', 'SZA']),
+                       ('PY6S_MODEL', ['solar_zenith'])):
+        gp = HDFGroup()
+        gp.id = gid
+        for name in names:
+            ds = gp.addDataset(name)
+            ds.columns['Datetime'] = list(timeStamp)
+            for band in ('400.0', '500.0'):
+                ds.columns[band] = rng.random(len(timeStamp)).tolist()
+            ds.columnsToDataset()
+            ds.datasetToColumns()
+        groups[gid] = gp
+    return groups
+
+
+def test_shared_remove_mask(monkeypatch):
+    # The L1BQC groups share the Es timestamps, so one mask filters them all as badTimes would
+    monkeypatch.setitem(ConfigFile.settings, 'SensorType', 'SeaBird')
+    timeStamp = [T0 + datetime.timedelta(seconds=3.3*i) for i in range(200)]
+    badTimes = [[timeStamp[5], timeStamp[9]], [timeStamp[40], timeStamp[60]], [timeStamp[50], timeStamp[50]],
+                [timeStamp[199], timeStamp[199]]]
+    shared, separate = l1bGroups(timeStamp, np.random.default_rng(2)), l1bGroups(timeStamp, np.random.default_rng(2))
+    removeMask = ProcessL1bqc.removeMask(shared['IRRADIANCE'], badTimes)
+    for gid in shared:
+        assert Utilities.filterData(shared[gid], badTimes, removeMask=removeMask) == \
+            Utilities.filterData(separate[gid], badTimes)
+        for name, ds in shared[gid].datasets.items():
+            assert len(ds.data) == 200 - 27
+            assert np.array_equal(ds.data, separate[gid].datasets[name].data)
+
+    # Same length, other timestamps: the mask is rebuilt from badTimes
+    shifted = [t + datetime.timedelta(seconds=3.3*20) for t in timeStamp]
+    shared, separate = l1bGroups(shifted, np.random.default_rng(4)), l1bGroups(shifted, np.random.default_rng(4))
+    assert Utilities.filterData(shared['RADIANCE'], badTimes, removeMask=removeMask) == \
+        Utilities.filterData(separate['RADIANCE'], badTimes)
+    assert np.array_equal(shared['RADIANCE'].getDataset('LT').data, separate['RADIANCE'].getDataset('LT').data)
+    assert len(shared['RADIANCE'].getDataset('LT').data) != 200 - 27
@@ -0,0 +1,25 @@
+import pytest
+
+from Source.ConfigFile import ConfigFile
+
+# Controller pulls in the whole pipeline, including the FidRadDB client
+pytest.importorskip('ocdb')
+from Source.Controller import Controller
+
+
+def test_job_settings_do_not_leak(monkeypatch):
+    monkeypatch.setattr(ConfigFile, 'settings', ConfigFile.settings.__class__(fL1aqcESWindowDark=11))
+
+    def job(window, fail):
+        # As processSingleLevel does with the parameters of the anomaly analysis file
+        ConfigFile.settings['fL1aqcESWindowDark'] = window
+        ConfigFile.settings['fL1aqcESSigmaDark'] = 2.5
+        if fail:
+            raise ValueError('bad file')
+        return True
+    monkeypatch.setattr(Controller, 'leakJob', staticmethod(job), raising=False)
+
+    results = [Controller.runBatchJob(('leakJob', 'a.raw', (5, False))),
+               Controller.runBatchJob(('leakJob', 'b.raw', (7, True)))]
+    assert [r[1] for r in results] == [True, False]
+    assert dict(ConfigFile.settings) == {'fL1aqcESWindowDark': 11}
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Source.ConfigFile import ConfigFile
+from Source.Utilities import Utilities
+
+
+def perBand(band, radiometry1D, windowSize, sigma, lightDark, minRad, maxRad, minMaxBand):
+    ''' deglitchBand as it was before deglitchBands: one band at a time with the scalar helpers '''
+    def rollingStd(residual):
+        df = pd.DataFrame(residual).rolling(windowSize).std()
+        return np.array(df.replace(np.nan, df.iloc[windowSize - 1]).round(3).iloc[:, 0].tolist())
+
+    avg = Utilities.movingAverage(radiometry1D, windowSize).tolist()
+    residual = np.array(radiometry1D) - np.array(avg)
+    if lightDark == 'Dark':
+        badIndex = Utilities.darkConvolution(radiometry1D, avg, np.std(residual), sigma)
+    else:
+        y = rollingStd(residual)
+        y[y > np.median(y)+3*np.std(y)] = np.median(y)
+        badIndex = Utilities.lightConvolution(radiometry1D, avg, y.tolist(), sigma)
+
+    radiometry1D2 = np.array(radiometry1D[:])
+    radiometry1D2[badIndex] = np.nan
+    radiometry1D2 = radiometry1D2.tolist()
+    avg2 = Utilities.movingAverage(radiometry1D2, windowSize).tolist()
+    residual2 = np.array(radiometry1D2) - np.array(avg2)
+    if lightDark == 'Dark':
+        badIndex2 = Utilities.darkConvolution(radiometry1D2, avg2, np.nanstd(residual2), sigma)
+    else:
+        y = rollingStd(residual2)
+        y[np.isnan(y)] = np.nanmedian(y)
+        y[y > np.nanmedian(y)+3*np.nanstd(y)] = np.nanmedian(y)
+        badIndex2 = Utilities.lightConvolution(radiometry1D2, avg2, y.tolist(), sigma)
+
+    badIndex3 = Utilities.deglitchThresholds(band, radiometry1D, minRad, maxRad, minMaxBand)
+    return badIndex, badIndex2, badIndex3
+
+
+def radiometry(kind, lightDark, nRecords=400, nBands=12):
+    rng = np.random.default_rng(7)
+    level = 2000 if lightDark == 'Dark' else 20000
+    drift = 1 + 0.3*np.sin(np.linspace(0, 6, nRecords))[:, None] if lightDark == 'Light' else 1
+    data = level*drift*(1 + 0.01*rng.standard_normal((nRecords, nBands)))
+    # Glitches, single and in runs
+    data[rng.integers(0, nRecords, 15), rng.integers(0, nBands, 15)] *= 1.5
+    data[100:104, 3] = 0
+    data = np.round(data) if kind != 'float' else data
+    if kind == 'nan':
+        data[rng.integers(0, nRecords, 30), rng.integers(0, nBands, 30)] = np.nan
+    return data
+
+
+@pytest.mark.parametrize('lightDark', ['Dark', 'Light'])
+@pytest.mark.parametrize('kind', ['counts', 'nan', 'float'])
+@pytest.mark.parametrize('windowSize', [5, 11, 21])
+def test_deglitch_bands_against_per_band(lightDark, kind, windowSize, monkeypatch):
+    monkeypatch.setitem(ConfigFile.settings, 'bL1aqcThreshold', 1)
+    data = radiometry(kind, lightDark)
+    bands = [f'{w:.2f}' for w in np.linspace(350, 800, data.shape[1])]
+    thresholds = (1000, 25000, bands[3])
+    sigma = 2.7
+    masks = Utilities.deglitchBands(bands, data, windowSize, sigma, lightDark, *thresholds)
+    # Glitches are found away from the untrusted first and last records, and by the threshold
+    assert masks[0][1:-1].any() and masks[2].any()
+    for j, band in enumerate(bands):
+        expected = perBand(band, data[:, j].tolist(), windowSize, sigma, lightDark, *thresholds)
+        for nPass, (mask, ref) in enumerate(zip(masks, expected)):
+            assert mask[:, j].tolist() == ref, (band, nPass + 1)
+
+
+@pytest.mark.parametrize('lightDark', ['Dark', 'Light'])
+def test_deglitch_passes_per_sigma(lightDark, monkeypatch):
+    monkeypatch.setitem(ConfigFile.settings, 'bL1aqcThreshold', 0)
+    # One first pass for all sigmas (DeglitchSweep) gives the masks of separate runs
+    data = radiometry('nan', lightDark)
+    sigmas = [2.0, 2.7, 3.5]
+    passes = Utilities.deglitchPasses(np.ascontiguousarray(data.T), 11, sigmas, lightDark)
+    for sigma, (badIndex, badIndex2) in zip(sigmas, passes):
+        expected = Utilities.deglitchBands(['400'] * data.shape[1], data, 11, sigma, lightDark, None, None, None)
+        assert np.array_equal(badIndex.T, expected[0]) and np.array_equal(badIndex2.T, expected[1])
@@ -0,0 +1,98 @@
+import collections
+import datetime
+
+import numpy as np
+
+from Source.HDFDataset import ColumnFacade, HDFDataset
+
+
+def makeDataset():
+    rng = np.random.default_rng(0)
+    n = 25
+    ds = HDFDataset()
+    ds.id = 'LT'
+    ds.data = np.empty(n, dtype=[('Datetag', np.float64), ('Timetag2', np.float64), ('Datetime', object),
+                                 ('INT_FLAG', np.int64), ('STRING', 'S4'), ('VALID', bool),
+                                 ('400.1', np.float64), ('403.4', np.float64), ('406.7', np.float64)])
+    t0 = datetime.datetime(2016, 3, 20, 6, tzinfo=datetime.timezone.utc)
+    ds.data['Datetag'] = 2016080
+    ds.data['Timetag2'] = 60000000 + 3300*np.arange(n)
+    ds.data['Datetime'] = [t0 + datetime.timedelta(seconds=3.3*i) for i in range(n)]
+    ds.data['INT_FLAG'] = rng.integers(0, 3, n)
+    ds.data['STRING'] = [b'ab%02d' % i for i in range(n)]
+    ds.data['VALID'] = rng.random(n) > 0.5
+    for k in ('400.1', '403.4', '406.7'):
+        ds.data[k] = rng.random(n)
+    ds.data['403.4'][3] = np.nan
+    return ds
+
+
+def listColumns(ds):
+    # The columns as datasetToColumns built them before the facade: an OrderedDict of lists
+    ds.columns = collections.OrderedDict((k, ds.data[k].tolist()) for k in ds.data.dtype.names)
+
+
+def assertSameData(a, b):
+    assert a.dtype == b.dtype
+    for k in a.dtype.names:
+        if a.dtype[k].kind == 'f':
+            assert np.array_equal(a[k], b[k], equal_nan=True), k
+        else:
+            assert list(a[k]) == list(b[k]), k
+
+
+def test_round_trip_untouched():
+    ds, ref = makeDataset(), makeDataset()
+    ds.datasetToColumns()
+    assert isinstance(ds.columns, ColumnFacade)
+    ds.columnsToDataset()
+    listColumns(ref)
+    ref.columnsToDataset()
+    assertSameData(ds.data, ref.data)
+
+
+def test_round_trip_edited():
+    ds, ref = makeDataset(), makeDataset()
+    ds.datasetToColumns()
+    listColumns(ref)
+    for d in (ds, ref):
+        # Read, edit in place, replace, add and delete columns as the processing levels do
+        assert isinstance(d.columns['Timetag2'], list)
+        d.columns['400.1'][0] = -1.0
+        d.columns['406.7'] = [v*2 for v in d.columns['406.7']]
+        d.columns['NEW'] = [1.5]*len(d.columns['Datetag'])
+        del d.columns['VALID']
+        d.columns.pop('STRING')
+        assert list(d.columns.keys())[-1] == 'NEW'
+        d.columnsToDataset()
+    assertSameData(ds.data, ref.data)
+    assert ds.data['400.1'][0] == -1.0
+
+
+def test_arrays_share_band_block():
+    ds = makeDataset()
+    ds.datasetToArrays()
+    assert ds.bandNames == ['400.1', '403.4', '406.7']
+    assert np.array_equal(ds.getWavelengths(), [400.1, 403.4, 406.7])
+    ds.bands[:, 1] = 0.0
+    assert not ds.getArray('403.4').any()
+    ds.arraysToDataset()
+    assert not ds.data['403.4'].any()
+    assert list(ds.data['STRING']) == list(makeDataset().data['STRING'])
+
+
+def test_arrays_are_views():
+    ds = makeDataset()
+    ds.datasetToArrays()
+    # Adjacent float64 wavebands: no copy of the recarray at all
+    assert np.shares_memory(ds.bands, ds.data)
+    assert all(np.shares_memory(ds.getArray(k), ds.data) for k in ds.data.dtype.names)
+    assert np.array_equal(ds.bands, np.column_stack([ds.data[k] for k in ds.bandNames]), equal_nan=True)
+
+    # Wavebands split by another field, or not float64: the band block is built
+    data = np.zeros(4, dtype=[('400.1', np.float64), ('INT_FLAG', np.int64), ('403.4', np.float32)])
+    data['400.1'], data['403.4'] = [1, 2, 3, 4], [5, 6, 7, 8]
+    ds.data = data
+    ds.datasetToArrays()
+    assert ds.bands.tolist() == [[1, 5], [2, 6], [3, 7], [4, 8]]
+    assert np.shares_memory(ds.getArray('INT_FLAG'), ds.data)
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from Source.MainConfig import MainConfig
+from Source.Py6SCache import Py6SCache
+
+
+def test_hit_when_touch_fails(tmp_path, monkeypatch):
+    monkeypatch.setitem(MainConfig.settings, "py6sCacheDir", str(tmp_path / 'cache'))
+    inputs = {'month': 7, 'day': 14, 'solar_z': 35.0, 'solar_a': 120.0, 'view_a': 255.0, 'aot550': 0.1}
+    wvl = np.arange(400, 500, 3.3)
+    res = {k: np.linspace(1, 2, len(wvl)) for k in Py6SCache.OUTPUTS}
+    Py6SCache.save(inputs, wvl, res)
+
+    def utime(*args, **kwargs):
+        raise PermissionError('read-only cache')
+    monkeypatch.setattr(os, 'utime', utime)
+    hits = Py6SCache.hits
+    loaded = Py6SCache.load(inputs, wvl)
+    assert Py6SCache.hits == hits + 1
+    for k in Py6SCache.OUTPUTS:
+        assert np.array_equal(loaded[k], res[k])
+
+
+def test_evict_only_past_limit(tmp_path, monkeypatch):
+    cacheDir = str(tmp_path / 'cache')
+    monkeypatch.setitem(MainConfig.settings, "py6sCacheDir", cacheDir)
+    monkeypatch.setattr(Py6SCache, 'cacheBytes', {})
+    wvl = np.arange(400, 500, 3.3)
+    res = {k: np.linspace(1, 2, len(wvl)) for k in Py6SCache.OUTPUTS}
+    inputs = [{'month': 7, 'day': 14, 'solar_z': float(z), 'solar_a': 120.0, 'view_a': 255.0, 'aot550': 0.1}
+              for z in range(20)]
+    Py6SCache.save(inputs[0], wvl, res)
+    size = os.path.getsize(Py6SCache.filePath(inputs[0], wvl))
+    monkeypatch.setitem(MainConfig.settings, "py6sCacheMaxMB", 10.5*size/1024**2)
+
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path: listed.append(path) or listdir(path))
+    for i, inp in enumerate(inputs[1:10], 1):
+        os.utime(Py6SCache.filePath(inputs[i - 1], wvl), (i, i))
+        Py6SCache.save(inp, wvl, res)
+    # Below the limit: the directory is not listed on save
+    assert listed == []
+    assert Py6SCache.cacheBytes[cacheDir] == 10*size
+
+    # Past it: the least recently used results go, down to 90% of the limit
+    os.utime(Py6SCache.filePath(inputs[9], wvl), (10, 10))
+    Py6SCache.save(inputs[10], wvl, res)
+    assert len(listed) == 1
+    kept = [os.path.isfile(Py6SCache.filePath(inp, wvl)) for inp in inputs[:11]]
+    assert kept == [False, False] + [True]*9
+    assert Py6SCache.cacheBytes[cacheDir] == 9*size
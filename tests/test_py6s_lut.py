@@ -0,0 +1,46 @@
+import numpy as np
+import Py6S
+import pytest
+
+from Source.Py6SCache import Py6SCache
+from Source.Py6SLUT import Py6SLUT
+from Source.ProcessL1b_FRMCal import ProcessL1b_FRMCal
+import Source.WritePy6SLUT as WritePy6SLUT
+
+
+def standIn(inputs, wvl):
+    ''' Beer-Lambert clear sky with the 6S date dependence, for machines without 6S '''
+    w = np.asarray(wvl)/1000
+    mu = np.cos(np.deg2rad(inputs['solar_z']))
+    tau = 0.0088*w**-4.05 + inputs['aot550']*(w/0.55)**-0.7
+    airMass = 1/(mu + 0.15*(93.885 - inputs['solar_z'])**-1.253)
+    e0 = 1800*np.exp(-((w - 0.5)/0.35)**2)*Py6SLUT.earthSunFactor(inputs['month'], inputs['day'])
+    direct = e0*mu*np.exp(-tau*airMass)
+    diffuse = e0*mu*(1 - np.exp(-0.6*tau*airMass))*np.exp(-0.2*tau)
+    return {'percent_direct_solar_irradiance': 100*direct/(direct + diffuse),
+            'percent_diffuse_solar_irradiance': 100*diffuse/(direct + diffuse),
+            'direct_solar_irradiance': direct,
+            'diffuse_solar_irradiance': diffuse,
+            'environmental_irradiance': 0.02*(direct + diffuse)}
+
+
+@pytest.mark.parametrize('run', [
+    standIn,
+    pytest.param(ProcessL1b_FRMCal.runPy6S, id='6S',
+                 marks=pytest.mark.skipif(Py6S.SixS().sixs_path is None, reason='6S executable (sixs) not on PATH'))])
+def test_lut_against_6s(run, tmp_path):
+    # A patch of the default grid at its node spacing, so that the errors are those of the full table
+    fp = str(tmp_path / 'lut.hdf')
+    sza = WritePy6SLUT.SZA[(WritePy6SLUT.SZA >= 30) & (WritePy6SLUT.SZA <= 45)]
+    wavelength = WritePy6SLUT.WAVELENGTH[(WritePy6SLUT.WAVELENGTH >= 400) & (WritePy6SLUT.WAVELENGTH <= 500)]
+    WritePy6SLUT.buildLUT(fp, sza=sza, aot550=WritePy6SLUT.AOT550[1:5], wavelength=wavelength, run=run)
+    worst = WritePy6SLUT.validateLUT(fp, nSamples=10, wavelength=np.arange(401.1, 499, 3.3), run=run)
+    for k in Py6SCache.OUTPUTS:
+        # Relative for the irradiances, percentage points for the percent outputs
+        assert worst[k] < (0.02 if k in Py6SLUT.IRRADIANCES else 1.5), k
+
+
+def test_missing_lut(tmp_path):
+    # A mistyped Py6SLUTFile: no table, so ProcessL1b_FRMCal runs 6S instead
+    assert Py6SLUT.interpolate([3], [20], [40.0], [120.0], [90.0], [0.1], [400.0, 500.0],
+                               fp=str(tmp_path / 'missing.hdf')) is None
@@ -0,0 +1,120 @@
+import collections
+import os
+
+import numpy as np
+import pytest
+
+from Source import PATH_TO_CONFIG, PATH_TO_DATA
+from Source.CalibrationFile import CalibrationFile
+from Source.CalibrationFileReader import CalibrationFileReader
+from Source.HDFGroup import HDFGroup
+from Source.HDFRoot import HDFRoot
+from Source.RawFileReader import RawFileReader, RawReadState
+
+RAW_FILE = os.path.join(PATH_TO_DATA, 'Sample_Data', 'SolarTracker', 'RAW', 'KORUS_KR2016_NASA_20160320_060000.RAW')
+
+
+@pytest.fixture(scope='module')
+def calibrationMap():
+    return CalibrationFileReader.read(os.path.join(PATH_TO_CONFIG, 'sample_SEABIRD_SOLARTRACKER_Calibration'))
+
+
+@pytest.fixture(scope='module')
+def garbled(tmp_path_factory):
+    ''' The sample with random bytes, lower-case and truncated tags spliced in between its frames '''
+    with open(RAW_FILE, 'rb') as f:
+        data = f.read()
+    rng = np.random.default_rng(3)
+    cuts = np.sort(rng.choice(len(data), 200, replace=False))
+    junk = [rng.integers(0, 256, 40, dtype=np.uint8).tobytes(), b'sathse0488', b'SATHS', b'xxSATHL', b'$gprmc']
+    pieces = []
+    for i, (a, b) in enumerate(zip(np.r_[0, cuts], np.r_[cuts, len(data)])):
+        pieces.append(data[a:b])
+        pieces.append(junk[i % len(junk)])
+    fp = tmp_path_factory.mktemp('raw') / 'garbled.raw'
+    fp.write_bytes(b''.join(pieces))
+    return str(fp)
+
+
+def sameValues(a, b):
+    # NaN (e.g. an unreadable ASCII field) equals NaN
+    return len(a) == len(b) and all(x == y or (x != x and y != y) for x, y in zip(a, b))
+
+
+def newGroups(calibrationMap):
+    root = HDFRoot()
+    contextMap = collections.OrderedDict()
+    for cf in calibrationMap.values():
+        gp = HDFGroup()
+        gp.id = cf.instrumentType
+        contextMap[cf.id] = gp
+    return root, contextMap
+
+
+def readRaw(fp, calibrationMap):
+    root, contextMap = newGroups(calibrationMap)
+    RawFileReader.readRawFile(fp, calibrationMap, contextMap, root)
+    return root, contextMap
+
+
+def assertSameGroups(root, contextMap, refRoot, refContextMap):
+    assert root.attributes == refRoot.attributes
+    for key, gp in contextMap.items():
+        ref = refContextMap[key]
+        assert gp.id == ref.id
+        assert gp.attributes == ref.attributes
+        assert list(gp.datasets) == list(ref.datasets)
+        for name, ds in gp.datasets.items():
+            assert list(ds.columns) == list(ref.datasets[name].columns)
+            for k, column in ds.columns.items():
+                assert sameValues(column, ref.datasets[name].columns[k]), (key, name, k)
+
+
+@pytest.mark.parametrize('fp', ['sample', 'garbled'])
+def test_scan_frame_tags(fp, calibrationMap, garbled, monkeypatch):
+    fp = RAW_FILE if fp == 'sample' else garbled
+    with open(fp, 'rb') as f:
+        data = f.read()
+    tags = [b'SATHDR'] + [cf.id.upper().encode('utf-8') for cf in calibrationMap.values()]
+    # Brute force: every (overlapping) start of a tag in the upper-cased file
+    upper = data.upper()
+    expected = set()
+    for tag in tags:
+        i = upper.find(tag)
+        while i >= 0:
+            expected.add(i)
+            i = upper.find(tag, i + 1)
+    # Small chunks, so that tags across chunk boundaries are exercised
+    monkeypatch.setattr(RawFileReader, 'SCAN_CHUNK', 4099)
+    assert RawFileReader.scanFrameTags(data, calibrationMap) == sorted(expected)
+
+
+@pytest.mark.parametrize('fp', ['sample', 'garbled'])
+def test_batched_frames_match_convertRaw(fp, calibrationMap, garbled, monkeypatch):
+    fp = RAW_FILE if fp == 'sample' else garbled
+    root, contextMap = readRaw(fp, calibrationMap)
+    # Every frame through CalibrationFile.convertRaw, as before the batched decoding
+    with monkeypatch.context() as m:
+        m.setattr(CalibrationFile, 'compileFrame', lambda self: False)
+        refRoot, refContextMap = readRaw(fp, calibrationMap)
+
+    assert sum(cf.frameDtype is not None for cf in calibrationMap.values()) > 0
+    assertSameGroups(root, contextMap, refRoot, refContextMap)
+
+
+@pytest.mark.parametrize('nChunks', [10, 300, 2000])
+def test_chunked_replay_matches_one_shot(nChunks, calibrationMap):
+    # The file as RawFileStream sees it while it is being logged: a growing prefix per poll
+    with open(RAW_FILE, 'rb') as f:
+        data = f.read()
+    rng = np.random.default_rng(nChunks)
+    cuts = np.sort(rng.choice(np.arange(1, len(data)), nChunks - 1, replace=False))
+    root, contextMap = newGroups(calibrationMap)
+    state = RawReadState(calibrationMap)
+    for cut in cuts:
+        RawFileReader.readFrames(data[:cut], state, calibrationMap, contextMap, root)
+    RawFileReader.readFrames(data, state, calibrationMap, contextMap, root, final=True)
+
+    refRoot, refContextMap = readRaw(RAW_FILE, calibrationMap)
+    assert any(gp.datasets for gp in refContextMap.values())
+    assertSameGroups(root, contextMap, refRoot, refContextMap)
@@ -0,0 +1,35 @@
+import collections
+
+import pytest
+
+import Source.ReprocessCache as ReprocessCacheModule
+from Source.ConfigFile import ConfigFile
+from Source.ReprocessCache import ReprocessCache
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(ReprocessCacheModule, 'PATH_TO_CONFIG', str(tmp_path))
+    monkeypatch.setattr(ConfigFile, 'filename', 'test.cfg')
+    monkeypatch.setattr(ConfigFile, 'settings', collections.OrderedDict(
+        SensorType='SeaBird', bL1bCal=1, FidRadDB=0, bL2Stations=0, seaBASSHeaderFileName='test.hdr'))
+    monkeypatch.setattr(ConfigFile, 'products', collections.OrderedDict())
+    (tmp_path / 'test.hdr').write_text('cruise=A\n')
+    inFile = tmp_path / 'in.hdf'
+    inFile.write_bytes(b'input')
+    return tmp_path, str(inFile)
+
+
+def test_fidraddb_in_l1b_key(config):
+    _, inFile = config
+    key = ReprocessCache.levelKey(inFile, 'L1B')
+    ConfigFile.settings['FidRadDB'] = 1
+    assert ReprocessCache.levelKey(inFile, 'L1B') != key
+
+
+def test_seabass_header_contents_in_l2_key(config):
+    tmp_path, inFile = config
+    key = ReprocessCache.levelKey(inFile, 'L2')
+    assert ReprocessCache.levelKey(inFile, 'L2') == key
+    (tmp_path / 'test.hdr').write_text('cruise=Bravo\n')
+    assert ReprocessCache.levelKey(inFile, 'L2') != key
@@ -0,0 +1,41 @@
+import numpy as np
+import scipy.interpolate
+
+from Source.Utilities import Utilities
+
+
+def test_linear_matches_numpy_interp():
+    rng = np.random.default_rng(0)
+    waves = np.sort(rng.uniform(300, 1000, 180))
+    newWaves = np.arange(305, 995, 1.0)
+    y = rng.normal(size=(20, len(waves)))
+    expected = np.array([np.interp(newWaves, waves, row) for row in y])
+    np.testing.assert_allclose(Utilities.resampleSpectra(y, waves, newWaves, 'linear'), expected, rtol=1e-12, atol=1e-12)
+
+
+def test_linear_nan_stays_local():
+    rng = np.random.default_rng(1)
+    waves = np.sort(rng.uniform(300, 1000, 180))
+    # Include new bands on the instrument bands
+    newWaves = np.sort(np.concatenate([np.arange(305, 995, 1.0), waves[40:45]]))
+    y = rng.normal(size=(20, len(waves)))
+    y[3, 41] = np.nan
+    y[7, [0, 100, 179]] = np.nan
+    newY = Utilities.resampleSpectra(y, waves, newWaves, 'linear')
+    expected = np.array([np.interp(newWaves, waves, row) for row in y])
+    np.testing.assert_array_equal(np.isnan(newY), np.isnan(expected))
+    np.testing.assert_allclose(newY, expected, rtol=1e-12, atol=1e-12)
+    # Only the new bands next to the NaN band are lost
+    assert 0 < np.isnan(newY[3]).sum() < 10
+    assert not np.isnan(np.delete(newY, [3, 7], axis=0)).any()
+    # Single spectrum
+    np.testing.assert_array_equal(Utilities.resampleSpectra(y[3], waves, newWaves, 'linear'), newY[3])
+
+
+def test_spline_matches_univariate_spline():
+    rng = np.random.default_rng(2)
+    waves = np.sort(rng.uniform(300, 1000, 60))
+    newWaves = np.arange(310, 990, 2.5)
+    y = rng.normal(size=(5, len(waves)))
+    expected = np.array([scipy.interpolate.InterpolatedUnivariateSpline(waves, row, k=3)(newWaves) for row in y])
+    np.testing.assert_allclose(Utilities.resampleSpectra(y, waves, newWaves), expected, rtol=1e-9, atol=1e-9)
@@ -0,0 +1,44 @@
+import datetime
+
+import numpy as np
+
+from Source.SolarPosition import SolarPosition
+
+
+def grid():
+    ''' Latitudes -75 to 75 deg at every longitude band and time of day, 1990-2040 '''
+    lats = np.arange(-75, 75.1, 12.5)
+    start = datetime.datetime(1990, 1, 1, tzinfo=datetime.timezone.utc)
+    # 37 days and 5 h 17 min apart: every season and time of day over the years
+    times = [start + i*datetime.timedelta(days=37, hours=5, minutes=17) for i in range(500)]
+    lat, time = np.meshgrid(lats, np.arange(len(times)), indexing='ij')
+    lat = lat.ravel()
+    datetimes = [times[i] for i in time.ravel()]
+    lon = np.resize(np.arange(-180, 180, 23.0), lat.size)
+    return lat, lon, datetimes
+
+
+def test_numpy_matches_pysolar():
+    lat, lon, datetimes = grid()
+    azimuth, zenith = SolarPosition.solarPosition(lat, lon, datetimes, backend='numpy')
+    refAzimuth, refZenith = SolarPosition.solarPosition(lat, lon, datetimes, backend='pysolar')
+
+    up = refZenith < 89.5
+    assert up.sum() > 1000
+    # SZA within 0.03 deg
+    assert np.abs(zenith - refZenith)[up].max() < 0.03
+    # Azimuth within 0.1 deg away from the zenith, where it is ill-defined
+    dAzimuth = np.abs((azimuth - refAzimuth + 180) % 360 - 180)
+    assert dAzimuth[up & (refZenith > 10)].max() < 0.1
+    # Sun within 0.03 deg on the sky
+    z, rz, a, ra = np.deg2rad([zenith, refZenith, azimuth, refAzimuth])
+    cosSeparation = np.cos(z)*np.cos(rz) + np.sin(z)*np.sin(rz)*np.cos(a - ra)
+    assert np.rad2deg(np.arccos(np.clip(cosSeparation, -1, 1)))[up].max() < 0.03
+
+
+def test_datetime64_input():
+    lat, lon, datetimes = grid()
+    datetime64 = np.array([np.datetime64(t.replace(tzinfo=None), 'us') for t in datetimes])
+    for expected, result in zip(SolarPosition.solarPosition(lat, lon, datetimes, backend='numpy'),
+                                SolarPosition.solarPosition(lat, lon, datetime64, backend='numpy')):
+        np.testing.assert_array_equal(result, expected)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from Source.Utilities import Utilities, TimeInterpolator
+
+
+def test_linear_matches_interp_with_nans():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n = rng.integers(2, 40)
+        x = np.sort(rng.choice(np.arange(1000.), n, replace=False))
+        y = rng.normal(size=n)
+        y[rng.random(n) < 0.2] = np.nan
+        # Include new times on record times
+        newX = np.sort(np.concatenate([rng.uniform(x[0] - 50, x[-1] + 50, rng.integers(1, 50)), rng.choice(x, 3)]))
+        expected = Utilities.interp(list(x), list(y), list(newX), fill_value=np.nan)
+        np.testing.assert_array_equal(TimeInterpolator(x, newX).linear(y), expected)
+
+
+def test_linear_block_matches_columns():
+    rng = np.random.default_rng(1)
+    x = np.cumsum(rng.uniform(0.5, 2, 50))
+    newX = rng.uniform(x[0] - 5, x[-1] + 5, 80)
+    newX.sort()
+    y = rng.normal(size=(50, 7))
+    newY = TimeInterpolator(x, newX).linear(y)
+    for j in range(y.shape[1]):
+        np.testing.assert_array_equal(newY[:, j], Utilities.interp(list(x), list(y[:, j]), list(newX), fill_value=np.nan))
+
+
+def test_linear_exact_time_next_to_nan():
+    # A new time on x[1] takes y[1], although y[2] is NaN
+    assert TimeInterpolator([0, 1, 2, 3], [1.0]).linear([0.5, 0.1411, np.nan, 3])[0] == 0.1411
+
+
+def test_unsorted_timer():
+    timer = np.array([3, 0, 2, 1.])
+    y = np.array([45, 15, 35, 25.])
+    interpolator = TimeInterpolator(timer, [0, 0.5, 1, 2, 2.5, 3])
+    np.testing.assert_allclose(interpolator.linear(y), [15, 20, 25, 35, 40, 45])
+    np.testing.assert_allclose(interpolator.angular(y), [15, 20, 25, 35, 40, 45])
+
+
+def test_angular_through_north():
+    newY = TimeInterpolator([0, 1, 2], [0.5, 1.5]).angular([358, 2, 6])
+    np.testing.assert_allclose(newY, [0, 4], atol=1e-9)